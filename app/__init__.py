@@ -9,201 +9,148 @@ import logging
 
 db = SQLAlchemy()
 
+
+def start_background_workers(app):
+    """Start per-process background threads. Called by create_app, or post-fork under gunicorn preload."""
+    # Web Source Auto-Refresh - delayed start to not block app startup
+    try:
+        from app.services.web_source_refresher import WebSourceRefresher
+        
+        def delayed_worker_start():
+            time.sleep(10)  # Wait 10 seconds for app to fully start
+            try:
+                WebSourceRefresher.start_worker(app)
+                print("🚀 Web Source Auto-Refresher started.")
+                logging.info("Web Source Auto-Refresher started.")
+            except Exception as e:
+                print(f"❌ Failed to start WebSourceRefresher: {e}")
+                logging.error(f"❌ Failed to start WebSourceRefresher: {e}")
+        
+        # Start in background thread
+        worker_thread = threading.Thread(target=delayed_worker_start, daemon=True)
+        worker_thread.start()
+        print("⏰ Web Source Auto-Refresher scheduled to start in 10 seconds...")
+        logging.info("Web Source Auto-Refresher scheduled to start in 10 seconds...")
+        
+    except Exception as e:
+        print(f"❌ Failed to schedule WebSourceRefresher: {e}")
+        logging.error(f"❌ Failed to schedule WebSourceRefresher: {e}")
+
+    # Follow index changes made by other workers (uploads, deletes, web refreshes)
+    if app.config.get('INDEX_SYNC_ENABLED', True):
+        try:
+            from app.services.index_sync import IndexChangeFeed
+            IndexChangeFeed.start_worker(app)
+            logging.info("Index change feed started")
+        except Exception as e:
+            logging.error(f"❌ Failed to start IndexChangeFeed: {e}")
+
+    # Periodic index/DB drift repair (missing chunks embedded, orphans dropped)
+    if app.config.get('RECONCILE_INTERVAL_MINUTES', 0) > 0:
+        try:
+            from app.services.index_reconciler import IndexReconciler
+            IndexReconciler.start_worker(app)
+            logging.info(f"Index reconciler scheduled every {app.config['RECONCILE_INTERVAL_MINUTES']} minutes")
+        except Exception as e:
+            logging.error(f"❌ Failed to start IndexReconciler: {e}")
+
+    # Chat history writes leave the request path (flushed on exit)
+    if app.config.get('CHAT_WRITE_BEHIND', False):
+        try:
+            from app.services.chat_persistence import ChatWriteBehind
+            ChatWriteBehind.start(app)
+            logging.info("Chat write-behind writer started")
+        except Exception as e:
+            logging.error(f"❌ Failed to start ChatWriteBehind: {e}")
+
+
+def _freeze_heap():
+    """Move everything allocated so far into the GC's permanent generation so collections
+    in forked workers don't touch (and un-share) the inherited index metadata pages."""
+    import gc
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+
+
+def after_fork(app):
+    """Re-initialize per-process state in a freshly forked gunicorn worker."""
+    with app.app_context():
+        # Never share the master's pooled DB sockets with children
+        db.engine.dispose(close=False)
+    start_background_workers(app)
+
+
 def create_app(config_class=Config):
-    app = Flask(__name__)
-    app.config.from_object(config_class)
+    from app.services.startup_profile import StartupProfile
     
-    CORS(app)
-    db.init_app(app)
+    with StartupProfile.phase('flask_init'):
+        app = Flask(__name__)
+        app.config.from_object(config_class)
+        
+        CORS(app)
+        db.init_app(app)
+        from app.services import tracing
+        tracing.init_app(app)
     
     with app.app_context():
-        from app import routes, models
-        db.create_all()
+        with StartupProfile.phase('import_routes_models'):
+            from app import routes, models
         from app.models import User
         from werkzeug.security import generate_password_hash
         from config import Config
 
-        # Robust Database Migrations and Indexing
-        try:
-            from sqlalchemy import text
-            eng = db.session.get_bind()
-            dialect = eng.dialect.name
-            
-            # 1. Performance Indexes (CRITICAL)
-            if 'postgresql' in dialect:
-                print("🚀 Ensuring database indexes for high performance...")
-                try:
-                    # Index for fast retrieval from document chunks
-                    db.session.execute(text("CREATE INDEX IF NOT EXISTS idx_document_chunks_document_id ON public.document_chunks (document_id)"))
-                    db.session.execute(text("CREATE INDEX IF NOT EXISTS idx_document_chunks_comp_search ON public.document_chunks (document_id, chunk_index)"))
-                    
-                    # Indexes for user chat history and session management
-                    db.session.execute(text("CREATE INDEX IF NOT EXISTS idx_chat_messages_user_id ON public.chat_messages (user_id)"))
-                    db.session.execute(text("CREATE INDEX IF NOT EXISTS idx_chat_messages_created_at ON public.chat_messages (created_at DESC)"))
-                    db.session.execute(text("CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_id ON public.chat_sessions (user_id)"))
-                    
-                    # Indexes for filtered document lookups
-                    db.session.execute(text("CREATE INDEX IF NOT EXISTS idx_documents_filters ON public.documents (course, semester, subject)"))
-                    db.session.execute(text("CREATE INDEX IF NOT EXISTS idx_documents_uploaded_by ON public.documents (uploaded_by)"))
-                    
-                    db.session.commit()
-                    print("✅ Performance indexes verified")
-                except Exception as ex:
-                    db.session.rollback()
-                    print(f"⚠️ Indexing warning: {ex}")
+        # Versioned migrations: one ledger read on a warm DB; create_all only when the ledger is missing or empty
+        with StartupProfile.phase('migrations'):
+            try:
+                from app.migrations import run_migrations
+                run_migrations()
+            except Exception as e:
+                db.session.rollback()
+                print(f"⚠️ Startup maintenance warning: {e}")
+                logging.warning(f"Startup maintenance warning: {e}")
 
-            # 2. Schema Migrations (Conditional to avoid locks)
-            if 'sqlite' in dialect:
-                # SQLite fallback
-                res = db.session.execute(text("PRAGMA table_info(users)")).fetchall()
-                cols = [r[1] for r in res]
-                if 'pref_course' not in cols:
-                    db.session.execute(text("ALTER TABLE users ADD COLUMN pref_course TEXT"))
-                    db.session.execute(text("ALTER TABLE users ADD COLUMN pref_semester TEXT"))
-                    db.session.execute(text("ALTER TABLE users ADD COLUMN pref_subject TEXT"))
-                
-                res = db.session.execute(text("PRAGMA table_info(documents)")).fetchall()
-                if 'doc_type' not in [r[1] for r in res]:
-                    db.session.execute(text("ALTER TABLE documents ADD COLUMN doc_type TEXT DEFAULT 'syllabus'"))
+        with StartupProfile.phase('admin_user'):
+            admin = User.query.filter_by(email=Config.ADMIN_EMAIL).first()
+            if not admin:
+                db.session.add(User(email=Config.ADMIN_EMAIL, password_hash=generate_password_hash(Config.ADMIN_PASSWORD), role='admin'))
                 db.session.commit()
-            elif 'postgresql' in dialect:
-                print("🔄 Verifying PostgreSQL schema...")
-                # Check for column existence first to avoid expensive/blocking ALTER TABLE locks
-                check_sql = text("""
-                    SELECT column_name FROM information_schema.columns 
-                    WHERE table_schema = 'public' AND table_name = 'users' 
-                    AND column_name IN ('pref_course', 'pref_semester', 'pref_subject')
-                """)
-                existing_users_cols = [r[0] for r in db.session.execute(check_sql).fetchall()]
-                
-                # Only run ALTER if columns are missing
-                if len(existing_users_cols) < 3:
-                    print("🛠 Adding missing user preference columns...")
-                    db.session.execute(text("SET LOCAL statement_timeout = 60000")) # 60s timeout for migration
-                    if 'pref_course' not in existing_users_cols:
-                        db.session.execute(text("ALTER TABLE public.users ADD COLUMN IF NOT EXISTS pref_course VARCHAR(100)"))
-                    if 'pref_semester' not in existing_users_cols:
-                        db.session.execute(text("ALTER TABLE public.users ADD COLUMN IF NOT EXISTS pref_semester VARCHAR(20)"))
-                    if 'pref_subject' not in existing_users_cols:
-                        db.session.execute(text("ALTER TABLE public.users ADD COLUMN IF NOT EXISTS pref_subject VARCHAR(100)"))
-                    db.session.commit()
-                
-                # Check for doc_type
-                check_doc_sql = text("""
-                    SELECT 1 FROM information_schema.columns 
-                    WHERE table_schema = 'public' AND table_name = 'documents' AND column_name = 'doc_type'
-                """)
-                if not db.session.execute(check_doc_sql).first():
-                    print("🛠 Adding missing doc_type column...")
-                    db.session.execute(text("ALTER TABLE public.documents ADD COLUMN IF NOT EXISTS doc_type VARCHAR(50) DEFAULT 'syllabus'"))
-                    db.session.commit()
-
-                # Check for parent_id in filter_options
-                check_filter_sql = text("""
-                    SELECT 1 FROM information_schema.columns 
-                    WHERE table_schema = 'public' AND table_name = 'filter_options' AND column_name = 'parent_id'
-                """)
-                if not db.session.execute(check_filter_sql).first():
-                    print("🛠 Adding missing parent_id column...")
-                    db.session.execute(text("ALTER TABLE public.filter_options ADD COLUMN IF NOT EXISTS parent_id INTEGER REFERENCES public.filter_options(id)"))
-                    db.session.commit()
-                
-                print("✅ Schema verification complete")
-
-        except Exception as e:
-            db.session.rollback()
-            print(f"⚠️ Startup maintenance warning: {e}")
-            logging.warning(f"Startup maintenance warning: {e}")
-
-        admin = User.query.filter_by(email=Config.ADMIN_EMAIL).first()
-        if not admin:
-            db.session.add(User(email=Config.ADMIN_EMAIL, password_hash=generate_password_hash(Config.ADMIN_PASSWORD), role='admin'))
-            db.session.commit()
         
         # Register Blueprints
         print("🔄 Registering blueprints...")
-        app.register_blueprint(routes.bp)
+        with StartupProfile.phase('register_blueprints'):
+            app.register_blueprint(routes.bp)
         print("✅ Blueprints registered")
         
-        # Automatic index rebuild on startup with persistent storage
+        # Vector index warm-up runs in the background so /health/live answers immediately;
+        # /health/ready and /api/query report progress until it finishes.
         print("🔄 Initializing vector store...")
-        from app.services.vector_store import VectorStore
-        from app.models import DocumentChunk
-        from app.services.ai_service import AIService
-        from app.routes import sync_storage
-        from app.services.index_rebuilder import rebuild_index_from_db  # Import the new rebuilder
-        
-        # Initialize vector store with Supabase persistent storage
-        print("🔄 Getting vector store instance...")
-        vector_store = VectorStore.get_instance()  # Use singleton instance
-        print("✅ Vector store instance ready")
-        index_name = 'vector_index'
+        with StartupProfile.phase('vector_store_init'):
+            from app.services.vector_store import VectorStore
+            from app.services.index_warmup import IndexWarmup
+            
+            vector_store = VectorStore.get_instance()  # Use singleton instance
+            current_stats = vector_store.get_stats()
+            print(f"📊 Current stats: {current_stats}")
+            if current_stats['total_vectors'] == 0 and app.config.get('AUTO_REBUILD_INDEX', True):
+                # Rebuild index from database (this handles Render's ephemeral filesystem)
+                print("🔄 Starting background vector index warm-up from database...")
+                logging.info("Starting background vector index warm-up from database...")
+                IndexWarmup.start(app)
+            else:
+                IndexWarmup.mark_ready()
+                print(f"✅ Vector store has {current_stats['total_vectors']} vectors, skipping rebuild")
+                logging.info(f"Vector store has {current_stats['total_vectors']} vectors, skipping rebuild")
         
-        # Check if we need to rebuild (only if index is empty)
-        print("🔄 Checking vector store stats...")
-        current_stats = vector_store.get_stats()
-        print(f"📊 Current stats: {current_stats}")
-        if current_stats['total_vectors'] == 0:
-            # Rebuild index from database on startup (this handles Render's ephemeral filesystem)
-            print("🔄 Starting vector index rebuild from database...")
-            logging.info("🔄 Starting vector index rebuild from database...")
-            try:
-                # First try to load existing index from Supabase storage
-                from app.services.vector_store import VectorStore
-                vector_store = VectorStore.get_instance()
-                # Skip loading from Supabase since we're rebuilding in-memory on each startup for Render compatibility
-                print("🔄 Rebuilding vector index from database for Render compatibility...")
-                logging.info("Rebuilding vector index from database for Render compatibility...")
-                print("🔄 Calling rebuild_index_from_db...")
-                rebuild_index_from_db()
-                print("✅ rebuild_index_from_db completed")
-                
-                # Final validation
-                final_stats = vector_store.get_stats()
-                print(f"📊 Final vector store stats: {final_stats}")
-                logging.info(f"📊 Final vector store stats: {final_stats}")
-                
-                # Log for debugging purposes
-                if final_stats['total_vectors'] == 0:
-                    print("❌ CRITICAL: Vector store has 0 vectors after rebuild - chat will not work!")
-                    logging.critical("CRITICAL: Vector store has 0 vectors after rebuild - chat will not work!")
-                else:
-                    print(f"✅ Vector store is ready with {final_stats['total_vectors']} vectors")
-                    logging.info(f"✅ Vector store is ready with {final_stats['total_vectors']} vectors")
-                    
-            except Exception as e:
-                print(f"❌ Vector index rebuild failed: {e}")
-                logging.error(f"❌ Vector index rebuild failed: {e}", exc_info=True)
-                # Continue anyway - the vector store will be empty but the app should still start
+        # Under gunicorn --preload the index is built here, in the master, and workers
+        # inherit it copy-on-write; threads don't survive fork, so post_fork starts them.
+        if app.config.get('PRELOAD_APP'):
+            with StartupProfile.phase('preload_index'):
+                IndexWarmup.join()
+                _freeze_heap()
         else:
-            print(f"✅ Vector store already has {current_stats['total_vectors']} vectors, skipping rebuild")
-            logging.info(f"✅ Vector store already has {current_stats['total_vectors']} vectors, skipping rebuild")
-        
-        # Start background workers (Web Source Auto-Refresh) - delayed start to not block app startup
-        try:
-            from app.services.web_source_refresher import WebSourceRefresher
-            # Start with longer initial delay to let main app initialize
-            import threading
-            import time
-            
-            def delayed_worker_start():
-                time.sleep(10)  # Wait 10 seconds for app to fully start
-                try:
-                    WebSourceRefresher.start_worker(app)
-                    print("🚀 Web Source Auto-Refresher started.")
-                    logging.info("Web Source Auto-Refresher started.")
-                except Exception as e:
-                    print(f"❌ Failed to start WebSourceRefresher: {e}")
-                    logging.error(f"❌ Failed to start WebSourceRefresher: {e}")
-            
-            # Start in background thread
-            worker_thread = threading.Thread(target=delayed_worker_start, daemon=True)
-            worker_thread.start()
-            print("⏰ Web Source Auto-Refresher scheduled to start in 10 seconds...")
-            logging.info("Web Source Auto-Refresher scheduled to start in 10 seconds...")
-            
-        except Exception as e:
-            print(f"❌ Failed to schedule WebSourceRefresher: {e}")
-            logging.error(f"❌ Failed to schedule WebSourceRefresher: {e}")
+            start_background_workers(app)
 
+    if app.config.get('STARTUP_PROFILE', True):
+        StartupProfile.emit()
     return app
\ No newline at end of file
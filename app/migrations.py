@@ -0,0 +1,138 @@
+"""
+Versioned schema migrations tracked in the schema_migrations ledger.
+
+Boot reads a single MAX(version) row and only runs steps newer than it, so a
+warm database costs one query instead of a round of information_schema probes.
+Only when the ledger is missing or empty does migration 0 run db.create_all(),
+which creates the full schema (ledger included) for fresh installs and fills in
+any table an older install lacks. New tables therefore need their own step.
+Append new steps to MIGRATIONS with the next version number; never renumber or
+edit a step that has shipped. Every step must be safe on a database whose schema
+already matches.
+"""
+import logging
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from app import db
+from app.models import IndexChange, SchemaMigration
+
+# Arbitrary app-wide key so concurrent workers don't run the same steps twice
+_PG_LOCK_KEY = 4_815_162_342
+
+
+def _sqlite_add_column(table, column, ddl):
+    cols = [r[1] for r in db.session.execute(text(f"PRAGMA table_info({table})")).fetchall()]
+    if column not in cols:
+        db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {ddl}"))
+
+
+def _m0_base_schema(dialect):
+    # Runs in the migration's transaction (and under its advisory lock); existing tables are left alone
+    db.Model.metadata.create_all(bind=db.session.connection())
+
+
+def _m1_user_preferences(dialect):
+    if dialect == 'sqlite':
+        _sqlite_add_column('users', 'pref_course', 'pref_course TEXT')
+        _sqlite_add_column('users', 'pref_semester', 'pref_semester TEXT')
+        _sqlite_add_column('users', 'pref_subject', 'pref_subject TEXT')
+    else:
+        db.session.execute(text("SET LOCAL statement_timeout = 60000"))  # 60s timeout for migration
+        db.session.execute(text("ALTER TABLE public.users ADD COLUMN IF NOT EXISTS pref_course VARCHAR(100)"))
+        db.session.execute(text("ALTER TABLE public.users ADD COLUMN IF NOT EXISTS pref_semester VARCHAR(20)"))
+        db.session.execute(text("ALTER TABLE public.users ADD COLUMN IF NOT EXISTS pref_subject VARCHAR(100)"))
+
+
+def _m2_document_type(dialect):
+    if dialect == 'sqlite':
+        _sqlite_add_column('documents', 'doc_type', "doc_type TEXT DEFAULT 'syllabus'")
+    else:
+        db.session.execute(text("ALTER TABLE public.documents ADD COLUMN IF NOT EXISTS doc_type VARCHAR(50) DEFAULT 'syllabus'"))
+
+
+def _m3_filter_option_parent(dialect):
+    if dialect == 'sqlite':
+        _sqlite_add_column('filter_options', 'parent_id', 'parent_id INTEGER REFERENCES filter_options(id)')
+    else:
+        db.session.execute(text("ALTER TABLE public.filter_options ADD COLUMN IF NOT EXISTS parent_id INTEGER REFERENCES public.filter_options(id)"))
+
+
+def _m4_performance_indexes(dialect):
+    if dialect != 'postgresql':
+        return
+    # Index for fast retrieval from document chunks
+    db.session.execute(text("CREATE INDEX IF NOT EXISTS idx_document_chunks_document_id ON public.document_chunks (document_id)"))
+    db.session.execute(text("CREATE INDEX IF NOT EXISTS idx_document_chunks_comp_search ON public.document_chunks (document_id, chunk_index)"))
+    # Indexes for user chat history and session management
+    db.session.execute(text("CREATE INDEX IF NOT EXISTS idx_chat_messages_user_id ON public.chat_messages (user_id)"))
+    db.session.execute(text("CREATE INDEX IF NOT EXISTS idx_chat_messages_created_at ON public.chat_messages (created_at DESC)"))
+    db.session.execute(text("CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_id ON public.chat_sessions (user_id)"))
+    # Indexes for filtered document lookups
+    db.session.execute(text("CREATE INDEX IF NOT EXISTS idx_documents_filters ON public.documents (course, semester, subject)"))
+    db.session.execute(text("CREATE INDEX IF NOT EXISTS idx_documents_uploaded_by ON public.documents (uploaded_by)"))
+
+
+def _m5_index_change_log(dialect):
+    IndexChange.__table__.create(bind=db.session.connection(), checkfirst=True)
+
+
+# (version, name, step) in application order
+MIGRATIONS = [
+    (0, 'base_schema', _m0_base_schema),
+    (1, 'user_preferences', _m1_user_preferences),
+    (2, 'document_type', _m2_document_type),
+    (3, 'filter_option_parent', _m3_filter_option_parent),
+    (4, 'performance_indexes', _m4_performance_indexes),
+    (5, 'index_change_log', _m5_index_change_log),
+]
+
+
+def current_version():
+    """Highest applied version; -1 when the ledger is empty or does not exist yet."""
+    try:
+        version = db.session.query(db.func.max(SchemaMigration.version)).scalar()
+    except (OperationalError, ProgrammingError):
+        db.session.rollback()
+        return -1
+    return -1 if version is None else version
+
+
+def run_migrations():
+    """Apply pending migrations. Returns the list of versions applied on this call."""
+    latest = MIGRATIONS[-1][0]
+    done = current_version()
+    db.session.rollback()  # Release the read transaction
+    if done >= latest:
+        return []
+
+    dialect = db.session.get_bind().dialect.name
+    applied = []
+    for version, name, step in MIGRATIONS:
+        if version <= done:
+            continue
+        try:
+            if dialect == 'postgresql':
+                # Transaction-scoped lock: serializes booting workers, released on commit/rollback
+                db.session.execute(text("SELECT pg_advisory_xact_lock(:k)"), {'k': _PG_LOCK_KEY})
+            if version == 0:
+                # The ledger itself may not exist yet (cold path only: one catalog probe)
+                ledger = inspect(db.session.connection()).has_table(
+                    SchemaMigration.__tablename__, schema=SchemaMigration.__table__.schema)
+                already = ledger and db.session.get(SchemaMigration, 0) is not None
+            else:
+                already = db.session.get(SchemaMigration, version) is not None
+            if already:
+                db.session.rollback()
+                continue  # Another worker applied it while we waited
+            print(f"🛠 Applying migration {version}: {name}")
+            step(dialect)
+            db.session.add(SchemaMigration(version=version, name=name))
+            db.session.commit()
+            applied.append(version)
+        except Exception:
+            db.session.rollback()
+            logging.error(f"Migration {version} ({name}) failed", exc_info=True)
+            raise
+    if applied:
+        print(f"✅ Schema migrated to version {applied[-1]}")
+    return applied
@@ -171,3 +171,25 @@ class FilterOption(db.Model):
             'value': self.value,
             'parent_id': self.parent_id
         }
+
+
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+    __table_args__ = {'schema': 'public'}
+
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(128), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class IndexChange(db.Model):
+    """Append-only log of vector index deltas; every worker tails it to keep its in-memory index current."""
+    __tablename__ = 'index_change_log'
+    __table_args__ = {'schema': 'public'}
+
+    seq = db.Column(db.Integer, primary_key=True)
+    op = db.Column(db.String(16), nullable=False)  # 'add', 'remove', 'remove_doc'
+    doc_id = db.Column(db.Integer, nullable=True)
+    chunk_ids = db.Column(db.JSON, nullable=True)
+    origin = db.Column(db.String(64), nullable=True)  # host:pid of the writer, which already applied it
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
@@ -6,6 +6,10 @@ from app.services.vector_store import VectorStore
 from app.services.ai_service import AIService
 from app.services.supabase_service import SupabaseService
 from app.services.web_scraper import WebScraper
+from app.services.index_sync import IndexChangeFeed
+from app.services import tracing
+from app.services.single_flight import SingleFlight
+from app.services.admission import AdmissionController, AdmissionRejected
 from werkzeug.utils import secure_filename
 from werkzeug.security import check_password_hash, generate_password_hash
 import os
@@ -16,6 +20,11 @@ import time
 from config import Config
 from sqlalchemy.exc import ProgrammingError
 _GENERAL_INDEX_CACHE = {}
+# Concurrent identical /api/query work is done once per worker and shared
+_QUESTION_EMBED_FLIGHT = SingleFlight('question_embedding', wait_timeout=Config.QUERY_COALESCE_WAIT_SECONDS,
+                                      enabled=Config.QUERY_COALESCING)
+_STUDIES_ANSWER_FLIGHT = SingleFlight('studies_answer', wait_timeout=Config.QUERY_COALESCE_WAIT_SECONDS,
+                                      enabled=Config.QUERY_COALESCING)
 
 bp = Blueprint('main', __name__)
 
@@ -46,6 +55,18 @@ def admin_required(f):
         return f(*args, **kwargs)
     return wrapped
 
+def _admission_rejected_body(e):
+    """429 body for a generation call shed by AdmissionController (Retry-After is set from retry_after)."""
+    logging.warning(f"Query rejected ({e.reason}) for user {session.get('user_id')}; retry after {e.retry_after}s")
+    message = ('You already have questions being answered. Please wait for them to finish.'
+               if e.reason == 'user_limit' else 'The assistant is busy right now. Please try again shortly.')
+    return {'error': message, 'reason': e.reason, 'retry_after': e.retry_after}
+
+def _admission_rejected(body):
+    resp = jsonify(body)
+    resp.headers['Retry-After'] = str(body['retry_after'])
+    return resp, 429
+
 # --- Routes ---
 
 @bp.route('/')
@@ -227,6 +248,8 @@ def upload_document():
                 return jsonify({'error': 'Course, semester, and subject are required for syllabus documents'}), 400
         
         file_bytes = file.read()
+        if len(file_bytes) > current_app.config['MAX_FILE_SIZE']:
+            return jsonify({'error': 'File too large'}), 413
         try:
             # Upload to Supabase Storage
             try:
@@ -278,6 +301,41 @@ def upload_document():
     return jsonify({'error': 'File type not allowed'}), 400
 
 
+@bp.route('/api/admin/upload-batch', methods=['POST'])
+@admin_required
+def upload_batch():
+    """Upload many files (or zip archives) in one request; returns per-file status."""
+    files = [f for f in request.files.getlist('files') if f and f.filename]
+    if not files:
+        return jsonify({'error': 'No files provided'}), 400
+    
+    course = request.form.get('course')
+    semester = request.form.get('semester')
+    subject = request.form.get('subject')
+    doc_type = request.form.get('doc_type', 'syllabus')
+    if doc_type == 'syllabus' and (not course or not semester or not subject):
+        return jsonify({'error': 'Course, semester, and subject are required for syllabus documents'}), 400
+    
+    try:
+        from app.services.ingestion import BatchIngestor
+        ingestor = BatchIngestor(
+            current_app._get_current_object(), session['user_id'],
+            course=course, semester=semester, subject=subject, doc_type=doc_type
+        )
+        started = time.time()
+        results = ingestor.run([(f.filename, f.read(), f.mimetype) for f in files])
+        processed = sum(1 for r in results if r.get('status') == 'processed')
+        logging.info(f"Batch upload: {processed}/{len(results)} files processed in {time.time() - started:.1f}s")
+        return jsonify({
+            'message': f'{processed} of {len(results)} files processed.',
+            'results': results
+        })
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Batch upload failed: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+
 @bp.route('/api/admin/add-website', methods=['POST'])
 @admin_required
 def add_website():
@@ -330,56 +388,61 @@ def add_website():
         from app.services.vector_store import VectorStore
         vector_store = VectorStore.get_instance()
         
-        chunks_to_add = []
-        
         # Pre-process chunks
         all_chunk_texts = []
         all_chunk_metas = []
         
+        page_chunks = []
         for page_url, raw_text in pages:
             # Sanitize text to remove NUL characters before processing
             text = DocumentProcessor._sanitize_text(raw_text)
             
             # Chunking
-            chunks = DocumentProcessor.chunk_text(text)
-            for i, chunk_text in enumerate(chunks):
-                # Prepend source URL for citation
-                final_text = f"[Source: {page_url}]\n{chunk_text}"
-                
-                chunk_obj = DocumentChunk(
-                    document_id=new_doc.id,
-                    chunk_text=final_text,
-                    chunk_index=total_chunks
-                )
-                db.session.add(chunk_obj)
-                chunks_to_add.append(chunk_obj)
-                
-                all_chunk_texts.append(final_text)
-                all_chunk_metas.append({
-                    'text': final_text,
-                    'doc_id': new_doc.id,
-                    'chunk_id': None, # We don't have ID yet
-                    'url': page_url
-                })
-                
-                total_chunks += 1
+            for chunk_text in DocumentProcessor.chunk_text(text):
+                page_chunks.append((page_url, chunk_text))
+        
+        # Drop repeated menus/footers/tickers before they are embedded and stored
+        from app.services.near_duplicate import suppress_near_duplicates
+        page_chunks, dedup_stats = suppress_near_duplicates(
+            page_chunks, text_of=lambda pc: pc[1], max_distance=Config.NEAR_DUP_MAX_HAMMING
+        )
+        logging.info(f"Near-duplicate suppression for {url}: {dedup_stats}")
+        
+        for page_url, chunk_text in page_chunks:
+            # Prepend source URL for citation
+            final_text = f"[Source: {page_url}]\n{chunk_text}"
+            
+            all_chunk_texts.append(final_text)
+            all_chunk_metas.append({
+                'text': final_text,
+                'doc_id': new_doc.id,
+                'url': page_url
+            })
+            
+            total_chunks += 1
+        
+        # Set-based insert returns the real chunk IDs for the index metadata
+        from app.services.chunk_writer import bulk_insert_chunks
+        chunk_ids = bulk_insert_chunks(new_doc.id, all_chunk_texts)
+        for meta, cid in zip(all_chunk_metas, chunk_ids):
+            meta['chunk_id'] = cid
+        IndexChangeFeed.record('add', new_doc.id, chunk_ids)
             
         new_doc.status = 'processed'
         db.session.commit()
         
         # 4. Update Index (Real-time)
         try:
-            # Update IDs in metadata now that we've committed
-            for i, c in enumerate(chunks_to_add):
-                all_chunk_metas[i]['chunk_id'] = c.id
-                
             if all_chunk_texts:
                 vector_store.add_texts(all_chunk_texts, all_chunk_metas)
         except Exception as e:
             logging.error(f"Vector store update failed: {e}")
             # Non-fatal, can rebuild index later
         
-        return jsonify({'message': f'Website scraped ({len(pages)} pages) and indexed ({total_chunks} chunks).'})
+        return jsonify({
+            'message': f'Website scraped ({len(pages)} pages) and indexed ({total_chunks} chunks, {dedup_stats["dropped"]} near-duplicates skipped).',
+            'dedup': dedup_stats
+        })
         
     except Exception as e:
         db.session.rollback()
@@ -421,6 +484,7 @@ def delete_document(doc_id):
             pass
             
         db.session.delete(doc)
+        IndexChangeFeed.record('remove_doc', doc_id)
         db.session.commit()
         
         return jsonify({'message': 'Document deleted successfully'})
@@ -430,6 +494,33 @@ def delete_document(doc_id):
 
 
 
+@bp.route('/api/admin/documents/<int:doc_id>/reprocess', methods=['POST'])
+@admin_required
+def reprocess_document(doc_id):
+    try:
+        doc = Document.query.get(doc_id)
+        if not doc:
+            return jsonify({'error': 'Document not found'}), 404
+        if doc.filename.startswith('[WEB]'):
+            return jsonify({'error': 'Web sources are refreshed by re-scraping, not reprocessing'}), 400
+        
+        try:
+            VectorStore.get_instance().remove_document(doc.id)
+        except Exception:
+            pass
+        DocumentChunk.query.filter_by(document_id=doc.id).delete()
+        IndexChangeFeed.record('remove_doc', doc.id)
+        doc.status = 'pending'
+        db.session.commit()
+        
+        process_document(doc.id)
+        return jsonify({'message': 'Document reprocessed successfully'})
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Reprocess failed for document {doc_id}: {e}", exc_info=True)
+        return jsonify({'error': f'Processing failed: {str(e)}'}), 500
+
+
 @bp.route('/api/admin/sync-storage', methods=['POST'])
 @admin_required
 def sync_storage_route():
@@ -442,38 +533,120 @@ def sync_storage_route():
 @bp.route('/api/admin/rebuild-index', methods=['POST'])
 @admin_required
 def rebuild_index():
+    """
+    Start a background rebuild and swap. Only the worker that serves this request
+    rebuilds and swaps its in-memory index; other workers keep theirs until they
+    restart or reconcile. The response's pid says which worker that was.
+    """
+    from app.services.index_warmup import IndexWarmup
+    from app.services.index_rebuilder import RebuildProgress, start_rebuild
+    if IndexWarmup.is_warming():
+        return jsonify({'error': 'Index warm-up is still running', 'warmup': IndexWarmup.snapshot()}), 409
+    if RebuildProgress.is_running():
+        return jsonify({'error': 'A rebuild is already running', 'rebuild': RebuildProgress.snapshot()}), 409
     try:
-        from app.services.vector_store import VectorStore
-        vector_store = VectorStore.get_instance()
-        vector_store.clear()
-        
-        chunks = DocumentChunk.query.all()
-        if not chunks:
-            return jsonify({'message': 'Index cleared. No chunks to index.'})
-            
-        texts = [c.chunk_text for c in chunks]
-        # Use the new add_texts method which handles embedding internally
-        # Prepare metadata
-        # include filename and public URL
-        doc_map = {d.id: d for d in Document.query.all()}
-        supa = SupabaseService()
-        metadata = [{
-            'text': c.chunk_text,
-            'doc_id': c.document_id,
-            'doc_type': doc_map[c.document_id].doc_type if c.document_id in doc_map else 'syllabus',
-            'filename': doc_map[c.document_id].filename if c.document_id in doc_map else None,
-            'url': supa.get_public_url(doc_map[c.document_id].file_path) if c.document_id in doc_map else None
-        } for c in chunks]
-        
-        vector_store.add_texts(texts, metadata)
+        # Same streaming engine as startup, run in the background and checkpointed so a
+        # restart resumes it; ?fresh=true discards any checkpoint and starts from chunk zero
+        resume = request.args.get('fresh', 'false').lower() != 'true'
+        start_rebuild(current_app._get_current_object(), resume=resume)
         
         # REMOVED FOR RENDER COMPATIBILITY - each worker maintains its own in-memory index
         # vector_store.save_index('vector_index')
         
-        return jsonify({'message': f'Index rebuilt with {len(chunks)} chunks.'})
+        return jsonify({'message': 'Index rebuild started on this worker.', 'pid': os.getpid(),
+                        'rebuild': RebuildProgress.snapshot()}), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/admin/rebuild-status', methods=['GET'])
+@admin_required
+def rebuild_status():
+    """
+    Progress, rate and ETA of the running/last rebuild (and startup warm-up), plus any on-disk checkpoint.
+    rebuild.pid is the worker running the rebuild; served_by is the worker answering this request.
+    """
+    from app.services.index_warmup import IndexWarmup
+    from app.services.index_rebuilder import RebuildProgress
+    from app.services.rebuild_checkpoint import RebuildCheckpoint
+    return jsonify({
+        'served_by': os.getpid(),
+        'rebuild': RebuildProgress.snapshot(),
+        'warmup': IndexWarmup.snapshot(),
+        'checkpoint': RebuildCheckpoint.read_state(),
+        'generation': VectorStore.get_instance().generation_info()
+    })
+
+@bp.route('/api/admin/rebuild-index/rollback', methods=['POST'])
+@admin_required
+def rollback_index():
+    """
+    Swap the previous index generation back in, on the worker serving this request only.
+    Needs INDEX_KEEP_PREVIOUS_GENERATION and a rebuild within INDEX_PREVIOUS_GENERATION_TTL_SECONDS.
+    Changes since then are caught up by reconciliation.
+    """
+    from app.services.index_rebuilder import RebuildProgress
+    if RebuildProgress.is_running():
+        return jsonify({'error': 'A rebuild is running'}), 409
+    vector_store = VectorStore.get_instance()
+    if not vector_store.rollback():
+        return jsonify({'error': 'No previous index generation to roll back to'}), 409
+    info = vector_store.generation_info()
+    return jsonify({'message': f"Rolled back to index generation {info['generation']} ({info['vectors']} vectors) on this worker.",
+                    'pid': os.getpid(), 'generation': info})
+
+@bp.route('/api/admin/reconcile-index', methods=['GET', 'POST'])
+@admin_required
+def reconcile_index():
+    """GET: last drift report. POST: diff the index against document_chunks and repair only the drift."""
+    from app.services.index_reconciler import IndexReconciler
+    from app.services.index_warmup import IndexWarmup
+    if request.method == 'GET':
+        return jsonify({'last_report': IndexReconciler.last_report()})
+    from app.services.index_rebuilder import RebuildProgress
+    if IndexWarmup.is_warming() or RebuildProgress.is_running():
+        return jsonify({'error': 'An index rebuild is still running', 'warmup': IndexWarmup.snapshot()}), 409
+    try:
+        dry_run = request.args.get('dry_run', 'false').lower() == 'true'
+        grace_s = request.args.get('grace_s', type=int)  # 0 also adds chunks committed moments ago
+        report = IndexReconciler.reconcile(dry_run=dry_run, grace_s=grace_s)
+        if report.get('status') == 'busy':
+            return jsonify({'error': 'A reconciliation is already running'}), 409
+        return jsonify(report)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/api/admin/latency', methods=['GET', 'DELETE'])
+@admin_required
+def query_latency():
+    """p50/p95/p99 per /api/query stage and mode for this worker, plus search depth (DELETE resets both)."""
+    from app.services.tracing import LatencyStats
+    from app.services.vector_store import SearchDepthStats
+    if request.method == 'DELETE':
+        LatencyStats.reset()
+        SearchDepthStats.reset()
+        SingleFlight.reset_all()
+        return jsonify({'message': 'Latency histograms reset'})
+    rep = LatencyStats.report()
+    rep['search_depth'] = SearchDepthStats.report()
+    rep['coalescing'] = SingleFlight.report()
+    rep['pid'] = os.getpid()
+    return jsonify(rep)
+
+@bp.route('/api/admin/admission', methods=['GET'])
+@admin_required
+def admission_stats():
+    """Active/queued LLM-backed requests and rejection counts for this worker."""
+    rep = AdmissionController.stats()
+    rep['pid'] = os.getpid()
+    return jsonify(rep)
+
+@bp.route('/api/admin/chat-persistence', methods=['GET'])
+@admin_required
+def chat_persistence_stats():
+    """Write-behind queue depth and throughput for this worker."""
+    from app.services.chat_persistence import ChatWriteBehind
+    return jsonify(ChatWriteBehind.stats())
+
 @bp.route('/api/admin/stats', methods=['GET'])
 @admin_required
 def get_stats():
@@ -481,6 +654,15 @@ def get_stats():
     vector_store = VectorStore.get_instance()
     return jsonify(vector_store.get_stats())
 
+@bp.route('/api/admin/startup-profile', methods=['GET'])
+@admin_required
+def get_startup_profile():
+    """Per-worker cold-start timings (create_app phases, lazy heavy imports) and current RSS."""
+    from app.services.startup_profile import StartupProfile, memory_breakdown
+    rep = StartupProfile.report()
+    rep['memory'] = memory_breakdown()
+    return jsonify(rep)
+
 @bp.route('/api/admin/chunks', methods=['GET'])
 @admin_required
 def list_chunks():
@@ -519,7 +701,10 @@ def delete_chunk(chunk_id):
         if not chunk:
             return jsonify({'error': 'Chunk not found'}), 404
         db.session.delete(chunk)
+        IndexChangeFeed.record('remove', chunk_ids=[chunk_id])
         db.session.commit()
+        from app.services.vector_store import VectorStore
+        VectorStore.get_instance().remove_chunks([chunk_id])
         return jsonify({'message': 'Chunk deleted'})
     except Exception as e:
         db.session.rollback()
@@ -1378,26 +1563,6 @@ def get_document_chunks(doc_id):
 @admin_required
 def list_filter_options():
     try:
-        # Schema migration for parent_id (hack for MVP)
-        try:
-            from sqlalchemy import text
-            eng = db.session.get_bind()
-            # SQLite check
-            if 'sqlite' in eng.dialect.name:
-                 # Check if column exists
-                 res = db.session.execute(text("PRAGMA table_info(filter_options)")).fetchall()
-                 cols = [r[1] for r in res]
-                 if 'parent_id' not in cols:
-                     db.session.execute(text("ALTER TABLE filter_options ADD COLUMN parent_id INTEGER REFERENCES filter_options(id)"))
-                     db.session.commit()
-            else:
-                 # Postgres
-                 db.session.execute(text("ALTER TABLE public.filter_options ADD COLUMN IF NOT EXISTS parent_id INTEGER REFERENCES public.filter_options(id)"))
-                 db.session.commit()
-        except Exception as e:
-            db.session.rollback()
-            # logging.error(f"Schema migration failed: {e}")
-
         try:
             opts = FilterOption.query.all()
             return jsonify({'courses': sorted(list({o.value for o in opts if o.category == 'course'})),
@@ -1475,6 +1640,8 @@ def delete_filter_option(id):
 @bp.route('/api/chat/sessions', methods=['GET'])
 @login_required
 def list_chat_sessions():
+    from app.services.chat_persistence import ChatWriteBehind
+    ChatWriteBehind.wait_for_prior_writes()  # Include sessions from answers still in the write-behind queue
     sessions = ChatSession.query.filter_by(user_id=session['user_id']).order_by(ChatSession.updated_at.desc()).all()
     return jsonify([s.to_dict() for s in sessions])
 
@@ -1486,6 +1653,8 @@ def get_chat_history(session_id):
         return jsonify([])
         
     uid = session.get('user_id')
+    from app.services.chat_persistence import ChatWriteBehind
+    ChatWriteBehind.wait_for_prior_writes()
     msgs = ChatMessage.query.filter_by(session_id=session_id, user_id=uid).order_by(ChatMessage.created_at.asc()).all()
     
     result = []
@@ -1509,10 +1678,13 @@ def get_chat_history(session_id):
 @bp.route('/api/chat/sessions/<session_id>', methods=['DELETE'])
 @login_required
 def delete_chat_session(session_id):
+    from app.services.chat_persistence import ChatWriteBehind
+    ChatWriteBehind.wait_for_prior_writes()
     sess = ChatSession.query.filter_by(id=session_id, user_id=session['user_id']).first()
     if sess:
         db.session.delete(sess)
         db.session.commit()
+        ChatWriteBehind.forget_session(session_id)
     return jsonify({'message': 'Session deleted'})
 
 @bp.route('/api/chat/sessions/<session_id>/rename', methods=['POST'])
@@ -1522,10 +1694,13 @@ def rename_chat_session(session_id):
     new_title = (data.get('title') or '').strip()
     if not new_title:
         return jsonify({'error': 'Title required'}), 400
+    from app.services.chat_persistence import ChatWriteBehind
+    ChatWriteBehind.wait_for_prior_writes()
     sess = ChatSession.query.filter_by(id=session_id, user_id=session['user_id']).first()
     if sess:
         sess.title = new_title
         db.session.commit()
+        ChatWriteBehind.remember_session(session_id, sess.user_id, new_title)
         return jsonify({'message': 'Renamed'})
     return jsonify({'error': 'Session not found'}), 404
 
@@ -1540,49 +1715,87 @@ def query():
         
         if not question:
             return jsonify({'error': 'No question provided'}), 400
+        tracing.set_mode('general' if mode == 'general' else 'studies')
 
         uid = session.get('user_id')
         import uuid
+        from app.services.ai_service import AIService
+        from app.services.chat_persistence import ChatWriteBehind
+        from app.services.query_pipeline import QueryFanOut
+
+        # Sanitize question to prevent database errors (NUL characters)
+        question = DocumentProcessor._sanitize_text(question)
+
+        # Studies mode needs the vector index; while it is still warming up, say so before
+        # any session row is written or any work is started
+        from app.services.index_warmup import IndexWarmup
+        if mode != 'general' and not AIService.is_smalltalk(question) and not IndexWarmup.is_ready():
+            warm = IndexWarmup.snapshot()
+            resp = jsonify({
+                'answer': f"I'm still loading the knowledge base ({warm['percent']:.0f}% done). Please ask again in a moment.",
+                'sources': [],
+                'warming_up': True,
+                'progress': warm,
+                'session_id': session_id
+            })
+            resp.headers['Retry-After'] = '15'
+            return resp, 503
+
+        def load_prefs(user_id):
+            # Latest prefs from DB (handles cross-device sync)
+            user = db.session.get(User, user_id)
+            return (user.pref_course, user.pref_semester, user.pref_subject) if user else (None, None, None)
+
+        def load_session_owner(sid):
+            sess = db.session.get(ChatSession, sid)
+            return (sess.user_id, sess.title) if sess else None
+
+        # Independent waits run concurrently: prefs, session ownership (cache miss only), question embedding
+        prefs_stage = QueryFanOut.submit('user_lookup', load_prefs, uid)
+        known = ChatWriteBehind.known_session(session_id) if session_id else None
+        session_stage = QueryFanOut.submit('session_lookup', load_session_owner, session_id) if session_id and known is None else None
+        embed_stage = None
+        if mode != 'general' and not AIService.is_smalltalk(question):
+            def embed_question():
+                # The embedding depends only on the text, so coalesce on the normalized question
+                value, _ = _QUESTION_EMBED_FLIGHT.do(
+                    ' '.join(question.lower().split()),
+                    lambda: AIService.get_embeddings([question], timeout=Config.QUERY_EMBED_TIMEOUT_SECONDS)
+                )
+                return value
+            embed_stage = QueryFanOut.submit('embed_question', embed_question)
+
+        # Session ownership/title: sessions this worker has written are known without a DB read
+        session_title = None
         if not session_id:
             session_id = str(uuid.uuid4())
-            curr_sess = ChatSession(id=session_id, user_id=uid, title='New Chat')
-            db.session.add(curr_sess)
             logging.info(f"Created new session: {session_id}")
         else:
-            curr_sess = db.session.get(ChatSession, session_id)
-            if not curr_sess:
-                curr_sess = ChatSession(id=session_id, user_id=uid, title='New Chat')
-                db.session.add(curr_sess)
+            if session_stage is not None:
+                known = session_stage.result()
+            if not known:
                 logging.info(f"Created session from provided ID: {session_id}")
-            elif curr_sess.user_id != uid:
+            elif known[0] != uid:
                 session_id = str(uuid.uuid4())
-                curr_sess = ChatSession(id=session_id, user_id=uid, title='New Chat')
-                db.session.add(curr_sess)
                 logging.info(f"Created new session due to user mismatch: {session_id}")
+            else:
+                session_title = known[1]
             
         # Auto-title if it's the first message
-        if curr_sess.title == 'New Chat' or not curr_sess.title:
-            title = question[:30] + ('...' if len(question) > 30 else '')
-            curr_sess.title = title
+        retitle = session_title == 'New Chat' or not session_title
+        if retitle:
+            session_title = question[:30] + ('...' if len(question) > 30 else '')
         
-        from datetime import datetime
-        curr_sess.updated_at = datetime.utcnow()
+        # Create/retitle and bump updated_at off the request thread (write-behind)
         try:
-            db.session.commit()
-            session_title = curr_sess.title
+            with tracing.span('session_commit'):
+                ChatWriteBehind.save_session(session_id, uid, session_title, set_title=retitle)
         except Exception as se:
             db.session.rollback()
             logging.error(f"Failed to commit session update: {se}", exc_info=True)
             session_title = "New Chat"
             
-        # Sanitize question to prevent database errors (NUL characters)
-        question = DocumentProcessor._sanitize_text(question)
-            
-        # Fetch current user to get latest prefs from DB (handles cross-device sync)
-        user = User.query.get(session['user_id'])
-        pref_c = user.pref_course if user else None
-        pref_s = user.pref_semester if user else None
-        pref_sub = user.pref_subject if user else None
+        pref_c, pref_s, pref_sub = prefs_stage.result()
 
         course = (data.get('course') or pref_c or '').strip()
         semester = (data.get('semester') or pref_s or '').strip()
@@ -1591,19 +1804,18 @@ def query():
         logging.info(f"Processing query: '{question}' mode={mode} - Course: {course}, Semester: {semester}, Subject: {subject}, Session: {session_id}")
         
         try:
-            from app.services.ai_service import AIService
             if AIService.is_smalltalk(question):
+                tracing.set_mode('smalltalk')
                 answer = AIService.generate_smalltalk(question)
                 try:
-                    msg = ChatMessage(
-                        user_id=session['user_id'],
-                        question=question,
-                        answer=answer,
-                        sources_json='[]',
-                        session_id=session_id
-                    )
-                    db.session.add(msg)
-                    db.session.commit()
+                    with tracing.span('persist'):
+                        ChatWriteBehind.save_message(
+                            user_id=session['user_id'],
+                            question=question,
+                            answer=answer,
+                            sources_json='[]',
+                            session_id=session_id
+                        )
                 except Exception as e: 
                     db.session.rollback()
                     logging.error(f"Failed to save smalltalk message: {e}", exc_info=True)
@@ -1632,7 +1844,8 @@ def query():
                 # Combine indices for all configured URLs
                 all_index = []
                 for url in target_urls:
-                    ok, index, err = _get_general_index(url)
+                    with tracing.span('general_index'):
+                        ok, index, err = _get_general_index(url)
                     if ok and index:
                         all_index.extend(index)
                     else:
@@ -1648,23 +1861,26 @@ def query():
                 if not context:
                      return jsonify({'answer': 'I processed the website but found no content relevant to your question.', 'sources': []})
                 
-                # Generate
-                answer = AIService.generate_answer_from_website(question, context, source_url=target_urls[0])
+                # Generate (only the LLM call holds an admission slot)
+                try:
+                    with AdmissionController.slot(session['user_id']):
+                        answer = AIService.generate_answer_from_website(question, context, source_url=target_urls[0])
+                except AdmissionRejected as e:
+                    return _admission_rejected(_admission_rejected_body(e))
                 
                 # Save
                 try:
-                    msg = ChatMessage(
-                        user_id=session['user_id'],
-                        question=question,
-                        answer=answer,
-                        sources_json=json.dumps(sources),
-                        session_id=session_id,
-                        course='General',
-                        semester='General',
-                        subject='General'
-                    )
-                    db.session.add(msg)
-                    db.session.commit()
+                    with tracing.span('persist'):
+                        ChatWriteBehind.save_message(
+                            user_id=session['user_id'],
+                            question=question,
+                            answer=answer,
+                            sources_json=json.dumps(sources),
+                            session_id=session_id,
+                            course='General',
+                            semester='General',
+                            subject='General'
+                        )
                 except Exception as e:
                     db.session.rollback()
                     logging.error(f"Failed to save general chat message: {e}")
@@ -1676,8 +1892,14 @@ def query():
                     'session_title': session_title
                 })
 
-            # 1. Embed question (Studies mode)
-            q_embedding = AIService.get_embeddings([question])
+            # 1. Embed question (Studies mode); if the embedding API is down or slow, BM25 retrieval carries on alone
+            q_vec = None
+            try:
+                # Started concurrently with the session/prefs lookups above
+                q_embedding = embed_stage.result()
+            except Exception as e:
+                q_embedding = None
+                logging.warning(f"Question embedding failed ({e}); falling back to lexical retrieval")
             # get_embeddings returns list of list (batch), we need the first one if it's a list
             if isinstance(q_embedding, list) and len(q_embedding) > 0:
                  # Handle varying return types from HF API (sometimes list of float, sometimes list of list)
@@ -1687,224 +1909,217 @@ def query():
                      q_vec = q_embedding
                  logging.info(f"Successfully embedded question. Vector length: {len(q_vec)}")
                  logging.info(f"Question embedding sample: {q_vec[:5] if len(q_vec) >= 5 else q_vec}")
-            else:
+            elif not Config.HYBRID_SEARCH:
                  logging.error(f"Failed to embed question. Response: {q_embedding}")
                  return jsonify({'error': 'Failed to embed question'}), 500
 
-            # --- Intelligence Tier: Identity Intent Detection ---
-            id_keywords = [
-                'who are you', 'who you are', "who you're", 'what are you', 'your name', 
-                'created you', 'developer', 'about yourself', 'your purpose', 
-                'what can you do', 'how you work', 'about this software', 'about the bot'
-            ]
-            identity_intent = any(k in question.lower() for k in id_keywords)
-            
-            # 2. Search
-            from app.services.vector_store import VectorStore
-            vector_store = VectorStore.get_instance()
+            def retrieve_and_answer():
+                """Search, assemble context, generate and cite. Returns (body, status, persist); shared by coalesced requests."""
+                # --- Intelligence Tier: Identity Intent Detection ---
+                id_keywords = [
+                    'who are you', 'who you are', "who you're", 'what are you', 'your name', 
+                    'created you', 'developer', 'about yourself', 'your purpose', 
+                    'what can you do', 'how you work', 'about this software', 'about the bot'
+                ]
+                identity_intent = any(k in question.lower() for k in id_keywords)
             
-            # Dynamic K: Increase depth if we suspect an identity query to ensure system info is found
-            search_k = 40 if identity_intent else 25
-            results = vector_store.search(q_vec, k=search_k)
-            logging.info(f"Initial vector search (Intent: {'Identity' if identity_intent else 'General'}) returned {len(results)} results")
+                # 2. Search
+                from app.services.vector_store import VectorStore
+                vector_store = VectorStore.get_instance()
             
-            # Check if the index has vectors before applying distance filtering
-            stats = vector_store.get_stats()
-            if stats['total_vectors'] == 0:
-                logging.warning("Vector store has 0 vectors - no documents indexed")
-                return jsonify({'answer': 'Vector index empty — rebuild failed or no documents processed', 'sources': []})
-            
-            # 1. Fetch documents for metadata mapping fallback
-            doc_map = {d.id: d for d in Document.query.all()}
-            logging.info(f"Total documents in system: {len(doc_map)}")
-            
-            # PHASE 1: Confidence Filtering with Identity Bypass
-            # Syllabus docs must be close (distance threshold), but Identity docs should be more resilient
-            filtered = []
-            for r in results:
-                dist = r.get('distance')
-                if dist is None: continue
-                
-                # Check type to see if we apply threshold
-                did = r.get('doc_id') or r.get('document_id')
-                dtype = r.get('doc_type')
-                if not dtype or dtype == 'syllabus':
-                     if did and did in doc_map:
-                         dtype = getattr(doc_map[did], 'doc_type', 'syllabus')
-                
-                # Bypass threshold for system info or if distance is low enough
-                if dtype == 'system_info' or dist <= Config.VECTOR_MAX_DISTANCE:
-                    filtered.append(r)
-            
-            logging.info(f"Initial filtering: {len(results)} -> {len(filtered)} results (Threshold: {Config.VECTOR_MAX_DISTANCE}, Identities Bypassed)")
-            
-            # If nothing survived, fallback to best matches to avoid 0-context silence
-            if not filtered and results:
-                logging.info(f"0 results within threshold. Falling back to top {min(3, len(results))} raw results.")
-                filtered = results[:3]
-            
-            # If we still don't have filtered results but have search results, take the closest one as final fallback
-            if not filtered and results:
-                closest_result = min(results, key=lambda x: x.get('distance', float('inf')))
-                if closest_result:
-                    logging.info(f"Taking closest result with distance: {closest_result.get('distance')}")
-                    filtered = [closest_result]
-            
-            if course or semester or subject:
-                def match_cat(r):
-                    # Robust ID resolution (handle stale metadata keys)
-                    did = r.get('doc_id') or r.get('document_id')
-                    
-                    # Try metadata type first (fast)
+                # 1. Document metadata fallback comes from the per-worker cache (no per-query table scan)
+                from app.services.document_cache import DocumentMetaCache
+                doc_meta = DocumentMetaCache.get
+
+                def resolve_type(r):
+                    # Metadata may be missing or stale ('syllabus' default); verify system_info against the cache
                     dtype = r.get('doc_type')
-                    
-                    # If metadata is missing or says syllabus, we MUST verify with DB for system_info
-                    # because system info must ignore all filters
                     if not dtype or dtype == 'syllabus':
-                        d = doc_map.get(did)
+                        d = doc_meta(r.get('doc_id') or r.get('document_id'))
                         if d:
-                            dtype = getattr(d, 'doc_type', 'syllabus')
-                    
-                    if dtype == 'system_info':
+                            dtype = d.doc_type
+                    return dtype
+
+                def match_cat(r):
+                    # System info must ignore all filters
+                    if not (course or semester or subject) or resolve_type(r) == 'system_info':
                         return True
-                        
-                    # Now handle syllabus filtering
-                    if not did: return False
-                    d = doc_map.get(did)
+                    d = doc_meta(r.get('doc_id') or r.get('document_id'))
                     if not d: return False
-                        
                     ok_course = True if not course else ((d.course or '').strip().lower() == course.lower())
                     ok_sem = True if not semester else ((d.semester or '').strip().lower() == semester.lower())
                     ok_subj = True if not subject else ((d.subject or '').strip().lower() == subject.lower())
                     return ok_course and ok_sem and ok_subj
-                
-                before_count = len(filtered)
-                filtered = [r for r in filtered if match_cat(r)]
-                logging.info(f"Category filtering: {before_count} -> {len(filtered)} results (Course: {course}, Semester: {semester}, Subject: {subject})")
-                
-            # PHASE 2: Intelligence Mixing & Primacy Protection
-            # We must ensure System Identity bits aren't drowned out by syllabus bits
-            system_bits = []
-            academic_bits = []
+
+                def within_threshold(r):
+                    # Syllabus docs must be close (distance threshold); system info and BM25 matches bypass it
+                    dist = r.get('distance')
+                    if 'bm25' in r or resolve_type(r) == 'system_info':
+                        return True
+                    return dist is not None and dist <= Config.VECTOR_MAX_DISTANCE
+
+                def usable(r):
+                    return within_threshold(r) and match_cat(r)
+
+                # IDENTITY PRIMACY: If we detected an identity intent, we prioritize identity docs even more
+                # We take a higher ratio of system info bits when identity is the likely intent
+                sys_limit = 8 if identity_intent else 4
+                acad_limit = 3 if identity_intent else 6
+
+                # Adaptive depth: start shallow and widen only until enough academic hits survive the threshold and
+                # filters (system info has its own sub-index below, so identity queries no longer need a deeper search)
+                results = []
+                if q_vec is not None:
+                    results, _ = vector_store.search_until(
+                        q_vec, lambda r: usable(r) and resolve_type(r) != 'system_info', acad_limit,
+                        k_start=Config.SEARCH_K_START, k_max=Config.SEARCH_K_MAX, growth=Config.SEARCH_K_GROWTH
+                    )
+                logging.info(f"Vector search (Intent: {'Identity' if identity_intent else 'General'}) went {len(results)} deep")
+                if Config.HYBRID_SEARCH:
+                    # Exact terms (course codes, exam names) that the embedding blurs; merged by rank fusion
+                    from app.services.lexical_index import fuse
+                    lexical = vector_store.lexical_search(question, k=Config.LEXICAL_K, min_ratio=Config.LEXICAL_MIN_RATIO)
+                    results = fuse(results, lexical)
+                    logging.info(f"Lexical search returned {len(lexical)} results; {len(results)} after fusion")
+                    if q_vec is None and not results:
+                        return {'error': 'Failed to embed question'}, 500, False
+
+                # System info is always resident in a tiny sub-index and searched on every query
+                sys_hits = vector_store.search_system(q_vec, k=sys_limit) if q_vec is not None else []
+                if not identity_intent:
+                    # Outside identity questions, only as much as would have ranked among the main hits
+                    depth = max((r['distance'] for r in results if 'distance' in r), default=None)
+                    sys_hits = [h for h in sys_hits if depth is not None and h['distance'] <= depth]
             
-            for r in filtered:
-                did = r.get('doc_id') or r.get('document_id')
-                dtype = r.get('doc_type')
-                
-                # Verify type if meta is stale
-                if not dtype or dtype == 'syllabus':
-                    if did and did in doc_map:
-                        dtype = getattr(doc_map[did], 'doc_type', 'syllabus')
+                # Check if the index has vectors before applying distance filtering
+                stats = vector_store.get_stats()
+                if stats['total_vectors'] == 0:
+                    logging.warning("Vector store has 0 vectors - no documents indexed")
+                    return {'answer': 'Vector index empty — rebuild failed or no documents processed', 'sources': []}, 200, False
+            
+                # PHASE 1: Confidence + category filtering
+                filtered = [r for r in results if usable(r)]
+                logging.info(f"Filtering: {len(results)} -> {len(filtered)} results (Threshold: {Config.VECTOR_MAX_DISTANCE}, Course: {course}, Semester: {semester}, Subject: {subject})")
+            
+                # If nothing survived the threshold, fall back to the closest matches that still honour the filters
+                if not filtered and results:
+                    in_category = sorted((r for r in results if match_cat(r)), key=lambda x: x.get('distance', float('inf')))
+                    filtered = in_category[:3]
+                    logging.info(f"0 results within threshold. Falling back to {len(filtered)} closest in-category results.")
                 
-                if dtype == 'system_info':
-                    system_bits.append(r)
-                else:
-                    academic_bits.append(r)
+                # PHASE 2: Intelligence Mixing & Primacy Protection
+                # We must ensure System Identity bits aren't drowned out by syllabus bits
+                system_bits = list(sys_hits)
+                academic_bits = []
+                seen_sys = {h.get('chunk_id') or h.get('text') for h in sys_hits}
             
-            # --- URGENT IDENTITY RECOVERY ---
-            # If user asked about identity but vector search missed it, force load from DB
-            if identity_intent and not system_bits:
-                sys_docs = Document.query.filter_by(doc_type='system_info', status='processed').all()
-                if sys_docs:
-                    logging.info(f"Identity recovery: Manually loading chunks for {len(sys_docs)} system docs")
-                    for sd in sys_docs:
-                        # Grab first few chunks as identifying info
-                        recovery_chunks = DocumentChunk.query.filter_by(document_id=sd.id).limit(3).all()
-                        for rc in recovery_chunks:
-                            system_bits.append({
-                                'text': rc.chunk_text,
-                                'doc_id': sd.id,
-                                'doc_type': 'system_info',
-                                'filename': sd.filename,
-                                'distance': 0.0 # Force priority
-                            })
+                for r in filtered:
+                    if resolve_type(r) == 'system_info':
+                        if (r.get('chunk_id') or r.get('text')) not in seen_sys:
+                            system_bits.append(r)
+                    else:
+                        academic_bits.append(r)
             
-            # IDENTITY PRIMACY: If we detected an identity intent, we prioritize identity docs even more
-            # We take a higher ratio of system info bits when identity is the likely intent
-            sys_limit = 8 if identity_intent else 4
-            acad_limit = 3 if identity_intent else 6
+                # --- URGENT IDENTITY RECOVERY ---
+                # If user asked about identity but nothing matched (e.g. no question embedding), use the
+                # precomputed leading chunks of each system doc (in memory, no DB round trip)
+                if identity_intent and not system_bits:
+                    system_bits = vector_store.system_top_chunks()
+                    if system_bits:
+                        logging.info(f"Identity recovery: using {len(system_bits)} precomputed system info chunks")
             
-            final_filtered = system_bits[:sys_limit] + academic_bits[:acad_limit]
+                final_filtered = system_bits[:sys_limit] + academic_bits[:acad_limit]
             
-            if not final_filtered:
-                # Diagnostics: why was it empty?
-                all_docs = Document.query.all()
-                if not all_docs:
-                    return jsonify({'answer': 'No documents have been uploaded yet.', 'sources': []})
+                if not final_filtered:
+                    # Diagnostics: why was it empty?
+                    all_docs = DocumentMetaCache.all()
+                    if not all_docs:
+                        return {'answer': 'No documents have been uploaded yet.', 'sources': []}, 200, False
                 
-                sys_docs = [d for d in all_docs if d.doc_type == 'system_info']
-                logging.warning(f"Query '{question}' returned 0 survivors. Initial search: {len(results)}, System docs in DB: {len(sys_docs)}")
+                    sys_docs = [d for d in all_docs if d.doc_type == 'system_info']
+                    logging.warning(f"Query '{question}' returned 0 survivors. Initial search: {len(results)}, System docs in DB: {len(sys_docs)}")
                 
-                return jsonify({
-                    'answer': 'Not available in selected category (No context found).', 
-                    'sources': [],
-                    'debug_info': {
-                        'total_docs': len(all_docs),
-                        'system_docs': len(sys_docs),
-                        'initial_matches': len(results)
-                    }
-                })
+                    return {
+                        'answer': 'Not available in selected category (No context found).', 
+                        'sources': [],
+                        'debug_info': {
+                            'total_docs': len(all_docs),
+                            'system_docs': len(sys_docs),
+                            'initial_matches': len(results)
+                        }
+                    }, 200, False
             
-            # Overwrite filtered with our prioritized list
-            filtered = final_filtered
+                # Overwrite filtered with our prioritized list
+                filtered = final_filtered
                 
-            # 3. Generate Answer
-            context = "\n\n".join([r['text'] for r in filtered])
-            logging.info(f"Context Construction: {len(system_bits)} identity bits found, {len(academic_bits)} academic bits. Selected: {len(filtered)}")
-            answer = AIService.generate_answer(question, context)
+                # 3. Generate Answer
+                context = "\n\n".join([r['text'] for r in filtered])
+                logging.info(f"Context Construction: {len(system_bits)} identity bits found, {len(academic_bits)} academic bits. Selected: {len(filtered)}")
+                try:
+                    with AdmissionController.slot(session['user_id']):
+                        answer = AIService.generate_answer(question, context)
+                except AdmissionRejected as e:
+                    return _admission_rejected_body(e), 429, False
             
-            # Deduplicate sources by doc_id
-            unique = {}
-            for r in filtered:
-                did = r.get('doc_id') or r.get('document_id')
-                
-                # RECOGNITION: Check if this is a system/identity document
-                dtype = r.get('doc_type')
-                if not dtype or dtype == 'syllabus':
-                    # Verify with DB if metadata is uncertain
-                    if did and did in doc_map:
-                        dtype = getattr(doc_map[did], 'doc_type', 'syllabus')
+                # Deduplicate sources by doc_id; citations are held per document in the index (in-memory lookup)
+                unique = {}
+                for r in filtered:
+                    did = r.get('doc_id') or r.get('document_id')
                 
-                # USER RULE: Don't show sources for 'About the Software' or Identity documents
-                if dtype == 'system_info':
-                    continue
+                    # USER RULE: Don't show sources for 'About the Software' or Identity documents
+                    if resolve_type(r) == 'system_info':
+                        continue
                     
-                key = did
-                if key is None:
-                    key = f"unknown-{id(r)}"
-                if key not in unique:
-                    # Prefer filename from metadata; if missing, pull from DB
-                    fn = r.get('filename')
-                    if not fn and isinstance(key, int) and key in doc_map:
-                        fn = doc_map[key].filename
-                    url = r.get('url')
-                    if not url and isinstance(key, int) and key in doc_map:
-                        # Compute public URL from stored path
-                        try:
-                            supa = SupabaseService()
-                            url = supa.get_public_url(doc_map[key].file_path)
-                        except Exception:
-                            url = None
-                    unique[key] = {
-                        'doc_id': did,
-                        'filename': fn,
-                        'url': url
-                    }
-            sources = list(unique.values())
+                    key = did
+                    if key is None:
+                        key = f"unknown-{id(r)}"
+                    if key not in unique:
+                        cite = vector_store.citation(did)
+                        # Web chunks carry the page they came from; prefer it over the document-level URL
+                        fn = cite.filename if cite else r.get('filename')
+                        url = r.get('url') or (cite.url if cite else None)
+                        if (not fn or not url) and isinstance(key, int):
+                            # Entries indexed without citation data (or web docs, which have no filename): use the metadata cache
+                            d = doc_meta(key)
+                            if d:
+                                fn = fn or d.filename
+                                url = url or d.url
+                        unique[key] = {
+                            'doc_id': did,
+                            'filename': fn,
+                            'url': url
+                        }
+                sources = list(unique.values())
+                return {'answer': answer, 'sources': sources}, 200, True
+
+            # Identical questions with the same filters that are already in flight share one search + generation
+            flight_key = (' '.join(question.lower().split()), course.lower(), semester.lower(), subject.lower(), mode)
+            with tracing.span('answer'):
+                (body, status, persist), shared = _STUDIES_ANSWER_FLIGHT.do(flight_key, retrieve_and_answer)
+            if shared:
+                logging.info(f"Coalesced with an in-flight identical question: '{question}'")
+                if status == 429:
+                    # The leader was shed under its own user's limits; try under ours
+                    with tracing.span('answer'):
+                        body, status, persist = retrieve_and_answer()
+            if status == 429:
+                return _admission_rejected(body)
+            if not persist:
+                return jsonify(body), status
+            answer, sources = body['answer'], body['sources']
             
             try:
-                msg = ChatMessage(
-                    user_id=session['user_id'],
-                    question=question,
-                    answer=answer,
-                    course=course or None,
-                    semester=semester or None,
-                    subject=subject or None,
-                    sources_json=json.dumps(sources),
-                    session_id=session_id
-                )
-                db.session.add(msg)
-                db.session.commit()
+                with tracing.span('persist'):
+                    ChatWriteBehind.save_message(
+                        user_id=session['user_id'],
+                        question=question,
+                        answer=answer,
+                        course=course or None,
+                        semester=semester or None,
+                        subject=subject or None,
+                        sources_json=json.dumps(sources),
+                        session_id=session_id
+                    )
             except Exception as e:
                 db.session.rollback()
                 logging.error(f"Failed to save studies chat message: {e}", exc_info=True)
@@ -1928,6 +2143,28 @@ def query():
 
 # --- Health Check ---
 
+@bp.route('/health/live', methods=['GET'])
+def liveness_check():
+    """Liveness: the process is up and serving requests. No DB or index checks."""
+    return jsonify({'status': 'alive'})
+
+@bp.route('/health/ready', methods=['GET'])
+def readiness_check():
+    """Readiness: the vector index warm-up has finished. Reports progress while warming."""
+    from app.services.index_warmup import IndexWarmup
+    warm = IndexWarmup.snapshot()
+    stats = VectorStore.get_instance().get_stats()
+    body = {
+        'status': 'ready' if IndexWarmup.is_ready() else 'warming_up',
+        'warmup': warm,
+        'vectors': stats['total_vectors']
+    }
+    if not IndexWarmup.is_ready():
+        resp = jsonify(body)
+        resp.headers['Retry-After'] = '15'
+        return resp, 503
+    return jsonify(body)
+
 @bp.route('/health', methods=['GET'])
 def health_check():
     try:
@@ -1968,27 +2205,33 @@ def process_document(doc_id):
         # Download from Supabase Storage
         supa = SupabaseService()
         file_bytes = supa.download_file(doc.file_path)
-        text = DocumentProcessor.extract_text_from_bytes(file_bytes, doc.filename)
-        chunks = DocumentProcessor.chunk_text(text)
         
-        for i, chunk_text in enumerate(chunks):
-            new_chunk = DocumentChunk(
-                document_id=doc.id,
-                chunk_text=chunk_text,
-                chunk_index=i
-            )
-            db.session.add(new_chunk)
+        # Reuse a previous extraction of identical content (skips PDF parsing and image captioning)
+        from app.services.extraction_cache import ExtractionCache
+        content_hash = ExtractionCache.content_hash(file_bytes)
+        chunks = ExtractionCache.load(supa, content_hash)
+        from_cache = chunks is not None
+        deferred_images = []
+        if from_cache:
+            logging.info(f"Extraction cache hit for {doc.filename} ({content_hash[:12]}), {len(chunks)} chunks")
+        else:
+            text = DocumentProcessor.extract_text_from_bytes(file_bytes, doc.filename, deferred_images=deferred_images)
+            chunks = DocumentProcessor.chunk_text(text)
+        
+        from app.services.chunk_writer import bulk_insert_chunks
+        chunk_ids = bulk_insert_chunks(doc.id, chunks)
+        IndexChangeFeed.record('add', doc.id, chunk_ids)
             
         doc.status = 'processed'
         db.session.commit()
         
-        # Store chunks as JSON in Supabase Storage for audit/export
+        # Store chunks as JSON in Supabase Storage for audit/export, doubling as the extraction cache.
+        # With deferred captions pending, the cache entry is written once they are done.
         try:
-            chunks_payload = json.dumps([{'chunk_index': i, 'text': t} for i, t in enumerate(chunks)]).encode('utf-8')
-            supa.upload_file(chunks_payload, f"chunks/{doc.id}.json", content_type="application/json")
+            ExtractionCache.store(supa, content_hash, chunks, doc_id=doc.id, cache=not from_cache and not deferred_images)
         except Exception as e:
             # Non-fatal: continue even if chunk JSON upload fails
-            pass
+            logging.warning(f"Failed to store chunk JSON for {doc.filename}: {e}")
         
         # Auto-update index (optional, or wait for manual rebuild)
         # For MVP, let's try to update immediately if small
@@ -2000,14 +2243,16 @@ def process_document(doc_id):
             # Or just do it:
             chunk_texts = [c for c in chunks]
             # Use the new add_texts method which handles embedding internally
+            url = supa.get_public_url(doc.file_path)
             metadata = [{
                 'text': c, 
                 'doc_id': doc.id, 
                 'document_id': doc.id, # Double mapping for compatibility
+                'chunk_id': cid,
                 'doc_type': doc.doc_type or 'syllabus',
                 'filename': doc.filename, 
-                'url': supa.get_public_url(doc.file_path)
-            } for c in chunks]
+                'url': url
+            } for c, cid in zip(chunks, chunk_ids)]
             vector_store.add_texts(chunk_texts, metadata)
             
             # REMOVED FOR RENDER COMPATIBILITY - each worker maintains its own in-memory index
@@ -2018,6 +2263,15 @@ def process_document(doc_id):
             logging.error(f"Failed to update vector store with new document: {e}")
             # Continue anyway, user can manually rebuild index later
         
+        # Low-priority image captions run after the text is already searchable
+        if deferred_images:
+            try:
+                from app.services.ingestion import schedule_deferred_captions
+                schedule_deferred_captions(current_app._get_current_object(), doc.id, deferred_images, chunks, content_hash)
+                logging.info(f"Scheduled {len(deferred_images)} deferred image captions for {doc.filename}")
+            except Exception as e:
+                logging.error(f"Failed to schedule deferred captions for {doc.filename}: {e}")
+        
     except Exception as e:
         doc.status = 'error'
         db.session.commit()
@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from app.services import tracing
+from config import Config
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Bounds the LLM generation calls a worker process makes: at most
+    ADMISSION_MAX_CONCURRENT run, at most ADMISSION_QUEUE_MAX wait (each for up
+    to ADMISSION_QUEUE_TIMEOUT_SECONDS), and a user may hold at most
+    ADMISSION_PER_USER_MAX of either. Everything else is rejected at once with a
+    Retry-After estimate, so a burst cannot occupy every gunicorn thread.
+    Callers take a slot with slot() around the generation call only.
+    """
+    _cond = threading.Condition()
+    _active = 0
+    _waiting = 0
+    _per_user = Counter()  # user_id -> running + queued requests
+    _hold_ewma = 5.0  # Seconds a slot is typically held; drives Retry-After
+    _stats = {'admitted': 0, 'queued': 0, 'rejected_user_limit': 0, 'rejected_queue_full': 0,
+              'rejected_timeout': 0, 'wait_ms_total': 0.0}
+
+    @classmethod
+    def _retry_after(cls):
+        slots = max(Config.ADMISSION_MAX_CONCURRENT, 1)
+        return max(1, int(round(cls._hold_ewma * (cls._waiting + 1) / slots)))
+
+    @classmethod
+    def _drop_user(cls, user_id):
+        cls._per_user[user_id] -= 1
+        if cls._per_user[user_id] <= 0:
+            del cls._per_user[user_id]
+
+    @classmethod
+    def _reject(cls, reason):
+        cls._stats[f'rejected_{reason}'] += 1
+        raise AdmissionRejected(reason, cls._retry_after())
+
+    @classmethod
+    def acquire(cls, user_id):
+        """Take a slot (waiting in the bounded queue if needed); raises AdmissionRejected."""
+        start = time.monotonic()
+        with cls._cond:
+            if cls._per_user[user_id] >= Config.ADMISSION_PER_USER_MAX:
+                cls._reject('user_limit')
+            # A free slot is granted at once, whatever the queue length (woken waiters may not have run yet)
+            if cls._active >= Config.ADMISSION_MAX_CONCURRENT:
+                if cls._waiting >= Config.ADMISSION_QUEUE_MAX:
+                    cls._reject('queue_full')
+                cls._per_user[user_id] += 1
+                cls._waiting += 1
+                cls._stats['queued'] += 1
+                deadline = start + Config.ADMISSION_QUEUE_TIMEOUT_SECONDS
+                try:
+                    while cls._active >= Config.ADMISSION_MAX_CONCURRENT:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or not cls._cond.wait(remaining):
+                            if cls._active < Config.ADMISSION_MAX_CONCURRENT:
+                                break
+                            cls._drop_user(user_id)
+                            cls._reject('timeout')
+                finally:
+                    cls._waiting -= 1
+            else:
+                cls._per_user[user_id] += 1
+            cls._active += 1
+            cls._stats['admitted'] += 1
+            cls._stats['wait_ms_total'] += (time.monotonic() - start) * 1000.0
+        return time.monotonic()
+
+    @classmethod
+    def release(cls, user_id, acquired_at):
+        with cls._cond:
+            cls._active -= 1
+            cls._drop_user(user_id)
+            cls._hold_ewma = 0.8 * cls._hold_ewma + 0.2 * (time.monotonic() - acquired_at)
+            cls._cond.notify_all()  # Waiters whose deadline passed may have left; let every waiter re-check
+
+    @classmethod
+    @contextmanager
+    def slot(cls, user_id):
+        """Hold a slot for the duration of the block (no-op with ADMISSION_CONTROL off); raises AdmissionRejected."""
+        if not Config.ADMISSION_CONTROL:
+            yield
+            return
+        with tracing.span('admission_wait'):
+            acquired_at = cls.acquire(user_id)
+        try:
+            yield
+        finally:
+            cls.release(user_id, acquired_at)
+
+    @classmethod
+    def stats(cls):
+        with cls._cond:
+            out = dict(cls._stats)
+            out.update({
+                'active': cls._active,
+                'queue_depth': cls._waiting,
+                'users_in_flight': len(cls._per_user),
+                'max_concurrent': Config.ADMISSION_MAX_CONCURRENT,
+                'queue_max': Config.ADMISSION_QUEUE_MAX,
+                'per_user_max': Config.ADMISSION_PER_USER_MAX,
+                'mean_hold_s': round(cls._hold_ewma, 2),
+                'retry_after_s': cls._retry_after()
+            })
+        wait_total = out.pop('wait_ms_total')
+        out['mean_wait_ms'] = round(wait_total / out['admitted'], 1) if out['admitted'] else None
+        return out
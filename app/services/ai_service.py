@@ -1,12 +1,20 @@
-from huggingface_hub import InferenceClient
 from config import Config
 from flask import current_app
+from app.services.startup_profile import lazy_import
+from app.services.tracing import traced
 import time
 import logging
 
+
+def _inference_client(**kwargs):
+    # huggingface_hub is heavy; load it on the first model call, not at worker import
+    return lazy_import('huggingface_hub').InferenceClient(**kwargs)
+
+
 class AIService:
     @staticmethod
-    def get_embeddings(texts):
+    @traced('embed')
+    def get_embeddings(texts, timeout=30):
         if not texts:
             return []
             
@@ -15,7 +23,7 @@ class AIService:
         except Exception:
             token = None
             
-        client = InferenceClient(token=token or Config.HUGGINGFACE_API_TOKEN, timeout=30)  # Reduced timeout
+        client = _inference_client(token=token or Config.HUGGINGFACE_API_TOKEN, timeout=timeout)  # Query path passes a shorter one
         
         try:
             emb_model = current_app.config.get("HF_EMBEDDING_MODEL") if current_app else None
@@ -69,12 +77,13 @@ class AIService:
         return all_embeddings
 
     @staticmethod
+    @traced('llm')
     def generate_answer(question, context):
         try:
             token = current_app.config.get("HUGGINGFACE_API_TOKEN") if current_app else None
         except Exception:
             token = None
-        client = InferenceClient(token=token or Config.HUGGINGFACE_API_TOKEN, timeout=45)
+        client = _inference_client(token=token or Config.HUGGINGFACE_API_TOKEN, timeout=45)
         
         # Adaptive prompt that recognizes user instructions and attributes
         messages = [
@@ -152,6 +161,7 @@ class AIService:
             return f"Error generating answer: {e}"
 
     @staticmethod
+    @traced('llm')
     def generate_answer_from_website(question, context, source_url=""):
         """Answer only from the given website page content. Do not use external knowledge."""
         try:
@@ -159,7 +169,7 @@ class AIService:
                 token = current_app.config.get("HUGGINGFACE_API_TOKEN") if current_app else None
             except Exception:
                 token = None
-            client = InferenceClient(token=token or Config.HUGGINGFACE_API_TOKEN, timeout=45)
+            client = _inference_client(token=token or Config.HUGGINGFACE_API_TOKEN, timeout=45)
             
             # Adaptive prompt for website content
             messages = [
@@ -252,12 +262,13 @@ class AIService:
         return False
 
     @staticmethod
+    @traced('llm')
     def generate_smalltalk(text: str):
         try:
             token = current_app.config.get("HUGGINGFACE_API_TOKEN") if current_app else None
         except Exception:
             token = None
-        client = InferenceClient(token=token or Config.HUGGINGFACE_API_TOKEN, timeout=5)
+        client = _inference_client(token=token or Config.HUGGINGFACE_API_TOKEN, timeout=5)
         try:
             try:
                 model = current_app.config.get("HF_SMALLTALK_MODEL") if current_app else None
@@ -280,6 +291,7 @@ class AIService:
             return "Hello!"
 
     @staticmethod
+    @traced('caption')
     def generate_image_caption(image_bytes: bytes):
         """Generate a caption for an image using a VLM via Hugging Face API"""
         try:
@@ -292,7 +304,7 @@ class AIService:
         if not token:
             return " [Image: No caption available - API token missing] "
             
-        client = InferenceClient(token=token, timeout=10)
+        client = _inference_client(token=token, timeout=10)
         
         try:
             try:
@@ -0,0 +1,284 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import ChatMessage, ChatSession
+from config import Config
+
+_STOP = object()
+# How long an inline (queue full) write waits for earlier queued writes before going ahead anyway
+INLINE_ORDER_TIMEOUT = 30.0
+
+
+class ChatWriteBehind:
+    """
+    Write-behind persistence for chat sessions and messages. query() enqueues a
+    session upsert and a message insert and returns; a single writer thread
+    drains the queue in batches (one transaction per batch), so items are
+    written in enqueue order and a session always lands before its messages.
+    Timestamps are taken at enqueue time, not at write time.
+
+    Every write gets a sequence number; the writer publishes the highest seq
+    below which everything is committed. Readers of chat history call
+    wait_for_prior_writes() so writes enqueued before their request are visible,
+    without waiting on traffic that arrives afterwards.
+
+    Read-your-writes holds per worker process only: a history request served by
+    another worker can miss a turn for up to CHAT_WRITE_FLUSH_MS plus one batch.
+    Writes tolerate the resulting races: a message creates its session if that
+    row is not there yet, concurrent session inserts from two workers collapse
+    into one row, and queued (auto) titles never replace a title already set.
+
+    The queue is flushed at interpreter exit / gunicorn worker exit. With
+    CHAT_WRITE_BEHIND off, or when the queue is full, writes happen inline.
+    """
+    _lock = threading.Lock()
+    _queue = None
+    _thread = None
+    _app = None
+    _cond = threading.Condition()
+    _last_seq = 0  # Highest seq handed out
+    _committed_seq = 0  # Every seq <= this is written (or dropped after retries)
+    _finished = set()  # Finished seqs above _committed_seq (out-of-order inline writes)
+    _stats = {'enqueued': 0, 'written': 0, 'failed': 0, 'batches': 0, 'inline': 0, 'last_batch_ms': None}
+    # session_id -> (user_id, title): lets query() skip the ownership lookup for sessions it has seen
+    _known = OrderedDict()
+    _KNOWN_MAX = 10000
+
+    @classmethod
+    def start(cls, app):
+        with cls._lock:
+            if cls._thread is not None and cls._thread.is_alive():
+                return cls._thread
+            cls._app = app
+            cls._queue = queue.Queue(maxsize=Config.CHAT_WRITE_QUEUE_MAX)
+            cls._thread = threading.Thread(target=cls._run, daemon=True, name='chat-write-behind')
+            cls._thread.start()
+            atexit.register(cls.shutdown)
+            return cls._thread
+
+    @classmethod
+    def enabled(cls):
+        return cls._thread is not None and cls._thread.is_alive()
+
+    # --- session ownership cache ---
+
+    @classmethod
+    def known_session(cls, session_id):
+        with cls._lock:
+            return cls._known.get(session_id)
+
+    @classmethod
+    def remember_session(cls, session_id, user_id, title):
+        with cls._lock:
+            cls._known[session_id] = (user_id, title)
+            cls._known.move_to_end(session_id)
+            while len(cls._known) > cls._KNOWN_MAX:
+                cls._known.popitem(last=False)
+
+    @classmethod
+    def forget_session(cls, session_id):
+        with cls._lock:
+            cls._known.pop(session_id, None)
+
+    # --- sequence bookkeeping ---
+
+    @classmethod
+    def _next_seq(cls):
+        with cls._cond:
+            cls._last_seq += 1
+            return cls._last_seq
+
+    @classmethod
+    def _finish(cls, seqs):
+        with cls._cond:
+            cls._finished.update(seqs)
+            while cls._committed_seq + 1 in cls._finished:
+                cls._committed_seq += 1
+                cls._finished.discard(cls._committed_seq)
+            cls._cond.notify_all()
+
+    @classmethod
+    def _wait_committed(cls, seq, timeout):
+        with cls._cond:
+            return cls._cond.wait_for(lambda: cls._committed_seq >= seq, timeout)
+
+    # --- producers ---
+
+    @classmethod
+    def _submit(cls, kind, data):
+        seq = cls._next_seq()
+        if cls.enabled():
+            try:
+                # Backpressure: a saturated writer briefly blocks producers before they fall back to inline writes
+                cls._queue.put((seq, kind, data), timeout=5)
+                with cls._lock:
+                    cls._stats['enqueued'] += 1
+                return
+            except queue.Full:
+                logging.warning("Chat write-behind queue full; writing inline")
+                # Keep enqueue order: this request's session upsert may still be queued ahead of us
+                if not cls._wait_committed(seq - 1, INLINE_ORDER_TIMEOUT):
+                    logging.warning("Chat write-behind: earlier writes still pending; writing inline out of order")
+        # Disabled or saturated: apply in the caller's session (inline, as before)
+        try:
+            cls._apply(kind, data)
+            db.session.commit()
+        finally:
+            cls._finish([seq])
+        with cls._lock:
+            cls._stats['inline'] += 1
+
+    @classmethod
+    def save_session(cls, session_id, user_id, title, set_title=True):
+        """
+        Upsert a chat session and bump updated_at. The title is only written when
+        set_title is true (new session / auto-title), and only onto a session
+        without a real title, so a rename is never overwritten with a cached title.
+        """
+        cls.remember_session(session_id, user_id, title)
+        cls._submit('session', {
+            'id': session_id, 'user_id': user_id, 'title': title if set_title else None, 'updated_at': datetime.utcnow()
+        })
+
+    @classmethod
+    def save_message(cls, **fields):
+        """Insert a ChatMessage (fields as for the model)."""
+        fields.setdefault('created_at', datetime.utcnow())
+        cls._submit('message', fields)
+
+    # --- writer ---
+
+    @classmethod
+    def _upsert_session(cls, session_id, user_id, title, updated_at):
+        sess = db.session.get(ChatSession, session_id)
+        if sess is None:
+            try:
+                # Savepoint: another worker may insert the same session concurrently
+                with db.session.begin_nested():
+                    db.session.add(ChatSession(id=session_id, user_id=user_id, title=title or 'New Chat',
+                                               created_at=updated_at, updated_at=updated_at))
+                return
+            except IntegrityError:
+                sess = db.session.get(ChatSession, session_id)
+                if sess is None:
+                    raise
+        if title and (not sess.title or sess.title == 'New Chat'):
+            sess.title = title
+        if not sess.updated_at or sess.updated_at < updated_at:
+            sess.updated_at = updated_at
+
+    @classmethod
+    def _apply(cls, kind, data):
+        if kind == 'session':
+            cls._upsert_session(data['id'], data['user_id'], data['title'], data['updated_at'])
+            db.session.flush()  # Messages in the same batch reference it
+        elif kind == 'message':
+            sid = data.get('session_id')
+            if sid and db.session.get(ChatSession, sid) is None:
+                # Its session upsert was dropped or is queued on another worker; don't break the foreign key
+                known = cls.known_session(sid)
+                cls._upsert_session(sid, data['user_id'], known[1] if known else None, data['created_at'])
+                db.session.flush()
+            db.session.add(ChatMessage(**data))
+
+    @classmethod
+    def _write_batch(cls, batch):
+        start = time.perf_counter()
+        try:
+            for _, kind, data in batch:
+                cls._apply(kind, data)
+            db.session.commit()
+            written, failed = len(batch), 0
+        except Exception as e:
+            db.session.rollback()
+            logging.warning(f"Chat write-behind batch of {len(batch)} failed ({e}); retrying items one by one")
+            written = failed = 0
+            for _, kind, data in batch:
+                try:
+                    cls._apply(kind, data)
+                    db.session.commit()
+                    written += 1
+                except Exception as ie:
+                    db.session.rollback()
+                    failed += 1
+                    logging.error(f"Dropping chat {kind} write: {ie}")
+        with cls._lock:
+            cls._stats['written'] += written
+            cls._stats['failed'] += failed
+            cls._stats['batches'] += 1
+            cls._stats['last_batch_ms'] = round((time.perf_counter() - start) * 1000, 1)
+
+    @classmethod
+    def _run(cls):
+        max_batch = Config.CHAT_WRITE_BATCH_MAX
+        linger = Config.CHAT_WRITE_FLUSH_MS / 1000.0
+        while True:
+            item = cls._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            stop = False
+            # Collect whatever else arrives within the linger window, up to max_batch
+            deadline = time.monotonic() + linger
+            while len(batch) < max_batch:
+                try:
+                    nxt = cls._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if nxt is _STOP:
+                    stop = True
+                    break
+                batch.append(nxt)
+            with cls._app.app_context():
+                try:
+                    cls._write_batch(batch)
+                finally:
+                    db.session.remove()
+                    cls._finish([seq for seq, _, _ in batch])
+            if stop:
+                return
+
+    @classmethod
+    def wait_for_prior_writes(cls, timeout=2.0):
+        """
+        Block until every write this worker enqueued before the call is committed
+        (or timeout). Writes enqueued afterwards are not waited for. True if caught up.
+        """
+        if not cls.enabled():
+            return True
+        with cls._cond:
+            target = cls._last_seq
+        return cls._wait_committed(target, timeout)
+
+    @classmethod
+    def shutdown(cls, timeout=10.0):
+        """Flush pending writes and stop the writer (atexit / gunicorn worker_exit)."""
+        thread = cls._thread
+        if thread is None or not thread.is_alive():
+            return
+        pending = cls._queue.qsize()
+        try:
+            cls._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logging.error(f"Chat write-behind: queue still full at shutdown, {pending} writes may be lost")
+            return
+        thread.join(timeout)
+        logging.info(f"Chat write-behind flushed {pending} pending writes on shutdown")
+
+    @classmethod
+    def stats(cls):
+        with cls._lock:
+            out = dict(cls._stats)
+        with cls._cond:
+            out['last_seq'] = cls._last_seq
+            out['committed_seq'] = cls._committed_seq
+        out['enabled'] = cls.enabled()
+        out['queue_depth'] = cls._queue.qsize() if cls._queue is not None else 0
+        out['queue_max'] = Config.CHAT_WRITE_QUEUE_MAX
+        return out
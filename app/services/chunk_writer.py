@@ -0,0 +1,43 @@
+from app import db
+from app.models import DocumentChunk
+from sqlalchemy import insert
+import logging
+
+# Rows per INSERT ... RETURNING round trip
+BULK_INSERT_BATCH = 500
+
+
+def bulk_insert_chunks(document_id, texts, start_index=0, batch_size=BULK_INSERT_BATCH):
+    """
+    Insert chunk rows for one document with set-based INSERT ... RETURNING batches.
+    Returns the new chunk IDs in the same order as `texts` so callers can key
+    vector metadata by real chunk IDs without re-querying document_chunks.
+    The caller owns the transaction (commit/rollback).
+    """
+    if not texts:
+        return []
+
+    table = DocumentChunk.__table__
+    rows = [{
+        'document_id': document_id,
+        'chunk_text': t,
+        'chunk_index': start_index + i
+    } for i, t in enumerate(texts)]
+
+    dialect = db.session.get_bind().dialect
+    ids = []
+
+    if getattr(dialect, 'insert_executemany_returning_sort_by_parameter_order', False):
+        # Postgres (psycopg2) and SQLite >= 3.35: one multi-VALUES statement per batch
+        stmt = insert(table).returning(table.c.id, sort_by_parameter_order=True)
+        for i in range(0, len(rows), batch_size):
+            result = db.session.execute(stmt, rows[i:i + batch_size])
+            ids.extend(r[0] for r in result)
+    else:
+        # Older drivers: still one statement per row, but no ORM unit-of-work and no re-query
+        logging.info(f"Dialect {dialect.name} lacks executemany RETURNING, inserting chunks row by row")
+        stmt = insert(table).returning(table.c.id)
+        for row in rows:
+            ids.append(db.session.execute(stmt, row).scalar_one())
+
+    return ids
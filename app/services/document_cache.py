@@ -0,0 +1,96 @@
+import logging
+import threading
+from collections import namedtuple
+from app import db
+from app.models import Document
+from app.services.tracing import span
+
+# Read-only snapshot of the Document columns the query path needs (safe to share across requests/threads)
+DocMeta = namedtuple('DocMeta', 'id filename file_path url doc_type course semester subject status')
+
+
+def _to_meta(row, supa):
+    doc_id, filename, file_path, doc_type, course, semester, subject, status = row
+    url = None
+    if file_path:
+        if file_path.startswith(('http://', 'https://')):
+            url = file_path  # Web sources store their URL directly
+        elif supa is not None:
+            url = supa.get_public_url(file_path)
+    return DocMeta(doc_id, filename, file_path, url, doc_type or 'syllabus', course, semester, subject, status)
+
+
+class DocumentMetaCache:
+    """
+    Per-worker cache of document metadata keyed by doc_id, so /api/query resolves
+    doc_type, filters and source links without touching the documents table.
+    Loaded once on first use; writers invalidate entries through
+    IndexChangeFeed.record(), and other workers invalidate when they apply the
+    same change. Misses (e.g. a document newer than the cache) load just that row.
+    """
+    _lock = threading.Lock()
+    _docs = None  # doc_id -> DocMeta, or None for a cached miss
+    _version = 0
+
+    _COLUMNS = (Document.id, Document.filename, Document.file_path, Document.doc_type,
+                Document.course, Document.semester, Document.subject, Document.status)
+
+    @staticmethod
+    def _supabase_or_none():
+        try:
+            from app.services.supabase_service import SupabaseService
+            return SupabaseService()
+        except Exception:
+            return None
+
+    @classmethod
+    def _ensure_loaded(cls):
+        if cls._docs is not None:
+            return cls._docs
+        with cls._lock:
+            if cls._docs is None:
+                with span('doc_meta_load'):
+                    supa = cls._supabase_or_none()
+                    rows = db.session.query(*cls._COLUMNS).all()
+                    cls._docs = {row[0]: _to_meta(row, supa) for row in rows}
+                logging.info(f"Document metadata cache loaded: {len(cls._docs)} documents (version {cls._version})")
+            return cls._docs
+
+    @classmethod
+    def get(cls, doc_id):
+        """DocMeta for doc_id, or None if it does not exist."""
+        if doc_id is None:
+            return None
+        docs = cls._ensure_loaded()
+        if doc_id in docs:
+            return docs[doc_id]
+        version = cls._version
+        row = db.session.query(*cls._COLUMNS).filter(Document.id == doc_id).first()
+        meta = _to_meta(row, cls._supabase_or_none()) if row else None
+        with cls._lock:
+            # Don't resurrect an entry invalidated while we were reading it
+            if cls._docs is docs and cls._version == version:
+                docs[doc_id] = meta
+        return meta
+
+    @classmethod
+    def all(cls):
+        return [m for m in cls._ensure_loaded().values() if m is not None]
+
+    @classmethod
+    def by_type(cls, doc_type, status='processed'):
+        return [m for m in cls.all() if m.doc_type == doc_type and (status is None or m.status == status)]
+
+    @classmethod
+    def invalidate(cls, doc_id=None):
+        """Bump the version; drop one document's entry, or everything when doc_id is None."""
+        with cls._lock:
+            cls._version += 1
+            if doc_id is None:
+                cls._docs = None
+            elif cls._docs is not None:
+                cls._docs.pop(doc_id, None)
+
+    @classmethod
+    def version(cls):
+        return cls._version
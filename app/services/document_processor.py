@@ -1,10 +1,89 @@
 import os
-import pypdf
-from docx import Document as DocxDocument
-from pptx import Presentation
+import math
+import hashlib
+import logging
 from io import BytesIO
+from config import Config
+from app.services.startup_profile import lazy_import
+
+
+class CaptionPolicy:
+    """
+    Decides which embedded PDF images are worth a BLIP caption.
+    - Thumbnail-sized images and flat (low-entropy) graphics are never captioned.
+    - Images on text-sparse pages are captioned inline ('now').
+    - Images on pages that already have plenty of text are low priority ('defer')
+      and are captioned after the document's text has been indexed; when the
+      caller cannot defer (can_defer=False) they are captioned inline instead.
+    - At most `max_captions` images per document are captioned in total.
+    """
+    NOW = 'now'
+    DEFER = 'defer'
+    SKIP = 'skip'
+
+    def __init__(self, sparse_page_chars=None, min_side=None, min_entropy=None, max_captions=None, can_defer=True):
+        self.sparse_page_chars = Config.CAPTION_SPARSE_PAGE_CHARS if sparse_page_chars is None else sparse_page_chars
+        self.min_side = Config.CAPTION_MIN_IMAGE_SIDE if min_side is None else min_side
+        self.min_entropy = Config.CAPTION_MIN_ENTROPY if min_entropy is None else min_entropy
+        self.max_captions = Config.CAPTION_MAX_PER_DOC if max_captions is None else max_captions
+        self.can_defer = can_defer
+        self.scheduled = 0
+        self.stats = {'now': 0, 'deferred': 0, 'skipped_small': 0, 'skipped_flat': 0, 'skipped_budget': 0}
+
+    @staticmethod
+    def _image_profile(data: bytes):
+        """Return (width, height, entropy in bits) or None if the image cannot be decoded."""
+        try:
+            from PIL import Image
+            img = Image.open(BytesIO(data))
+            width, height = img.size
+            gray = img.convert('L')
+            gray.thumbnail((128, 128))
+            hist = gray.histogram()
+            total = float(sum(hist)) or 1.0
+            entropy = -sum((c / total) * math.log2(c / total) for c in hist if c)
+            return width, height, entropy
+        except Exception:
+            return None
+
+    def classify(self, page_text: str, data: bytes) -> str:
+        profile = self._image_profile(data)
+        if profile:
+            width, height, entropy = profile
+            if min(width, height) < self.min_side:
+                self.stats['skipped_small'] += 1
+                return self.SKIP
+            if entropy < self.min_entropy:
+                self.stats['skipped_flat'] += 1
+                return self.SKIP
+        if self.scheduled >= self.max_captions:
+            self.stats['skipped_budget'] += 1
+            return self.SKIP
+        self.scheduled += 1
+        if not self.can_defer or len((page_text or '').strip()) < self.sparse_page_chars:
+            self.stats['now'] += 1
+            return self.NOW
+        self.stats['deferred'] += 1
+        return self.DEFER
+
 
 class DocumentProcessor:
+    # Bump when extraction/captioning or chunking output changes so cached payloads are re-derived
+    EXTRACTOR_VERSION = '2'
+    CHUNKER_VERSION = '1'
+    DEFAULT_CHUNK_SIZE = 512
+    DEFAULT_CHUNK_OVERLAP = 50
+
+    @staticmethod
+    def pipeline_version():
+        """Extraction-cache key prefix: changes whenever extraction, chunking or the image caption policy would."""
+        # Caption policy settings decide which images get captioned into the text; the model decides what they say
+        policy = (f"{Config.CAPTION_SPARSE_PAGE_CHARS}|{Config.CAPTION_MIN_IMAGE_SIDE}|{Config.CAPTION_MIN_ENTROPY}"
+                  f"|{Config.CAPTION_MAX_PER_DOC}|{Config.HF_IMAGE_CAPTION_MODEL}")
+        return (f"x{DocumentProcessor.EXTRACTOR_VERSION}-c{DocumentProcessor.CHUNKER_VERSION}"
+                f"-{DocumentProcessor.DEFAULT_CHUNK_SIZE}-{DocumentProcessor.DEFAULT_CHUNK_OVERLAP}"
+                f"-p{hashlib.sha1(policy.encode('utf-8')).hexdigest()[:8]}")
+
     @staticmethod
     def _sanitize_text(text: str) -> str:
         """Remove NUL bytes and other problematic characters from text"""
@@ -36,11 +115,16 @@ class DocumentProcessor:
         return DocumentProcessor._sanitize_text(text)
 
     @staticmethod
-    def extract_text_from_bytes(file_bytes: bytes, filename: str):
+    def extract_text_from_bytes(file_bytes: bytes, filename: str, deferred_images=None):
+        """
+        deferred_images: optional list that receives {'page': n, 'data': bytes} for
+        low-priority PDF images to caption later (see caption_deferred_images).
+        Without it, low-priority images are captioned inline (within the same budget).
+        """
         ext = os.path.splitext(filename)[1].lower()
         bio = BytesIO(file_bytes)
         if ext == '.pdf':
-            text = DocumentProcessor._extract_pdf_bytes(bio)
+            text = DocumentProcessor._extract_pdf_bytes(bio, deferred_images)
         elif ext == '.docx':
             text = DocumentProcessor._extract_docx_bytes(bio)
         elif ext == '.pptx':
@@ -52,54 +136,63 @@ class DocumentProcessor:
 
     @staticmethod
     def _extract_from_pdf(file_path):
-        from app.services.ai_service import AIService
-        text = ""
         with open(file_path, 'rb') as f:
-            reader = pypdf.PdfReader(f)
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-                # Multimodal Image Captioning
-                try:
-                    if hasattr(page, 'images') and page.images:
-                        for img in page.images:
-                             # img.data contains the bytes
-                             caption = AIService.generate_image_caption(img.data)
-                             text += caption + "\n"
-                except Exception as e:
-                     # Non-blocking error for image extraction
-                     print(f"Warning: Failed to extract images from PDF page: {e}")
-        return text
+            return DocumentProcessor._extract_pdf_reader(lazy_import('pypdf').PdfReader(f))
 
     @staticmethod
-    def _extract_pdf_bytes(bio: BytesIO):
+    def _extract_pdf_bytes(bio: BytesIO, deferred_images=None):
+        return DocumentProcessor._extract_pdf_reader(lazy_import('pypdf').PdfReader(bio), deferred_images)
+
+    @staticmethod
+    def _extract_pdf_reader(reader, deferred_images=None):
         from app.services.ai_service import AIService
+        policy = CaptionPolicy(can_defer=deferred_images is not None)
         text = ""
-        reader = pypdf.PdfReader(bio)
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-            # Multimodal Image Captioning
+        for page_num, page in enumerate(reader.pages, start=1):
+            page_text = page.extract_text() or ""
+            text += page_text + "\n"
+            # Multimodal Image Captioning (budgeted, see CaptionPolicy)
             try:
                 if hasattr(page, 'images') and page.images:
                     for img in page.images:
-                         caption = AIService.generate_image_caption(img.data)
-                         text += caption + "\n"
+                        # img.data contains the bytes
+                        decision = policy.classify(page_text, img.data)
+                        if decision == CaptionPolicy.NOW:
+                            caption = AIService.generate_image_caption(img.data)
+                            text += caption + "\n"
+                        elif decision == CaptionPolicy.DEFER:
+                            deferred_images.append({'page': page_num, 'data': img.data})
             except Exception as e:
-                 print(f"Warning: Failed to extract images from PDF page: {e}")
+                # Non-blocking error for image extraction
+                print(f"Warning: Failed to extract images from PDF page: {e}")
+        logging.info(f"Caption policy: {policy.stats}")
         return text
 
+    @staticmethod
+    def caption_deferred_images(deferred_images):
+        """Caption low-priority images queued during extraction. Returns one text per captioned image."""
+        from app.services.ai_service import AIService
+        texts = []
+        for item in deferred_images or []:
+            caption = AIService.generate_image_caption(item['data'])
+            if 'Caption generation failed' in caption or 'No caption available' in caption:
+                continue
+            texts.append(DocumentProcessor._sanitize_text(f"[Image on page {item['page']}]{caption}".strip()))
+        return texts
+
     @staticmethod
     def _extract_from_docx(file_path):
-        doc = DocxDocument(file_path)
+        doc = lazy_import('docx').Document(file_path)
         return "\n".join([para.text for para in doc.paragraphs])
 
     @staticmethod
     def _extract_docx_bytes(bio: BytesIO):
-        doc = DocxDocument(bio)
+        doc = lazy_import('docx').Document(bio)
         return "\n".join([para.text for para in doc.paragraphs])
 
     @staticmethod
     def _extract_from_pptx(file_path):
-        prs = Presentation(file_path)
+        prs = lazy_import('pptx').Presentation(file_path)
         text = ""
         for slide in prs.slides:
             for shape in slide.shapes:
@@ -109,7 +202,7 @@ class DocumentProcessor:
 
     @staticmethod
     def _extract_pptx_bytes(bio: BytesIO):
-        prs = Presentation(bio)
+        prs = lazy_import('pptx').Presentation(bio)
         text = ""
         for slide in prs.slides:
             for shape in slide.shapes:
@@ -118,7 +211,7 @@ class DocumentProcessor:
         return text
 
     @staticmethod
-    def chunk_text(text, chunk_size=512, overlap=50):
+    def chunk_text(text, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_CHUNK_OVERLAP):
         # Simple character/word based chunking for MVP
         # Ideally use tiktoken or similar for token-based
         words = text.split()
@@ -0,0 +1,59 @@
+import hashlib
+import json
+import logging
+from app.services.document_processor import DocumentProcessor
+
+
+class ExtractionCache:
+    """
+    Content-addressed cache of extracted chunk payloads in Supabase Storage.
+    Entries live under chunks/cache/<pipeline version>/<sha256>.json so bumping
+    DocumentProcessor.EXTRACTOR_VERSION or CHUNKER_VERSION invalidates them.
+    """
+    PREFIX = 'chunks/cache'
+
+    @staticmethod
+    def content_hash(file_bytes: bytes) -> str:
+        return hashlib.sha256(file_bytes or b'').hexdigest()
+
+    @staticmethod
+    def _path(content_hash: str) -> str:
+        return f"{ExtractionCache.PREFIX}/{DocumentProcessor.pipeline_version()}/{content_hash}.json"
+
+    @staticmethod
+    def build_payload(content_hash, chunks, doc_id=None):
+        return {
+            'content_hash': content_hash,
+            'pipeline_version': DocumentProcessor.pipeline_version(),
+            'doc_id': doc_id,
+            'chunks': [{'chunk_index': i, 'text': t} for i, t in enumerate(chunks)]
+        }
+
+    @staticmethod
+    def load(supa, content_hash):
+        """Return the cached chunk texts for this content, or None on a miss/stale entry."""
+        try:
+            raw = supa.download_file(ExtractionCache._path(content_hash))
+        except Exception:
+            return None
+        try:
+            payload = json.loads(raw.decode('utf-8'))
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable extraction cache entry {content_hash}: {e}")
+            return None
+        if payload.get('content_hash') != content_hash or payload.get('pipeline_version') != DocumentProcessor.pipeline_version():
+            return None
+        chunks = payload.get('chunks') or []
+        return [c.get('text', '') for c in sorted(chunks, key=lambda c: c.get('chunk_index', 0))]
+
+    @staticmethod
+    def store(supa, content_hash, chunks, doc_id=None, cache=True):
+        """
+        Upload the per-document audit copy (chunks/<doc_id>.json) and, unless the
+        payload came from the cache already, the content-addressed cache entry.
+        """
+        body = json.dumps(ExtractionCache.build_payload(content_hash, chunks, doc_id)).encode('utf-8')
+        if doc_id is not None:
+            supa.upload_file(body, f"chunks/{doc_id}.json", content_type="application/json")
+        if cache:
+            supa.upload_file(body, ExtractionCache._path(content_hash), content_type="application/json")
@@ -1,102 +1,557 @@
 from app.services.vector_store import VectorStore
-from app.models import DocumentChunk
+from app.models import DocumentChunk, Document
 from app import db
-from app.services.ai_service import AIService
+from config import Config
+import json
 import logging
+import os
+import queue
+import threading
+import time
 
-def rebuild_index_from_db():
-    """Rebuild the vector index from database documents on app startup"""
+# Chunks read, embedded and indexed per round trip; peak memory is bounded by this
+REBUILD_BATCH_SIZE = 64
+
+# End-of-stream marker passed between pipeline stages
+_DONE = object()
+
+
+class RebuildProgress:
+    """
+    Progress, throughput and ETA of the current (or last) rebuild, for the admin
+    dashboard. The rebuild runs in whichever worker took the admin request, so
+    every update is also published (with that worker's pid) to progress.json in
+    REBUILD_CHECKPOINT_DIR; snapshot() on any other worker reads it from there.
+    """
+    _lock = threading.Lock()
+    _state = {'status': 'idle', 'processed': 0, 'total': 0, 'resumed_from': 0, 'started_at': None, 'finished_at': None, 'error': None, 'stages': None}
+
+    @staticmethod
+    def _shared_path():
+        return os.path.join(Config.REBUILD_CHECKPOINT_DIR, 'progress.json')
+
+    @classmethod
+    def _update(cls, **fields):
+        with cls._lock:
+            cls._state.update(fields)
+            cls._state['pid'] = os.getpid()
+            state = dict(cls._state)
+        cls._publish(state)
+
+    @classmethod
+    def _publish(cls, state):
+        """Best effort: a failed write only means other workers see stale progress."""
+        path = cls._shared_path()
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError) as e:
+            logging.debug(f"Could not publish rebuild progress: {e}")
+
+    @classmethod
+    def _read_shared(cls):
+        try:
+            with open(cls._shared_path()) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get('status') == 'running' and not _pid_alive(state.get('pid')):
+            # The rebuilding worker died mid-run (the checkpoint lets the next rebuild resume)
+            state['status'] = 'interrupted'
+        return state
+
+    @classmethod
+    def is_running(cls):
+        with cls._lock:
+            if cls._state['status'] == 'running':
+                return True
+        shared = cls._read_shared()
+        return bool(shared) and shared['status'] == 'running'
+
+    @classmethod
+    def snapshot(cls):
+        with cls._lock:
+            state = dict(cls._state)
+        shared = cls._read_shared()
+        # Prefer whichever run started last: this worker's own, or the one another worker published
+        if shared and (state['status'] == 'idle' or (shared.get('started_at') or 0) > (state['started_at'] or 0)):
+            state = dict(cls._state, **shared)
+        state.setdefault('pid', None)
+        total, processed = state['total'] or 0, state['processed'] or 0
+        state['percent'] = round(100.0 * processed / total, 1) if total else 0.0
+        state['rate_per_s'] = None
+        state['eta_s'] = None
+        if state['started_at']:
+            end = state['finished_at'] or time.time()
+            elapsed = max(end - state['started_at'], 1e-6)
+            state['elapsed_s'] = round(elapsed, 1)
+            # Rate only counts work done in this run, not chunks restored from a checkpoint
+            rate = (processed - state['resumed_from']) / elapsed
+            state['rate_per_s'] = round(rate, 1)
+            if state['status'] == 'running' and rate > 0:
+                state['eta_s'] = round(max(total - processed, 0) / rate, 1)
+        return state
+
+
+class StageStats:
+    """Throughput counters for one rebuild pipeline stage (shared by its worker threads)."""
+
+    def __init__(self, name, workers=1):
+        self.name = name
+        self.workers = workers
+        self.batches = 0
+        self.items = 0
+        self.busy_s = 0.0     # Time spent doing the stage's work
+        self.blocked_s = 0.0  # Time spent waiting on a full downstream queue (backpressure)
+        self.idle_s = 0.0     # Time spent waiting on an empty upstream queue (starved)
+        self._lock = threading.Lock()
+
+    def record(self, items, busy, blocked=0.0, idle=0.0):
+        with self._lock:
+            self.batches += 1
+            self.items += items
+            self.busy_s += busy
+            self.blocked_s += blocked
+            self.idle_s += idle
+
+    def add_idle(self, seconds):
+        with self._lock:
+            self.idle_s += seconds
+
+    def to_dict(self, wall_s):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'batches': self.batches,
+                'items': self.items,
+                'busy_s': round(self.busy_s, 2),
+                'blocked_s': round(self.blocked_s, 2),
+                'idle_s': round(self.idle_s, 2),
+                'items_per_s': round(self.items / wall_s, 1) if wall_s > 0 else None,
+                'utilization': round(self.busy_s / (wall_s * self.workers), 2) if wall_s > 0 else None
+            }
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # Exists but owned by someone else
+    return True
+
+
+def _put(q, item, stop):
+    """Blocking put that gives up once stop is set. Returns seconds spent blocked."""
+    start = time.perf_counter()
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            break
+        except queue.Full:
+            continue
+    return time.perf_counter() - start
+
+
+def _get(q, stop):
+    """Blocking get that gives up (returning _DONE) once stop is set. Returns (item, seconds waited)."""
+    start = time.perf_counter()
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.5), time.perf_counter() - start
+        except queue.Empty:
+            continue
+    return _DONE, time.perf_counter() - start
+
+
+def pipelined_batches(app, stats, batch_size=REBUILD_BATCH_SIZE, after_id=0, workers=None, depth=None):
+    """
+    Overlap DB reads, embedding and indexing: one reader thread streams chunk
+    batches into a bounded queue, `workers` embedder threads call the embedding
+    API concurrently and feed a second bounded queue, and the calling thread
+    (the single index writer) consumes the generator. Full queues block the
+    upstream stage, so at most ~2*depth+workers batches are in flight.
+
+    Yields (batch, embeddings) in chunk-ID order (embeddings is None for a
+    batch that failed to embed), so checkpoints only ever advance past
+    contiguous work. stats maps 'read'/'embed'/'write' to StageStats.
+    """
+    from app.services.ai_service import AIService
+    workers = workers or Config.REBUILD_EMBED_WORKERS
+    depth = depth or Config.REBUILD_QUEUE_DEPTH
+    read_q = queue.Queue(maxsize=depth)
+    embed_q = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    errors = []
+
+    def reader():
+        with app.app_context():
+            try:
+                seq = 0
+                batches = iter_chunk_batches(batch_size, after_id=after_id)
+                while not stop.is_set():
+                    t0 = time.perf_counter()
+                    batch = next(batches, None)
+                    busy = time.perf_counter() - t0
+                    if batch is None:
+                        break
+                    blocked = _put(read_q, (seq, batch), stop)
+                    stats['read'].record(len(batch), busy, blocked)
+                    seq += 1
+            except Exception as e:
+                errors.append(e)
+                logging.error(f"Rebuild reader failed: {e}", exc_info=True)
+            finally:
+                db.session.remove()
+                for _ in range(workers):
+                    _put(read_q, _DONE, stop)
+
+    def embedder():
+        with app.app_context():
+            while True:
+                item, idle = _get(read_q, stop)
+                if item is _DONE:
+                    break
+                seq, batch = item
+                t0 = time.perf_counter()
+                try:
+                    embeddings = AIService.get_embeddings([m['text'] for m in batch])
+                    if len(embeddings) != len(batch):
+                        raise ValueError(f"expected {len(batch)} embeddings, got {len(embeddings)}")
+                except Exception as e:
+                    embeddings = None
+                    logging.error(f"Failed to embed batch ending at chunk {batch[-1]['chunk_id']}: {e}")
+                busy = time.perf_counter() - t0
+                blocked = _put(embed_q, (seq, batch, embeddings), stop)
+                stats['embed'].record(len(batch), busy, blocked, idle)
+            _put(embed_q, _DONE, stop)
+
+    threads = [threading.Thread(target=reader, daemon=True, name='rebuild-reader')]
+    threads += [threading.Thread(target=embedder, daemon=True, name=f'rebuild-embed-{i}') for i in range(workers)]
+    for t in threads:
+        t.start()
+
+    # Embedders finish out of order; hold results until the next batch in sequence arrives
+    pending = {}
+    next_seq = 0
+    finished = 0
+    try:
+        while finished < workers:
+            item, idle = _get(embed_q, stop)
+            stats['write'].add_idle(idle)
+            if item is _DONE:
+                finished += 1
+                continue
+            seq, batch, embeddings = item
+            pending[seq] = (batch, embeddings)
+            while next_seq in pending:
+                yield pending.pop(next_seq)
+                next_seq += 1
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()
+        for t in threads:
+            t.join(timeout=5)
+
+
+def _supabase_or_none():
+    try:
+        from app.services.supabase_service import SupabaseService
+        return SupabaseService()
+    except Exception:
+        return None
+
+
+def _chunk_query():
+    return db.session.query(
+        DocumentChunk.id,
+        DocumentChunk.document_id,
+        DocumentChunk.chunk_text,
+        Document.doc_type,
+        Document.filename,
+        Document.file_path
+    ).outerjoin(Document, DocumentChunk.document_id == Document.id)
+
+
+def _source_page_url(text):
+    """Page URL from the '[Source: <url>]' line web chunks start with, else None."""
+    if text and text.startswith('[Source: '):
+        end = text.find(']', 9)
+        if end > 9:
+            return text[9:end]
+    return None
+
+
+def _rows_to_metadata(rows, supa, public_urls):
+    """Turn (chunk, document) rows into index metadata dicts; public_urls caches one URL per document."""
+    batch = []
+    for chunk_id, doc_id, text, doc_type, filename, file_path in rows:
+        url = None
+        if file_path:
+            if file_path.startswith(('http://', 'https://')):
+                # Web sources store the site URL; each chunk names the page it came from
+                url = _source_page_url(text) or file_path
+            elif supa is not None:
+                if doc_id not in public_urls:
+                    public_urls[doc_id] = supa.get_public_url(file_path)
+                url = public_urls[doc_id]
+        batch.append({
+            'text': text,
+            'doc_id': doc_id,
+            'chunk_id': chunk_id,
+            'doc_type': doc_type or 'syllabus',
+            'filename': filename,
+            'url': url
+        })
+    return batch
+
+
+def iter_chunk_batches(batch_size=REBUILD_BATCH_SIZE, after_id=0):
+    """
+    Stream document chunks joined to their document metadata using keyset
+    pagination on chunk ID. Yields lists of index metadata dicts; only one
+    batch of rows is held in memory at a time.
+    """
+    last_id = after_id
+    public_urls = {}
+    supa = _supabase_or_none()
+
+    while True:
+        rows = _chunk_query()\
+         .filter(DocumentChunk.id > last_id)\
+         .order_by(DocumentChunk.id)\
+         .limit(batch_size)\
+         .all()
+        if not rows:
+            return
+
+        yield _rows_to_metadata(rows, supa, public_urls)
+        last_id = rows[-1][0]
+        if len(rows) < batch_size:
+            return
+
+
+def iter_chunk_batches_by_id(chunk_ids, batch_size=REBUILD_BATCH_SIZE):
+    """Like iter_chunk_batches, but only for the given chunk IDs (used by reconciliation)."""
+    ids = sorted(chunk_ids)
+    public_urls = {}
+    supa = _supabase_or_none()
+    for start in range(0, len(ids), batch_size):
+        rows = _chunk_query()\
+         .filter(DocumentChunk.id.in_(ids[start:start + batch_size]))\
+         .order_by(DocumentChunk.id)\
+         .all()
+        if rows:
+            yield _rows_to_metadata(rows, supa, public_urls)
+
+
+def rebuild_index_from_db(batch_size=REBUILD_BATCH_SIZE, progress_cb=None, resume=True):
+    """
+    Rebuild the vector index from the database, streaming chunks batch by batch
+    (read -> embed -> add) so peak memory stays flat regardless of corpus size.
+    Shared by app startup and the admin rebuild route. Returns a stats dict.
+    progress_cb(processed, total) is called after every batch.
+
+    Reads, embedding and index writes run as an overlapped pipeline
+    (pipelined_batches); per-stage throughput is reported in result['stages'].
+
+    Each embedded batch is checkpointed to disk (RebuildCheckpoint); with
+    resume=True an interrupted rebuild restores those vectors and continues
+    after the last checkpointed chunk instead of re-embedding from zero.
+
+    The new index is built as a shadow generation while the live one keeps
+    serving; it replaces the live index only after validate_generation passes.
+    """
     print("🔄 Rebuilding vector index from database...")
     logging.info("Starting vector index rebuild from database")
+    from flask import current_app
+    from app.services.index_sync import IndexChangeFeed
+    from app.services.rebuild_checkpoint import RebuildCheckpoint
 
+    checkpoint = RebuildCheckpoint()
+    use_checkpoint = checkpoint.acquire()  # Another process may already be checkpointing
+    RebuildProgress._update(status='running', processed=0, total=0, resumed_from=0, started_at=time.time(), finished_at=None, error=None, stages=None)
     try:
-        # Query all document chunks from the database
-        chunks = DocumentChunk.query.all()
+        total_chunks = DocumentChunk.query.count()
+        print(f"Found {total_chunks} chunks in database")
+        logging.info(f"Found {total_chunks} document chunks to index")
+
+        # Get the singleton vector store instance
+        vector_store = VectorStore.get_instance()
+        
+        # Build the new generation off to the side; the live index keeps answering queries
+        shadow = VectorStore.create_shadow()
 
-        if not chunks:
+        state = checkpoint.restore(shadow) if use_checkpoint and resume else None
+        if state:
+            # Changes logged since the original start are replayed by the change feed (idempotently)
+            feed_seq = state['feed_seq']
+            after_id = state['last_chunk_id']
+            processed = min(state['processed'], total_chunks)
+            print(f"♻️ Resuming rebuild after chunk {after_id} ({state['vectors']} vectors restored from checkpoint)")
+            logging.info(f"Resuming rebuild after chunk {after_id} ({state['vectors']} vectors restored)")
+        else:
+            feed_seq = IndexChangeFeed.latest_seq()
+            after_id = 0
+            processed = 0
+            if use_checkpoint:
+                checkpoint.start(feed_seq, total_chunks)
+
+        result = {'total_chunks': total_chunks, 'processed': processed, 'resumed_from': processed, 'successful_batches': 0, 'failed_batches': 0}
+        RebuildProgress._update(processed=processed, total=total_chunks, resumed_from=processed)
+        if progress_cb:
+            progress_cb(processed, total_chunks)
+        if not total_chunks:
             print("⚠️ No chunks found in DB")
             logging.info("No document chunks found in database")
-            return
+            result['generation'] = vector_store.swap_in(shadow, keep_previous=Config.INDEX_KEEP_PREVIOUS_GENERATION)
+            IndexChangeFeed.replay_since(feed_seq)
+            if use_checkpoint:
+                checkpoint.discard()
+            RebuildProgress._update(status='done', finished_at=time.time())
+            return result
 
-        print(f"Found {len(chunks)} chunks in database")
-        logging.info(f"Found {len(chunks)} document chunks to index")
-
-        # 1. Fetch documents for metadata mapping
-        from app.models import Document
-        doc_map = {d.id: d for d in Document.query.all()}
-
-        # 2. Extract text content and metadata from chunks in a single pass
-        texts = []
-        metadatas = []
-        for c in chunks:
-            texts.append(c.chunk_text)
-            metadatas.append({
-                'text': c.chunk_text,
-                'doc_id': c.document_id,
-                'chunk_id': c.id,
-                'doc_type': doc_map[c.document_id].doc_type if c.document_id in doc_map else 'syllabus',
-                'filename': doc_map[c.document_id].filename if c.document_id in doc_map else None,
-                'page_num': getattr(c, 'page_num', None)
-            })
-
-        # 3. Get the singleton vector store instance
-        vector_store = VectorStore.get_instance()
-        
-        # Clear existing index and rebuild from database content
-        vector_store.clear()
-        
-        if texts:
-            total_chunks = len(texts)
-            print(f"Adding {total_chunks} texts to vector store in batches...")
-            logging.info(f"Adding {total_chunks} texts to vector store in batches...")
-            
-            # Optimized batch processing with larger batches and progress tracking
-            BATCH_SIZE = 64  # Increased from 32 for better throughput
-            successful_batches = 0
-            failed_batches = 0
-            
-            # Process in larger batches for better performance
-            for i in range(0, total_chunks, BATCH_SIZE):
-                batch_texts = texts[i:i + BATCH_SIZE]
-                batch_metas = metadatas[i:i + BATCH_SIZE]
-                
-                try:
-                    # Use the new add_texts method which handles embedding internally
-                    vector_store.add_texts(batch_texts, batch_metas)
-                    successful_batches += 1
-                    
-                    # Progress reporting every 5 batches instead of every batch
-                    if (i // BATCH_SIZE) % 5 == 0 or i + BATCH_SIZE >= total_chunks:
-                        progress = min(i + BATCH_SIZE, total_chunks)
-                        print(f"Progress: {progress}/{total_chunks} chunks processed ({successful_batches} batches successful)")
-                        logging.info(f"Progress: {progress}/{total_chunks} chunks processed")
-                        
-                except Exception as e:
-                    failed_batches += 1
-                    logging.error(f"Failed to process batch ending at index {i + BATCH_SIZE}: {e}")
-                    # Continue with remaining batches instead of stopping
-                    continue
-            
-            print(f"✅ Rebuilt index. Processed {successful_batches} batches successfully, {failed_batches} failed.")
-            logging.info(f"Successfully rebuilt vector index. {successful_batches} batches successful, {failed_batches} failed.")
-            
-            # Log final stats - THIS IS CRITICAL FOR DEBUGGING
-            stats = vector_store.get_stats()
-            print(f"📊 Final vector store stats: {stats}")
-            logging.info(f"Final vector store stats: {stats}")
-            
-            # Double-check that the index is actually populated
-            if stats['total_vectors'] > 0:
-                print(f"✅ Vector store is ready with {stats['total_vectors']} vectors")
-                logging.info(f"✅ Vector store is ready with {stats['total_vectors']} vectors")
-            else:
-                print("❌ WARNING: Vector store has 0 vectors after rebuild!")
-                logging.warning("❌ WARNING: Vector store has 0 vectors after rebuild!")
+        stage_stats = {
+            'read': StageStats('read'),
+            'embed': StageStats('embed', Config.REBUILD_EMBED_WORKERS),
+            'write': StageStats('write')
+        }
+        pipeline_start = time.perf_counter()
+        batches = pipelined_batches(current_app._get_current_object(), stage_stats, batch_size, after_id=after_id)
+        try:
+            for batch_num, (batch, embeddings) in enumerate(batches):
+                t0 = time.perf_counter()
+                if embeddings is not None:
+                    try:
+                        shadow.add_documents(embeddings, batch)
+                        result['successful_batches'] += 1
+                    except Exception as e:
+                        embeddings = None
+                        logging.error(f"Failed to index batch ending at chunk {batch[-1]['chunk_id']}: {e}")
+                if embeddings is None:
+                    # Continue with remaining batches instead of stopping; reconciliation picks these up
+                    result['failed_batches'] += 1
+                result['processed'] += len(batch)
+                if use_checkpoint:
+                    try:
+                        checkpoint.append(embeddings, batch if embeddings is not None else [], batch[-1]['chunk_id'], result['processed'])
+                    except Exception as e:
+                        logging.warning(f"Rebuild checkpoint write failed, continuing without checkpoints: {e}")
+                        use_checkpoint = False
+                stage_stats['write'].record(len(batch), time.perf_counter() - t0)
+
+                wall = time.perf_counter() - pipeline_start
+                RebuildProgress._update(processed=result['processed'], stages={k: s.to_dict(wall) for k, s in stage_stats.items()})
+                if progress_cb:
+                    progress_cb(result['processed'], total_chunks)
+
+                # Progress reporting every 5 batches
+                if batch_num % 5 == 0 or result['processed'] >= total_chunks:
+                    print(f"Progress: {result['processed']}/{total_chunks} chunks processed ({result['successful_batches']} batches successful)")
+                    logging.info(f"Progress: {result['processed']}/{total_chunks} chunks processed")
+        finally:
+            batches.close()
+
+        wall = time.perf_counter() - pipeline_start
+        result['stages'] = {k: s.to_dict(wall) for k, s in stage_stats.items()}
+        logging.info(f"Rebuild pipeline stages: {result['stages']}")
+
+        print(f"✅ Rebuilt index. Processed {result['successful_batches']} batches successfully, {result['failed_batches']} failed.")
+        logging.info(f"Successfully rebuilt vector index. {result['successful_batches']} batches successful, {result['failed_batches']} failed.")
+
+        # Validate, then cut over atomically; a bad build never replaces a working index
+        live_vectors = vector_store.get_stats()['total_vectors']
+        ok, validation = validate_generation(shadow, total_chunks, live_vectors)
+        result['validation'] = validation
+        if use_checkpoint:
+            checkpoint.discard()
+        if not ok:
+            raise RuntimeError(f"Rebuilt index failed validation, keeping generation {vector_store.generation}: {'; '.join(validation['errors'])}")
+        result['generation'] = vector_store.swap_in(shadow, keep_previous=Config.INDEX_KEEP_PREVIOUS_GENERATION)
+        print(f"🔀 Cut over to index generation {result['generation']} ({validation['vectors']} vectors)")
+        logging.info(f"Cut over to index generation {result['generation']}: {validation}")
+        # Re-apply changes made while building, including this worker's own (they went to the old generation)
+        IndexChangeFeed.replay_since(feed_seq)
+
+        # Log final stats - THIS IS CRITICAL FOR DEBUGGING
+        stats = vector_store.get_stats()
+        result['total_vectors'] = stats['total_vectors']
+        print(f"📊 Final vector store stats: {stats}")
+        logging.info(f"Final vector store stats: {stats}")
+
+        # Double-check that the index is actually populated
+        if stats['total_vectors'] > 0:
+            print(f"✅ Vector store is ready with {stats['total_vectors']} vectors")
+            logging.info(f"✅ Vector store is ready with {stats['total_vectors']} vectors")
         else:
-            print("⚠️ No text content to index")
-            logging.info("No text content found to index")
+            print("❌ WARNING: Vector store has 0 vectors after rebuild!")
+            logging.warning("❌ WARNING: Vector store has 0 vectors after rebuild!")
+        RebuildProgress._update(status='done', finished_at=time.time())
+        return result
 
     except Exception as e:
+        RebuildProgress._update(status='failed', finished_at=time.time(), error=str(e))
         print(f"❌ Error rebuilding index from DB: {e}")
         logging.error(f"Error rebuilding vector index from database: {e}", exc_info=True)
-        raise
\ No newline at end of file
+        raise
+    finally:
+        checkpoint.release()
+
+
+def validate_generation(store, expected_total, live_vectors=0, samples=None):
+    """
+    Sanity-check a freshly built generation before cutover. Returns (ok, report).
+    Checks vector/metadata alignment, coverage of the DB chunk count (only when
+    there is a working live index to fall back on) and that sampled vectors
+    retrieve themselves as the nearest neighbour.
+    """
+    import random
+    samples = Config.INDEX_VALIDATION_SAMPLES if samples is None else samples
+    index, chunks = store._snapshot()
+    n = index.ntotal
+    errors = []
+    report = {'vectors': n, 'expected': expected_total, 'dimension': index.d}
+
+    if n != len(chunks):
+        errors.append(f"{n} vectors but {len(chunks)} metadata entries")
+    if live_vectors and expected_total and n < Config.INDEX_CUTOVER_MIN_RATIO * expected_total:
+        errors.append(f"only {n}/{expected_total} chunks indexed (min ratio {Config.INDEX_CUTOVER_MIN_RATIO})")
+
+    picks = random.sample(range(min(n, len(chunks))), min(samples, n, len(chunks)))
+    hits = 0
+    for i in picks:
+        res = store.search(index.reconstruct(i), k=1)
+        # Distance rather than identity: duplicate chunks legitimately share a vector
+        if res and res[0]['distance'] <= 1e-3:
+            hits += 1
+    report['sample_queries'] = len(picks)
+    report['sample_hits'] = hits
+    if hits < len(picks):
+        errors.append(f"only {hits}/{len(picks)} sample vectors retrieved themselves")
+
+    report['errors'] = errors
+    return not errors, report
+
+
+def start_rebuild(app, resume=True):
+    """Run rebuild_index_from_db in a daemon thread so the admin request returns immediately."""
+    def run():
+        with app.app_context():
+            try:
+                rebuild_index_from_db(resume=resume)
+            except Exception:
+                pass  # Already logged and recorded in RebuildProgress
+            finally:
+                db.session.remove()
+
+    RebuildProgress._update(status='running', processed=0, total=0, resumed_from=0, started_at=time.time(), finished_at=None, error=None, stages=None)
+    thread = threading.Thread(target=run, daemon=True, name='index-rebuild')
+    thread.start()
+    return thread
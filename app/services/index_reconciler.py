@@ -0,0 +1,139 @@
+import logging
+import threading
+import time
+from collections import Counter
+from app import db
+from app.models import DocumentChunk
+from app.services.vector_store import VectorStore
+from app.services.index_rebuilder import iter_chunk_batches_by_id, RebuildProgress, REBUILD_BATCH_SIZE
+from config import Config
+
+
+class IndexReconciler:
+    """
+    Brings the in-memory vector index back in line with document_chunks without
+    a full rebuild: chunk IDs present in the DB but not indexed are embedded,
+    indexed entries whose chunk no longer exists (or that carry no chunk_id,
+    or are indexed more than once) are dropped. Only the drift is re-embedded.
+
+    A chunk committed by an upload is indexed moments later (add_texts, or the
+    change feed on other workers), so a chunk only counts as missing once it has
+    been seen missing for RECONCILE_GRACE_SECONDS; younger gaps are deferred to
+    a later pass instead of being embedded twice.
+    """
+    _lock = threading.Lock()  # One reconciliation at a time per process
+    _last_report = None
+    _missing_since = {}  # chunk_id -> when a pass first found it missing from the index
+
+    @staticmethod
+    def _db_chunk_ids():
+        ids = set()
+        for (chunk_id,) in db.session.query(DocumentChunk.id).yield_per(5000):
+            ids.add(chunk_id)
+        return ids
+
+    @classmethod
+    def last_report(cls):
+        return cls._last_report
+
+    @classmethod
+    def reconcile(cls, batch_size=REBUILD_BATCH_SIZE, dry_run=False, grace_s=None):
+        """
+        Diff DB chunk IDs against the index and repair the difference.
+        Returns a drift report; with dry_run=True nothing is changed.
+        grace_s overrides RECONCILE_GRACE_SECONDS (0 adds every missing chunk now).
+        """
+        if not cls._lock.acquire(blocking=False):
+            return {'status': 'busy'}
+        try:
+            start = time.time()
+            vector_store = VectorStore.get_instance()
+
+            grace_s = Config.RECONCILE_GRACE_SECONDS if grace_s is None else grace_s
+            # Index first: chunks are indexed only after their commit, so anything indexed is already in db_ids
+            indexed_list, unkeyed = vector_store.indexed_chunk_ids()
+            db_ids = cls._db_chunk_ids()
+            indexed = set(indexed_list)
+            # Entries indexed twice are removed and re-added once
+            duplicated = {cid for cid, n in Counter(indexed_list).items() if n > 1} if len(indexed_list) != len(indexed) else set()
+
+            orphans = indexed - db_ids
+            absent = db_ids - indexed
+            missing_since = {cid: cls._missing_since.get(cid, start) for cid in absent}
+            # Too recent to tell from an upload that has not reached the index yet
+            deferred = {cid for cid, since in missing_since.items() if start - since < grace_s}
+            missing = (absent - deferred) | (duplicated & db_ids)
+
+            report = {
+                'status': 'ok',
+                'dry_run': dry_run,
+                'db_chunks': len(db_ids),
+                'indexed_vectors': len(indexed_list) + unkeyed,
+                'missing': len(missing),
+                'deferred': len(deferred),
+                'orphans': len(orphans),
+                'unkeyed': unkeyed,
+                'duplicates': len(duplicated),
+                'removed': 0,
+                'added': 0,
+                'failed': 0
+            }
+
+            if not dry_run:
+                cls._missing_since = missing_since
+                if orphans or unkeyed or duplicated:
+                    report['removed'] = vector_store.remove_chunks(orphans | duplicated, include_unkeyed=True)
+
+                for batch in iter_chunk_batches_by_id(missing, batch_size):
+                    # Re-check just before embedding: the upload or change feed may have indexed them meanwhile
+                    now_indexed = set(vector_store.indexed_chunk_ids()[0])
+                    batch = [m for m in batch if m['chunk_id'] not in now_indexed]
+                    if not batch:
+                        continue
+                    try:
+                        vector_store.add_texts([m['text'] for m in batch], batch)
+                        report['added'] += len(batch)
+                        for m in batch:
+                            cls._missing_since.pop(m['chunk_id'], None)
+                    except Exception as e:
+                        report['failed'] += len(batch)
+                        logging.error(f"Reconcile: failed to embed batch ending at chunk {batch[-1]['chunk_id']}: {e}")
+
+            report['duration_s'] = round(time.time() - start, 2)
+            report['finished_at'] = time.time()
+            cls._last_report = report
+
+            if report['missing'] or report['orphans'] or report['unkeyed'] or report['duplicates']:
+                print(f"🔧 Index drift: {report}")
+                logging.warning(f"Index drift reconciled: {report}")
+            else:
+                logging.info(f"Index in sync with DB ({report['db_chunks']} chunks)")
+            return report
+        finally:
+            cls._lock.release()
+
+    @staticmethod
+    def start_worker(app):
+        """
+        Periodically reconcile the index in a daemon thread.
+        Skips while the startup warm-up is still filling the index.
+        """
+        from app.services.index_warmup import IndexWarmup
+        interval = Config.RECONCILE_INTERVAL_MINUTES * 60
+
+        def run_loop():
+            time.sleep(60)
+            while True:
+                if IndexWarmup.is_ready() and not RebuildProgress.is_running():
+                    with app.app_context():
+                        try:
+                            IndexReconciler.reconcile()
+                        except Exception as e:
+                            logging.error(f"Reconciler thread error: {e}")
+                        finally:
+                            db.session.remove()
+                time.sleep(interval)
+
+        thread = threading.Thread(target=run_loop, daemon=True, name='index-reconciler')
+        thread.start()
+        return thread
@@ -0,0 +1,226 @@
+import logging
+import os
+import select
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from app import db
+from app.models import IndexChange
+from config import Config
+
+NOTIFY_CHANNEL = 'index_changes'
+# A seq that is still invisible after this long belonged to a rolled-back transaction
+GAP_GRACE_SECONDS = 30
+# Session.info key: documents whose cached metadata goes stale when the transaction commits
+_PENDING_INVALIDATIONS = 'index_sync_invalidate_docs'
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_docs(session):
+    # Only after commit: invalidating earlier lets a concurrent query re-cache the old row
+    doc_ids = session.info.pop(_PENDING_INVALIDATIONS, None)
+    if doc_ids:
+        from app.services.document_cache import DocumentMetaCache
+        for doc_id in doc_ids:
+            DocumentMetaCache.invalidate(doc_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_pending_invalidations(session):
+    session.info.pop(_PENDING_INVALIDATIONS, None)
+
+
+def _origin():
+    # Evaluated per call: gunicorn workers get a new pid after fork
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class IndexChangeFeed:
+    """
+    Propagates vector index changes between workers. Writers call record() in
+    the same transaction as their chunk writes; every worker tails the
+    index_change_log table (woken by Postgres LISTEN/NOTIFY, or by polling on
+    SQLite) and applies the deltas to its own in-memory index. Applying is
+    idempotent, so replaying a change the index already reflects is harmless.
+
+    Cost note: an 'add' carries chunk IDs, not vectors (the row is written with
+    the chunks, before they are embedded), so every other worker re-embeds the
+    added chunks itself. Embedding API usage for new content therefore scales
+    with the number of processes (N workers => N embeddings per chunk); keep
+    WEB_CONCURRENCY modest or set INDEX_SYNC_ENABLED=false where that matters.
+    """
+    _lock = threading.Lock()
+    _cursor = None  # Highest seq this process has fully caught up to
+    _applied_ahead = set()  # Seqs past a not-yet-visible gap that were already applied
+    _thread = None
+
+    @staticmethod
+    def record(op, doc_id=None, chunk_ids=None):
+        """
+        Stage a change row (caller commits). On Postgres a NOTIFY is sent when the
+        transaction commits; this worker's metadata cache entry is dropped then too.
+        """
+        if doc_id is not None:
+            db.session.info.setdefault(_PENDING_INVALIDATIONS, set()).add(doc_id)
+        db.session.add(IndexChange(op=op, doc_id=doc_id, chunk_ids=list(chunk_ids) if chunk_ids else None, origin=_origin()))
+        if db.session.get_bind().dialect.name == 'postgresql':
+            db.session.execute(text("SELECT pg_notify(:ch, '')"), {'ch': NOTIFY_CHANNEL})
+
+    @staticmethod
+    def latest_seq():
+        return db.session.query(db.func.max(IndexChange.seq)).scalar() or 0
+
+    @classmethod
+    def mark_synced(cls, seq):
+        """The local index reflects every change up to seq (called after a full rebuild)."""
+        with cls._lock:
+            cls._cursor = seq
+            cls._applied_ahead = set()
+
+    @classmethod
+    def cursor(cls):
+        return cls._cursor
+
+    @classmethod
+    def replay_since(cls, seq):
+        """
+        After a blue/green cutover: re-apply every change after seq, including
+        this process's own, which were applied to the generation just replaced.
+        """
+        with cls._lock:
+            cls._cursor = seq
+            cls._applied_ahead = set()
+        return cls.apply_pending(limit=None, include_own=True)
+
+    @staticmethod
+    def _apply(change, vector_store):
+        if change.doc_id is not None:
+            from app.services.document_cache import DocumentMetaCache
+            DocumentMetaCache.invalidate(change.doc_id)
+        if change.op == 'remove_doc':
+            vector_store.remove_document(change.doc_id)
+        elif change.op == 'remove':
+            vector_store.remove_chunks(change.chunk_ids or [])
+        elif change.op == 'add':
+            # Re-embeds here: the change row carries no vectors (see the class docstring for the N-worker cost)
+            from app.services.index_rebuilder import iter_chunk_batches_by_id
+            indexed, _ = vector_store.indexed_chunk_ids()
+            todo = set(change.chunk_ids or []) - set(indexed)
+            for batch in iter_chunk_batches_by_id(todo):
+                vector_store.add_texts([m['text'] for m in batch], batch)
+        else:
+            logging.warning(f"Unknown index change op {change.op!r} (seq {change.seq})")
+
+    @classmethod
+    def apply_pending(cls, limit=500, include_own=False):
+        """Apply changes written by other processes since the cursor. Returns the number applied."""
+        from app.services.vector_store import VectorStore
+        with cls._lock:
+            if cls._cursor is None:
+                cls._cursor = cls.latest_seq()
+                return 0
+
+            changes = IndexChange.query.filter(IndexChange.seq > cls._cursor)\
+                .order_by(IndexChange.seq).limit(limit).all()
+            vector_store = VectorStore.get_instance()
+            me = _origin()
+            applied = 0
+            now = datetime.utcnow()
+            for change in changes:
+                if change.seq not in cls._applied_ahead and (include_own or change.origin != me):
+                    try:
+                        cls._apply(change, vector_store)
+                        applied += 1
+                    except Exception as e:
+                        # Don't stall the feed; the reconciler repairs whatever was missed
+                        logging.error(f"Failed to apply index change {change.seq} ({change.op}): {e}")
+
+                # Only advance past a gap once the missing seq can no longer commit
+                age = (now - change.created_at).total_seconds() if change.created_at else GAP_GRACE_SECONDS
+                if change.seq == cls._cursor + 1 or age >= GAP_GRACE_SECONDS:
+                    cls._cursor = change.seq
+                    while cls._cursor + 1 in cls._applied_ahead:
+                        cls._cursor += 1
+                    cls._applied_ahead = {s for s in cls._applied_ahead if s > cls._cursor}
+                else:
+                    cls._applied_ahead.add(change.seq)
+
+            if applied:
+                logging.info(f"Applied {applied} index changes from other workers (cursor {cls._cursor})")
+            return applied
+
+    @staticmethod
+    def prune():
+        """Drop log rows older than the retention window."""
+        cutoff = datetime.utcnow() - timedelta(hours=Config.INDEX_CHANGELOG_RETENTION_HOURS)
+        deleted = IndexChange.query.filter(IndexChange.created_at < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+    @classmethod
+    def _listen(cls, app):
+        """Open a dedicated LISTEN connection (Postgres only); returns the DBAPI connection or None."""
+        with app.app_context():
+            if db.engine.dialect.name != 'postgresql':
+                return None
+            raw = db.engine.raw_connection()
+        raw.detach()  # Never hand an autocommit LISTEN connection back to the pool
+        conn = getattr(raw, 'driver_connection', None) or raw.connection
+        conn.set_isolation_level(0)  # autocommit
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+        return conn
+
+    @classmethod
+    def _run(cls, app):
+        from app.services.index_warmup import IndexWarmup
+        from app.services.index_rebuilder import RebuildProgress
+        poll = Config.INDEX_SYNC_POLL_SECONDS
+        last_prune = 0
+        while True:
+            conn = None
+            try:
+                conn = cls._listen(app)
+                while True:
+                    if conn is not None:
+                        # Wake on NOTIFY; the timeout doubles as a polling fallback
+                        if select.select([conn], [], [], poll) != ([], [], []):
+                            conn.poll()
+                            conn.notifies.clear()
+                    else:
+                        time.sleep(poll)
+
+                    if IndexWarmup.is_warming() or RebuildProgress.is_running():
+                        continue  # The rebuild sets the cursor when it finishes
+                    with app.app_context():
+                        try:
+                            cls.apply_pending()
+                            if time.time() - last_prune > 3600:
+                                last_prune = time.time()
+                                cls.prune()
+                        except Exception as e:
+                            db.session.rollback()
+                            logging.error(f"Index change feed error: {e}")
+                        finally:
+                            db.session.remove()
+            except Exception as e:
+                logging.error(f"Index change listener failed, reconnecting: {e}")
+                time.sleep(poll)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    @classmethod
+    def start_worker(cls, app):
+        """Tail the change log in a daemon thread (no-op if already running in this process)."""
+        if cls._thread is not None and cls._thread.is_alive():
+            return cls._thread
+        cls._thread = threading.Thread(target=cls._run, args=(app,), daemon=True, name='index-change-feed')
+        cls._thread.start()
+        return cls._thread
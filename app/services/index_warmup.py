@@ -0,0 +1,93 @@
+import logging
+import threading
+import time
+
+
+class IndexWarmup:
+    """
+    Tracks (and runs) the background vector index warm-up so the app can serve
+    liveness checks immediately and report readiness/progress while it loads.
+    """
+    _lock = threading.Lock()
+    _thread = None
+    _state = {
+        'status': 'idle',  # idle, warming, ready, failed
+        'processed': 0,
+        'total': 0,
+        'started_at': None,
+        'finished_at': None,
+        'error': None
+    }
+
+    @classmethod
+    def _update(cls, **fields):
+        with cls._lock:
+            cls._state.update(fields)
+
+    @classmethod
+    def snapshot(cls):
+        with cls._lock:
+            state = dict(cls._state)
+        total = state['total'] or 0
+        state['percent'] = round(100.0 * state['processed'] / total, 1) if total else (100.0 if state['status'] == 'ready' else 0.0)
+        if state['started_at']:
+            end = state['finished_at'] or time.time()
+            state['elapsed_s'] = round(end - state['started_at'], 1)
+        return state
+
+    @classmethod
+    def is_ready(cls):
+        with cls._lock:
+            return cls._state['status'] in ('ready', 'failed')
+
+    @classmethod
+    def is_warming(cls):
+        with cls._lock:
+            return cls._state['status'] == 'warming'
+
+    @classmethod
+    def mark_ready(cls):
+        cls._update(status='ready', finished_at=time.time())
+
+    @classmethod
+    def _progress(cls, processed, total):
+        cls._update(processed=processed, total=total)
+
+    @classmethod
+    def run(cls, app):
+        """Run the warm-up in the calling thread."""
+        from app.services.index_rebuilder import rebuild_index_from_db
+        cls._update(status='warming', processed=0, total=0, started_at=time.time(), finished_at=None, error=None)
+        with app.app_context():
+            try:
+                rebuild_index_from_db(progress_cb=cls._progress)
+                cls._update(status='ready', finished_at=time.time())
+                logging.info(f"✅ Index warm-up finished: {cls.snapshot()}")
+            except Exception as e:
+                # 'failed' still counts as ready: queries answer from whatever is indexed
+                cls._update(status='failed', finished_at=time.time(), error=str(e))
+                logging.error(f"❌ Index warm-up failed: {e}", exc_info=True)
+            finally:
+                try:
+                    from app import db
+                    db.session.remove()
+                except Exception:
+                    pass
+
+    @classmethod
+    def join(cls, timeout=None):
+        """Block until a running warm-up finishes (used when preloading in the gunicorn master)."""
+        thread = cls._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    @classmethod
+    def start(cls, app):
+        """Start the warm-up in a daemon thread (no-op if one is already running)."""
+        with cls._lock:
+            if cls._thread is not None and cls._thread.is_alive():
+                return cls._thread
+            cls._state['status'] = 'warming'
+            cls._thread = threading.Thread(target=cls.run, args=(app,), daemon=True, name='index-warmup')
+            cls._thread.start()
+            return cls._thread
@@ -0,0 +1,321 @@
+import io
+import os
+import logging
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from werkzeug.utils import secure_filename
+from config import Config
+from app import db
+from app.models import Document
+from app.services.ai_service import AIService
+from app.services.chunk_writer import bulk_insert_chunks
+from app.services.document_processor import DocumentProcessor
+from app.services.extraction_cache import ExtractionCache
+from app.services.index_sync import IndexChangeFeed
+from app.services.supabase_service import SupabaseService
+from app.services.vector_store import VectorStore
+
+# Worker counts per pipeline stage (all network/IO bound)
+BATCH_UPLOAD_WORKERS = 8
+BATCH_EXTRACT_WORKERS = 4
+BATCH_EMBED_WORKERS = 4
+BATCH_EMBED_SIZE = 32
+# Zip bombs: cap the bytes expanded from all archives in one batch, not just each member
+BATCH_ZIP_MAX_TOTAL = 200 * 1024 * 1024
+
+
+def enrich_deferred_captions(app, doc_id, deferred_images, base_chunks, content_hash):
+    """Background pass: caption deferred PDF images, store them as extra chunks and index them."""
+    with app.app_context():
+        try:
+            caption_texts = DocumentProcessor.caption_deferred_images(deferred_images)
+            doc = Document.query.get(doc_id)
+            if not doc:
+                return  # Deleted while captioning
+
+            chunk_ids = []
+            if caption_texts:
+                chunk_ids = bulk_insert_chunks(doc.id, caption_texts, start_index=len(base_chunks))
+                IndexChangeFeed.record('add', doc.id, chunk_ids)
+                db.session.commit()
+
+            supa = SupabaseService()
+            try:
+                ExtractionCache.store(supa, content_hash, list(base_chunks) + caption_texts, doc_id=doc.id)
+            except Exception as e:
+                logging.warning(f"Failed to store enriched chunk JSON for {doc.filename}: {e}")
+
+            if caption_texts:
+                url = supa.get_public_url(doc.file_path)
+                metadata = [{
+                    'text': t,
+                    'doc_id': doc.id,
+                    'document_id': doc.id,
+                    'chunk_id': cid,
+                    'doc_type': doc.doc_type or 'syllabus',
+                    'filename': doc.filename,
+                    'url': url
+                } for t, cid in zip(caption_texts, chunk_ids)]
+                VectorStore.get_instance().add_texts(caption_texts, metadata)
+            logging.info(f"Deferred captioning for {doc.filename}: {len(caption_texts)}/{len(deferred_images)} captions indexed")
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Deferred captioning failed for document {doc_id}: {e}", exc_info=True)
+        finally:
+            db.session.remove()
+
+
+def schedule_deferred_captions(app, doc_id, deferred_images, base_chunks, content_hash):
+    threading.Thread(
+        target=enrich_deferred_captions,
+        args=(app, doc_id, deferred_images, base_chunks, content_hash),
+        daemon=True
+    ).start()
+
+
+class BatchIngestor:
+    """
+    Pipelined multi-file ingestion:
+      1. storage uploads run in a thread pool,
+      2. each file is handed to extraction as soon as its upload finishes,
+      3. chunk rows for every document are bulk-inserted in one transaction, each
+         document in its own savepoint (a failed insert drops that file and its upload),
+      4. all chunks are embedded in cross-document batches concurrently,
+      5. the vectors go into the index with a single add.
+    Every file gets its own status entry; one bad file never fails the batch.
+    """
+
+    def __init__(self, app, uploader_id, course=None, semester=None, subject=None, doc_type='syllabus'):
+        self.app = app
+        self.uploader_id = uploader_id
+        self.doc_type = doc_type or 'syllabus'
+        is_syllabus = self.doc_type == 'syllabus'
+        self.course = course if is_syllabus else None
+        self.semester = semester if is_syllabus else None
+        self.subject = subject if is_syllabus else None
+
+    @staticmethod
+    def expand_uploads(files):
+        """
+        files: list of (filename, bytes, mimetype). Zip archives are expanded into their
+        supported members. Returns (accepted, rejected) where rejected are status dicts.
+        Names are unique within the batch (also used as storage paths): a repeated
+        basename, e.g. sem1/syllabus.pdf and sem2/syllabus.pdf, becomes syllabus-2.pdf.
+        """
+        allowed = Config.ALLOWED_EXTENSIONS
+        accepted, rejected = [], []
+        used = set()
+        zip_budget = [BATCH_ZIP_MAX_TOTAL]
+
+        def unique(filename):
+            if filename not in used:
+                return filename
+            stem, ext = os.path.splitext(filename)
+            n = 2
+            while f"{stem}-{n}{ext}" in used:
+                n += 1
+            return f"{stem}-{n}{ext}"
+
+        def consider(name, data, mimetype):
+            filename = secure_filename(os.path.basename(name or ''))
+            ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+            if not filename or ext not in allowed:
+                rejected.append({'filename': name, 'status': 'skipped', 'error': 'File type not allowed'})
+            elif len(data) > Config.MAX_FILE_SIZE:
+                rejected.append({'filename': filename, 'status': 'skipped', 'error': 'File too large'})
+            else:
+                filename = unique(filename)
+                used.add(filename)
+                accepted.append((filename, data, mimetype or 'application/octet-stream'))
+
+        for name, data, mimetype in files:
+            if (name or '').lower().endswith('.zip'):
+                try:
+                    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+                        for info in zf.infolist():
+                            if info.is_dir() or info.filename.startswith('__MACOSX/'):
+                                continue
+                            if info.file_size > Config.MAX_FILE_SIZE:
+                                rejected.append({'filename': info.filename, 'status': 'skipped', 'error': 'File too large'})
+                                continue
+                            # Declared sizes can lie; never read more than the remaining budget allows
+                            with zf.open(info) as fh:
+                                data = fh.read(min(Config.MAX_FILE_SIZE, zip_budget[0]) + 1)
+                            if len(data) > zip_budget[0]:
+                                rejected.append({'filename': info.filename, 'status': 'skipped',
+                                                 'error': 'Archive contents exceed the batch size limit'})
+                                zip_budget[0] = 0
+                                continue
+                            zip_budget[0] -= len(data)
+                            consider(info.filename, data, None)
+                except zipfile.BadZipFile:
+                    rejected.append({'filename': name, 'status': 'error', 'error': 'Invalid zip archive'})
+            else:
+                consider(name, data, mimetype)
+        return accepted, rejected
+
+    def _extract(self, supa, filename, file_bytes):
+        """Stage 2 (worker thread): cache lookup, else parse + chunk."""
+        with self.app.app_context():
+            content_hash = ExtractionCache.content_hash(file_bytes)
+            chunks = ExtractionCache.load(supa, content_hash)
+            deferred_images = []
+            from_cache = chunks is not None
+            if not from_cache:
+                text = DocumentProcessor.extract_text_from_bytes(file_bytes, filename, deferred_images=deferred_images)
+                chunks = DocumentProcessor.chunk_text(text)
+            return {'content_hash': content_hash, 'chunks': chunks, 'from_cache': from_cache, 'deferred_images': deferred_images}
+
+    @staticmethod
+    def _discard_upload(supa, storage_path):
+        """Remove the stored object of a file whose rows never committed (best effort)."""
+        try:
+            supa.delete_file(storage_path)
+        except Exception as e:
+            logging.warning(f"Could not delete orphaned upload {storage_path}: {e}")
+
+    def _embed(self, texts):
+        with self.app.app_context():
+            return AIService.get_embeddings(texts)
+
+    def run(self, files):
+        supa = SupabaseService()
+        accepted, results = self.expand_uploads(files)
+        if not accepted:
+            return results
+
+        # Stages 1+2: upload and extract, overlapped per file; everything is keyed by input position
+        extracted = {}  # position -> (filename, storage_path, extraction)
+        with ThreadPoolExecutor(max_workers=BATCH_UPLOAD_WORKERS) as uploaders, \
+                ThreadPoolExecutor(max_workers=BATCH_EXTRACT_WORKERS) as extractors:
+            upload_futs = {
+                uploaders.submit(supa.upload_file, data, filename, mimetype): pos
+                for pos, (filename, data, mimetype) in enumerate(accepted)
+            }
+            extract_futs = {}
+            for fut in as_completed(upload_futs):
+                pos = upload_futs[fut]
+                filename, data, _ = accepted[pos]
+                try:
+                    storage_path = fut.result()
+                except Exception as e:
+                    results.append({'filename': filename, 'status': 'error', 'error': f'Storage error: {e}'})
+                    continue
+                extract_futs[extractors.submit(self._extract, supa, filename, data)] = (pos, storage_path)
+            for fut in as_completed(extract_futs):
+                pos, storage_path = extract_futs[fut]
+                filename = accepted[pos][0]
+                try:
+                    extracted[pos] = (filename, storage_path, fut.result())
+                except Exception as e:
+                    logging.error(f"Batch extraction failed for {filename}: {e}", exc_info=True)
+                    extracted[pos] = (filename, storage_path, None)
+        extracted = dict(sorted(extracted.items()))
+
+        # Stage 3: documents + chunk rows, one savepoint per document inside a single commit
+        docs = {}  # position -> Document (only the ones that made it into the transaction)
+        all_texts, all_metas = [], []
+        for pos, (filename, storage_path, extraction) in list(extracted.items()):
+            try:
+                with db.session.begin_nested():
+                    doc = Document(
+                        filename=filename,
+                        file_path=storage_path,
+                        uploaded_by=self.uploader_id,
+                        status='processed' if extraction else 'error',
+                        course=self.course,
+                        semester=self.semester,
+                        subject=self.subject,
+                        doc_type=self.doc_type
+                    )
+                    db.session.add(doc)
+                    db.session.flush()
+                    chunk_ids = []
+                    if extraction:
+                        chunk_ids = bulk_insert_chunks(doc.id, extraction['chunks'])
+                        IndexChangeFeed.record('add', doc.id, chunk_ids)
+            except Exception as e:
+                logging.error(f"Batch insert failed for {filename}: {e}", exc_info=True)
+                results.append({'filename': filename, 'status': 'error', 'error': f'Database error: {e}'})
+                self._discard_upload(supa, storage_path)
+                del extracted[pos]
+                continue
+            docs[pos] = doc
+            if not extraction:
+                results.append({'filename': filename, 'doc_id': doc.id, 'status': 'error', 'error': 'Extraction failed'})
+                continue
+            url = supa.get_public_url(doc.file_path)
+            for text, cid in zip(extraction['chunks'], chunk_ids):
+                all_texts.append(text)
+                all_metas.append({
+                    'text': text,
+                    'doc_id': doc.id,
+                    'document_id': doc.id,
+                    'chunk_id': cid,
+                    'doc_type': doc.doc_type,
+                    'filename': doc.filename,
+                    'url': url
+                })
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Batch commit failed: {e}", exc_info=True)
+            results = [r for r in results if r.get('doc_id') is None]
+            for filename, storage_path, _ in extracted.values():
+                results.append({'filename': filename, 'status': 'error', 'error': f'Database error: {e}'})
+                self._discard_upload(supa, storage_path)
+            return results
+
+        # Audit copies / cache entries; deferred captions refresh them later
+        with ThreadPoolExecutor(max_workers=BATCH_UPLOAD_WORKERS) as ex:
+            for pos, (_, _, extraction) in extracted.items():
+                if extraction:
+                    ex.submit(
+                        ExtractionCache.store, supa, extraction['content_hash'], extraction['chunks'],
+                        docs[pos].id, not extraction['from_cache'] and not extraction['deferred_images']
+                    )
+
+        # Stages 4+5: cross-document embedding batches, then one index insert
+        failed_docs = set()
+        if all_texts:
+            batches = [(i, all_texts[i:i + BATCH_EMBED_SIZE]) for i in range(0, len(all_texts), BATCH_EMBED_SIZE)]
+            vectors, metas = [], []
+            with ThreadPoolExecutor(max_workers=BATCH_EMBED_WORKERS) as ex:
+                futs = {ex.submit(self._embed, texts): (start, texts) for start, texts in batches}
+                embedded = {}
+                for fut in as_completed(futs):
+                    start, texts = futs[fut]
+                    try:
+                        embs = fut.result()
+                        if len(embs) != len(texts):
+                            raise ValueError(f"expected {len(texts)} embeddings, got {len(embs)}")
+                        embedded[start] = embs
+                    except Exception as e:
+                        logging.error(f"Batch embedding failed at chunk {start}: {e}")
+                        failed_docs.update(m['doc_id'] for m in all_metas[start:start + len(texts)])
+            for start, _ in batches:
+                if start in embedded:
+                    vectors.extend(embedded[start])
+                    metas.extend(all_metas[start:start + len(embedded[start])])
+            if vectors:
+                VectorStore.get_instance().add_documents(vectors, metas)
+
+        for pos, (filename, _, extraction) in extracted.items():
+            if not extraction:
+                continue
+            doc = docs[pos]
+            results.append({
+                'filename': filename,
+                'doc_id': doc.id,
+                'status': 'processed',
+                'chunks': len(extraction['chunks']),
+                'cached': extraction['from_cache'],
+                'indexed': doc.id not in failed_docs
+            })
+            if extraction['deferred_images']:
+                schedule_deferred_captions(
+                    self.app, doc.id, extraction['deferred_images'], extraction['chunks'], extraction['content_hash']
+                )
+        return results
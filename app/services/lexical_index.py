@@ -0,0 +1,149 @@
+import itertools
+import math
+import re
+import threading
+from collections import Counter
+from app.services.tracing import traced
+
+# BM25 parameters (Robertson/Sparck Jones defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+# Codes like "CS-301", "BCA/2", "21.BCE.1234" are also indexed joined ("cs301") so either spelling matches
+_COMPOUND_RE = re.compile(r'[a-z0-9]+(?:[-/._][a-z0-9]+)+')
+_STOPWORDS = frozenset(
+    'a an and are as at be by for from has have how i in is it its of on or that the this to was were what when '
+    'where which who why will with you your'.split()
+)
+
+
+def tokenize(text):
+    text = (text or '').lower()
+    tokens = [t for t in _TOKEN_RE.findall(text) if t not in _STOPWORDS]
+    for compound in _COMPOUND_RE.findall(text):
+        tokens.append(re.sub(r'[-/._]', '', compound))
+    return tokens
+
+
+class LexicalIndex:
+    """
+    In-memory BM25 inverted index over chunk text. Each VectorStore generation
+    owns one and keeps it in step with its FAISS index (add/remove/clear), so
+    exact tokens the embedding model blurs (course codes, exam names, roll-number
+    formats) are still findable, and retrieval keeps working without the
+    embedding API.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._docs = {}       # key -> (metadata, token count)
+        self._postings = {}   # term -> {key: term frequency}
+        self._total_len = 0
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, chunks_metadata):
+        entries = []
+        for meta in chunks_metadata:
+            tf = Counter(tokenize(meta.get('text')))
+            entries.append((next(self._ids), meta, tf))
+        with self._lock:
+            for key, meta, tf in entries:
+                length = sum(tf.values())
+                self._docs[key] = (meta, length)
+                self._total_len += length
+                for term, n in tf.items():
+                    self._postings.setdefault(term, {})[key] = n
+
+    def remove_where(self, predicate):
+        """Drop every entry whose metadata matches predicate. Returns the number removed."""
+        with self._lock:
+            doomed = [key for key, (meta, _) in self._docs.items() if predicate(meta)]
+            for key in doomed:
+                meta, length = self._docs.pop(key)
+                self._total_len -= length
+                for term in set(tokenize(meta.get('text'))):
+                    plist = self._postings.get(term)
+                    if plist is not None:
+                        plist.pop(key, None)
+                        if not plist:
+                            del self._postings[term]
+            return len(doomed)
+
+    def rebuild(self, chunks_metadata):
+        """Replace the whole index (e.g. after chunks were loaded wholesale)."""
+        fresh = LexicalIndex()
+        fresh.add(chunks_metadata)
+        with self._lock:
+            self._docs, self._postings, self._total_len = fresh._docs, fresh._postings, fresh._total_len
+            self._ids = fresh._ids
+
+    def clear(self):
+        with self._lock:
+            self._docs, self._postings, self._total_len = {}, {}, 0
+
+    @traced('lexical_search')
+    def search(self, query, k=10, min_ratio=0.0):
+        """
+        Top-k entries by BM25 as metadata copies with a 'bm25' score. Hits scoring
+        below min_ratio of the best hit are dropped (filters single common-word matches).
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        scores = Counter()
+        with self._lock:
+            n_docs = len(self._docs)
+            if not n_docs:
+                return []
+            avg_len = self._total_len / n_docs or 1.0
+            for term in terms:
+                plist = self._postings.get(term)
+                if not plist:
+                    continue
+                idf = math.log(1 + (n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+                for key, tf in plist.items():
+                    length = self._docs[key][1]
+                    scores[key] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len))
+            top = scores.most_common(k)
+            hits = [(self._docs[key][0], score) for key, score in top]
+        if not hits:
+            return []
+        floor = hits[0][1] * min_ratio
+        results = []
+        for meta, score in hits:
+            if score < floor:
+                break
+            result = meta.copy()
+            result['bm25'] = round(score, 4)
+            results.append(result)
+        return results
+
+
+def _result_key(r):
+    return r.get('chunk_id') or (r.get('doc_id') or r.get('document_id'), r.get('text'))
+
+
+def fuse(vector_results, lexical_results, k=None, rrf_k=60):
+    """
+    Reciprocal rank fusion of vector and BM25 hit lists. Entries found by both
+    keep their vector distance and gain the bm25 score; lexical-only entries
+    carry no 'distance'. Returned best first with an 'rrf' score.
+    """
+    merged = {}
+    for hits in (vector_results, lexical_results):
+        for rank, r in enumerate(hits):
+            key = _result_key(r)
+            entry = merged.get(key)
+            if entry is None:
+                entry = merged[key] = dict(r, rrf=0.0)
+            else:
+                for field in ('distance', 'bm25'):
+                    if field in r:
+                        entry[field] = r[field]
+            entry['rrf'] += 1.0 / (rrf_k + rank + 1)
+    ranked = sorted(merged.values(), key=lambda e: e['rrf'], reverse=True)
+    return ranked[:k] if k else ranked
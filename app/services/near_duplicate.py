@@ -0,0 +1,107 @@
+import hashlib
+import re
+
+SIMHASH_BITS = 64
+SHINGLE_SIZE = 3
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _hash64(token):
+    return int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def simhash(text, shingle_size=SHINGLE_SIZE):
+    """64-bit SimHash of the word shingles in `text` (case/punctuation insensitive)."""
+    words = _WORD_RE.findall((text or '').lower())
+    if not words:
+        return 0
+    if len(words) < shingle_size:
+        shingles = [' '.join(words)]
+    else:
+        shingles = [' '.join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)]
+
+    weights = [0] * SIMHASH_BITS
+    for sh in shingles:
+        h = _hash64(sh)
+        for b in range(SIMHASH_BITS):
+            if (h >> b) & 1:
+                weights[b] += 1
+            else:
+                weights[b] -= 1
+
+    fp = 0
+    for b in range(SIMHASH_BITS):
+        if weights[b] > 0:
+            fp |= (1 << b)
+    return fp
+
+
+class NearDuplicateIndex:
+    """
+    SimHash LSH index. Fingerprints are split into (max_distance + 1) bands, so by
+    the pigeonhole principle any pair within `max_distance` bits shares at least one
+    band exactly and only those bucket-mates need a full Hamming comparison.
+    """
+
+    def __init__(self, max_distance=3):
+        self.max_distance = max(0, int(max_distance))
+        n_bands = self.max_distance + 1
+        width = SIMHASH_BITS // n_bands
+        self._bands = []
+        start = 0
+        for i in range(n_bands):
+            end = SIMHASH_BITS if i == n_bands - 1 else start + width
+            self._bands.append((start, (1 << (end - start)) - 1))
+            start = end
+        self._buckets = [dict() for _ in self._bands]
+        self._fingerprints = []
+
+    def _keys(self, fp):
+        return [(fp >> shift) & mask for shift, mask in self._bands]
+
+    def find(self, fp):
+        """Return the position of a stored near-duplicate of `fp`, or None."""
+        seen = set()
+        for bucket, key in zip(self._buckets, self._keys(fp)):
+            for pos in bucket.get(key, ()):
+                if pos in seen:
+                    continue
+                seen.add(pos)
+                if bin(self._fingerprints[pos] ^ fp).count('1') <= self.max_distance:
+                    return pos
+        return None
+
+    def add(self, fp):
+        pos = len(self._fingerprints)
+        self._fingerprints.append(fp)
+        for bucket, key in zip(self._buckets, self._keys(fp)):
+            bucket.setdefault(key, []).append(pos)
+        return pos
+
+
+def suppress_near_duplicates(items, text_of=lambda x: x, max_distance=3):
+    """
+    Drop items whose text is a near-duplicate of an earlier item (first one wins).
+    Returns (kept_items, stats) where stats reports how much was saved.
+    """
+    index = NearDuplicateIndex(max_distance)
+    kept = []
+    dropped = 0
+    chars_saved = 0
+    for item in items:
+        text = text_of(item) or ''
+        fp = simhash(text)
+        if fp and index.find(fp) is not None:
+            dropped += 1
+            chars_saved += len(text)
+            continue
+        if fp:
+            index.add(fp)
+        kept.append(item)
+    return kept, {
+        'total': len(kept) + dropped,
+        'kept': len(kept),
+        'dropped': dropped,
+        'chars_saved': chars_saved
+    }
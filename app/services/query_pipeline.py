@@ -0,0 +1,75 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from app import db
+from app.services import tracing
+from config import Config
+
+
+class Stage:
+    """Handle for one fanned-out step of a query; result() re-raises its error and merges its spans."""
+
+    def __init__(self, future=None, outcome=None):
+        self._future = future
+        self._outcome = outcome
+        self._merged = False
+
+    def result(self, timeout=None):
+        if self._outcome is None:
+            self._outcome = self._future.result(timeout)
+        value, spans, error = self._outcome
+        if not self._merged:
+            tracing.merge(spans)
+            self._merged = True
+        if error is not None:
+            raise error
+        return value
+
+
+class QueryFanOut:
+    """
+    Per-worker thread pool that starts the independent waits at the start of
+    /api/query (prefs lookup, session lookup, question embedding) together
+    rather than one after another. Each step runs in its own app context and DB
+    session; its spans are folded into the request's Server-Timing when the
+    request thread collects the result. With QUERY_FANOUT off, steps run inline,
+    so comparing the studies 'total' p50 in /api/admin/latency with it on and
+    off shows what the overlap is worth on a given deployment.
+    """
+    _lock = threading.Lock()
+    _pool = None
+
+    @classmethod
+    def _executor(cls):
+        # Created on first use, i.e. after gunicorn has forked the worker
+        if cls._pool is None:
+            with cls._lock:
+                if cls._pool is None:
+                    cls._pool = ThreadPoolExecutor(max_workers=Config.QUERY_FANOUT_WORKERS, thread_name_prefix='query-fanout')
+        return cls._pool
+
+    @staticmethod
+    def _call(app, name, fn, args, kwargs):
+        with tracing.capture() as spans:
+            with app.app_context():
+                try:
+                    with tracing.span(name):
+                        return fn(*args, **kwargs), spans, None
+                except Exception as e:
+                    return None, spans, e
+                finally:
+                    db.session.remove()
+
+    @classmethod
+    def submit(cls, name, fn, *args, **kwargs):
+        """Start fn(*args, **kwargs) as stage `name`; returns a Stage."""
+        if not Config.QUERY_FANOUT:
+            with tracing.capture() as spans:
+                try:
+                    with tracing.span(name):
+                        outcome = (fn(*args, **kwargs), spans, None)
+                except Exception as e:
+                    outcome = (None, spans, e)
+            return Stage(outcome=outcome)
+        app = current_app._get_current_object()
+        return Stage(future=cls._executor().submit(cls._call, app, name, fn, args, kwargs))
@@ -0,0 +1,154 @@
+import json
+import logging
+import os
+import time
+import numpy as np
+from config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: no cross-process guard
+    fcntl = None
+
+# Vectors are restored into the index this many at a time
+RESTORE_SLAB = 4096
+
+
+class RebuildCheckpoint:
+    """
+    On-disk progress of an index rebuild: the last chunk ID processed plus every
+    vector embedded so far (raw float32 rows + one JSON metadata line per row).
+    Files are append-only; state.json is replaced atomically after each append,
+    so a crash between the two just truncates the tail on restore.
+    Only one process checkpoints at a time (flock on a lock file).
+    """
+
+    def __init__(self, directory=None):
+        self.dir = directory or Config.REBUILD_CHECKPOINT_DIR
+        self.state_path = os.path.join(self.dir, 'state.json')
+        self.vectors_path = os.path.join(self.dir, 'vectors.f32')
+        self.meta_path = os.path.join(self.dir, 'meta.jsonl')
+        self._lock_fh = None
+        self.state = None
+
+    def acquire(self):
+        """Take the checkpoint lock; False if another live process holds it."""
+        try:
+            os.makedirs(self.dir, exist_ok=True)
+            self._lock_fh = open(os.path.join(self.dir, '.lock'), 'w')
+            if fcntl is not None:
+                fcntl.flock(self._lock_fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except (OSError, IOError) as e:
+            logging.info(f"Rebuild checkpoint unavailable ({e}); rebuilding without checkpoints")
+            self.release()
+            return False
+
+    def release(self):
+        if self._lock_fh is not None:
+            try:
+                self._lock_fh.close()  # Closing drops the flock
+            except Exception:
+                pass
+            self._lock_fh = None
+
+    @staticmethod
+    def read_state(directory=None):
+        path = os.path.join(directory or Config.REBUILD_CHECKPOINT_DIR, 'state.json')
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_state(self):
+        self.state['updated_at'] = time.time()
+        tmp = self.state_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.state_path)
+
+    def discard(self):
+        for path in (self.state_path, self.vectors_path, self.meta_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.state = None
+
+    def start(self, feed_seq, total_chunks):
+        self.discard()
+        open(self.vectors_path, 'wb').close()
+        open(self.meta_path, 'w').close()
+        self.state = {
+            'model': Config.HF_EMBEDDING_MODEL,
+            'dimension': None,
+            'feed_seq': feed_seq,
+            'total_chunks': total_chunks,
+            'last_chunk_id': 0,
+            'processed': 0,
+            'vectors': 0,
+            'started_at': time.time()
+        }
+        self._write_state()
+
+    def append(self, vectors, metas, last_chunk_id, processed):
+        """Persist one embedded batch (vectors may be None for a failed batch) and advance the cursor."""
+        if vectors is not None and len(metas):
+            arr = np.asarray(vectors, dtype='float32')
+            with open(self.vectors_path, 'ab') as f:
+                arr.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.meta_path, 'a') as f:
+                for m in metas:
+                    f.write(json.dumps(m) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.state['dimension'] = int(arr.shape[1])
+            self.state['vectors'] += len(metas)
+        self.state['last_chunk_id'] = last_chunk_id
+        self.state['processed'] = processed
+        self._write_state()
+
+    def restore(self, vector_store):
+        """
+        Load a usable checkpoint into vector_store (which must be empty).
+        Returns the state dict, or None if there is nothing valid to resume.
+        """
+        state = self.read_state(self.dir)
+        if not state:
+            return None
+        age_h = (time.time() - state.get('updated_at', 0)) / 3600.0
+        if state.get('model') != Config.HF_EMBEDDING_MODEL or age_h > Config.REBUILD_CHECKPOINT_MAX_AGE_HOURS:
+            logging.info(f"Discarding stale rebuild checkpoint (model {state.get('model')}, {age_h:.1f}h old)")
+            self.discard()
+            return None
+
+        n, dim = state['vectors'], state['dimension'] or 0
+        try:
+            # Drop any tail written after the last state update
+            with open(self.vectors_path, 'r+b') as f:
+                f.truncate(n * dim * 4)
+            meta_end = 0
+            if n:
+                vectors = np.memmap(self.vectors_path, dtype='float32', mode='r', shape=(n, dim))
+                with open(self.meta_path, 'rb') as f:
+                    for start in range(0, n, RESTORE_SLAB):
+                        end = min(start + RESTORE_SLAB, n)
+                        metas = [json.loads(f.readline()) for _ in range(end - start)]
+                        vector_store.add_documents(list(vectors[start:end]), metas)
+                    meta_end = f.tell()
+                del vectors
+            with open(self.meta_path, 'r+b') as f:
+                f.truncate(meta_end)
+        except Exception as e:
+            logging.warning(f"Rebuild checkpoint unreadable, starting over: {e}")
+            vector_store.clear()
+            self.discard()
+            return None
+
+        self.state = state
+        return state
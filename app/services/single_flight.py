@@ -0,0 +1,91 @@
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical work within a process: the first caller for
+    a key (the leader) runs fn, callers arriving while it is in flight wait and
+    share its result or exception. Nothing is cached once the call finishes.
+    Followers that wait longer than wait_timeout run fn themselves.
+    """
+    _registry_lock = threading.Lock()
+    _registry = {}
+
+    def __init__(self, name, wait_timeout=None, enabled=True):
+        self.name = name
+        self.wait_timeout = wait_timeout
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {'leaders': 0, 'followers': 0, 'errors': 0, 'wait_timeouts': 0}
+        with SingleFlight._registry_lock:
+            SingleFlight._registry[name] = self
+
+    def do(self, key, fn):
+        """Returns (value, shared) where shared is True if another caller computed it."""
+        if not self.enabled:
+            return fn(), False
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats['leaders'] += 1
+            else:
+                self._stats['followers'] += 1
+
+        if leader:
+            try:
+                call.value = fn()
+                return call.value, False
+            except Exception as e:
+                call.error = e
+                with self._lock:
+                    self._stats['errors'] += 1
+                raise
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+
+        if not call.done.wait(self.wait_timeout):
+            with self._lock:
+                self._stats['wait_timeouts'] += 1
+            return fn(), False
+        if call.error is not None:
+            raise call.error
+        return call.value, True
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._stats)
+            out['in_flight'] = len(self._calls)
+        total = out['leaders'] + out['followers']
+        out['coalesced_ratio'] = round(out['followers'] / total, 3) if total else None
+        return out
+
+    def reset(self):
+        with self._lock:
+            self._stats = {k: 0 for k in self._stats}
+
+    @classmethod
+    def report(cls):
+        with cls._registry_lock:
+            groups = list(cls._registry.values())
+        return {g.name: g.stats() for g in groups}
+
+    @classmethod
+    def reset_all(cls):
+        with cls._registry_lock:
+            groups = list(cls._registry.values())
+        for g in groups:
+            g.reset()
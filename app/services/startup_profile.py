@@ -0,0 +1,116 @@
+import importlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB (Linux /proc, falling back to peak RSS)."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024.0, 1)
+    except Exception:
+        pass
+    try:
+        import resource
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)
+    except Exception:
+        return None
+
+
+def memory_breakdown():
+    """
+    RSS split into shared vs private pages (Linux smaps_rollup). Under gunicorn
+    preload, index pages inherited from the master show up as shared until written.
+    """
+    out = {'pid': os.getpid(), 'rss_mb': current_rss_mb()}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3 and parts[0].rstrip(':') in ('Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty'):
+                    out[parts[0].rstrip(':').lower() + '_mb'] = round(int(parts[1]) / 1024.0, 1)
+    except Exception:
+        pass
+    if 'private_clean_mb' in out:
+        out['private_mb'] = round(out['private_clean_mb'] + out.get('private_dirty_mb', 0), 1)
+        out['shared_mb'] = round(out.get('shared_clean_mb', 0) + out.get('shared_dirty_mb', 0), 1)
+    return out
+
+
+class StartupProfile:
+    """
+    Records how long each create_app phase and each heavy (lazy) import takes,
+    together with RSS after each step, so cold-start cost can be inspected per worker.
+    """
+    _lock = threading.Lock()
+    _t0 = time.perf_counter()
+    _phases = []
+    _imports = {}
+
+    @classmethod
+    @contextmanager
+    def phase(cls, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = {
+                'name': name,
+                'ms': round((time.perf_counter() - start) * 1000, 1),
+                'rss_mb': current_rss_mb()
+            }
+            with cls._lock:
+                cls._phases.append(entry)
+
+    @classmethod
+    def record_import(cls, name, seconds):
+        with cls._lock:
+            cls._imports[name] = {
+                'ms': round(seconds * 1000, 1),
+                'since_start_ms': round((time.perf_counter() - cls._t0) * 1000, 1),
+                'rss_mb': current_rss_mb()
+            }
+
+    @classmethod
+    def report(cls):
+        with cls._lock:
+            return {
+                'pid': os.getpid(),
+                'uptime_ms': round((time.perf_counter() - cls._t0) * 1000, 1),
+                'rss_mb': current_rss_mb(),
+                'phases': list(cls._phases),
+                'imports': dict(cls._imports)
+            }
+
+    @classmethod
+    def emit(cls):
+        rep = cls.report()
+        lines = [f"⏱ Startup profile (pid {rep['pid']}, RSS {rep['rss_mb']} MB):"]
+        for p in rep['phases']:
+            lines.append(f"   {p['name']:<24} {p['ms']:>9.1f} ms   RSS {p['rss_mb']} MB")
+        for name, imp in rep['imports'].items():
+            lines.append(f"   import {name:<17} {imp['ms']:>9.1f} ms")
+        print("\n".join(lines))
+        logging.info(f"Startup profile: {rep}")
+        return rep
+
+
+def lazy_import(name):
+    """
+    Import a heavy optional module on first use, timing the first load in StartupProfile.
+    Services call this from inside the methods that need the dependency so workers
+    that never touch e.g. PDF parsing never pay for pypdf.
+    """
+    import sys
+    mod = sys.modules.get(name)
+    if mod is not None:
+        return mod
+    start = time.perf_counter()
+    mod = importlib.import_module(name)
+    StartupProfile.record_import(name, time.perf_counter() - start)
+    return mod
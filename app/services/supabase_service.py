@@ -1,6 +1,7 @@
 import requests
 from config import Config
 from flask import current_app
+from app.services.tracing import traced
 
 
 class SupabaseService:
@@ -38,6 +39,7 @@ class SupabaseService:
             "apikey": self.key,
         }
 
+    @traced('storage')
     def upload_file(self, file_bytes: bytes, path: str, content_type: str = "application/octet-stream") -> str:
         headers = {
             **self.headers_base,
@@ -49,6 +51,7 @@ class SupabaseService:
             raise RuntimeError(f"Storage upload failed: {resp.status_code} {resp.text}")
         return path
 
+    @traced('storage')
     def download_file(self, path: str) -> bytes:
         headers = {**self.headers_base}
         resp = requests.get(f"{self.base}/{self.bucket}/{path}", headers=headers)
@@ -60,6 +63,7 @@ class SupabaseService:
         # Requires bucket to be public or signed URL mechanism (not implemented here)
         return f"{self.base}/public/{self.bucket}/{path}"
 
+    @traced('storage')
     def delete_file(self, path: str):
         headers = {**self.headers_base}
         resp = requests.delete(f"{self.base}/{self.bucket}/{path}", headers=headers)
@@ -67,6 +71,7 @@ class SupabaseService:
             raise RuntimeError(f"Storage delete failed: {resp.status_code} {resp.text}")
         return True
 
+    @traced('storage')
     def list_files(self, prefix: str = "", limit: int = 100, offset: int = 0):
         url = f"{self.url}/storage/v1/object/list/{self.bucket}"
         headers = {**self.headers_base, "Content-Type": "application/json"}
@@ -0,0 +1,173 @@
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context
+
+# Histogram bucket upper bounds in ms (last bucket is open-ended)
+BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 350, 500, 750, 1000, 1500, 2000, 3000, 5000, 7500, 10000, 20000, 30000, 60000]
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; percentiles are interpolated within the matching bucket."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= rank:
+                lo = BUCKETS_MS[i - 1] if i > 0 else 0.0
+                hi = BUCKETS_MS[i] if i < len(BUCKETS_MS) else self.max_ms
+                return round(min(lo + (hi - lo) * (rank - seen) / c, self.max_ms), 1)
+            seen += c
+        return round(self.max_ms, 1)
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total_ms / self.count, 1) if self.count else None,
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'max_ms': round(self.max_ms, 1)
+        }
+
+
+class LatencyStats:
+    """In-process latency histograms keyed by (mode, stage)."""
+    _lock = threading.Lock()
+    _hists = {}
+    _since = time.time()
+
+    @classmethod
+    def observe(cls, mode, stage, ms):
+        with cls._lock:
+            hist = cls._hists.get((mode, stage))
+            if hist is None:
+                hist = cls._hists[(mode, stage)] = Histogram()
+            hist.observe(ms)
+
+    @classmethod
+    def report(cls):
+        with cls._lock:
+            out = {}
+            for (mode, stage), hist in sorted(cls._hists.items()):
+                out.setdefault(mode, {})[stage] = hist.summary()
+            return {'since': cls._since, 'modes': out}
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._hists = {}
+            cls._since = time.time()
+
+
+def set_mode(mode):
+    """Label the current request (studies, general, smalltalk) for histogram aggregation."""
+    if has_request_context():
+        g.trace_mode = mode
+
+
+_local = threading.local()
+
+
+@contextmanager
+def capture():
+    """
+    Collect the spans recorded on this thread into a list instead of the
+    histograms, so work done for a request on a pool thread can be folded
+    back into that request with merge().
+    """
+    spans = []
+    _local.sink = spans
+    try:
+        yield spans
+    finally:
+        _local.sink = None
+
+
+def merge(spans):
+    for name, ms in spans:
+        _record(name, ms)
+
+
+def _record(name, ms):
+    sink = getattr(_local, 'sink', None)
+    if sink is not None:
+        sink.append((name, ms))
+    elif has_request_context():
+        spans = g.setdefault('trace_spans', [])
+        spans.append((name, ms))
+    else:
+        # Background work (rebuilds, ingestion threads) still lands in the histograms
+        LatencyStats.observe('background', name, ms)
+
+
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(name, (time.perf_counter() - start) * 1000.0)
+
+
+def traced(name):
+    """Decorator form of span() for service methods."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def init_app(app):
+    """Emit Server-Timing on traced requests and fold their spans into LatencyStats."""
+
+    @app.before_request
+    def _trace_start():
+        g.trace_start = time.perf_counter()
+
+    @app.after_request
+    def _trace_finish(response):
+        spans = g.pop('trace_spans', None)
+        mode = g.pop('trace_mode', None)
+        start = g.pop('trace_start', None)
+        if not spans and not mode:
+            return response
+        total_ms = (time.perf_counter() - start) * 1000.0 if start else None
+
+        # Collapse repeated stages (e.g. several storage calls) into one entry each
+        agg = {}
+        for name, ms in spans or []:
+            tot, n = agg.get(name, (0.0, 0))
+            agg[name] = (tot + ms, n + 1)
+        if total_ms is not None:
+            agg['total'] = (total_ms, 1)
+
+        if mode:
+            for name, (ms, _) in agg.items():
+                LatencyStats.observe(mode, name, ms)
+
+        parts = []
+        for name, (ms, n) in agg.items():
+            parts.append(f'{name};dur={ms:.1f}' + (f';desc="x{n}"' if n > 1 else ''))
+        response.headers['Server-Timing'] = ', '.join(parts)
+        return response
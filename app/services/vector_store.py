@@ -1,8 +1,153 @@
-import faiss
 import numpy as np
 import pickle
 import os
 import logging
+import threading
+import time
+from collections import Counter, namedtuple
+from app.services.tracing import traced
+from app.services.lexical_index import LexicalIndex
+from app.services.startup_profile import lazy_import
+from config import Config
+
+
+# Source citation for a document, held once per document in the index instead of on every chunk
+Citation = namedtuple('Citation', 'filename url doc_type')
+_CITATION_FIELDS = ('filename', 'url')
+
+
+def split_citations(chunks_metadata, known=None):
+    """
+    Returns (slim metadata, {doc_id: Citation} for documents not already in known).
+    A document's citation comes from known, else from its first chunk. The slim
+    copies drop filename and the duplicate document_id key, and drop url unless
+    it differs from the document's (web pages crawled under one site document
+    keep their own page URL). Inputs are not modified.
+    """
+    known = known or {}
+    slim, citations = [], {}
+    for meta in chunks_metadata:
+        doc_id = meta.get('doc_id')
+        if doc_id is None:
+            doc_id = meta.get('document_id')
+        if doc_id is not None:
+            cite = known.get(doc_id) or citations.get(doc_id)
+            if cite is None and any(f in meta for f in _CITATION_FIELDS):
+                cite = citations[doc_id] = Citation(meta.get('filename'), meta.get('url'), meta.get('doc_type') or 'syllabus')
+            keep_url = meta.get('url') and (cite is None or meta['url'] != cite.url)
+            meta = {k: v for k, v in meta.items() if (k not in _CITATION_FIELDS or (k == 'url' and keep_url)) and k != 'document_id'}
+            meta['doc_id'] = doc_id
+        slim.append(meta)
+    return slim, citations
+
+
+class SystemInfoIndex:
+    """
+    The system_info (identity/about-the-bot) entries of a generation, held apart
+    from the main index: searched exhaustively on every query (it is tiny), with
+    each document's leading chunks precomputed so identity context needs no DB
+    round trip. State is swapped as one tuple, so readers never lock.
+    """
+    TOP_PER_DOC = 3
+
+    def __init__(self):
+        self._state = (None, [], [])  # (vectors n x d, metadata, precomputed top chunks)
+
+    def __len__(self):
+        return len(self._state[1])
+
+    @staticmethod
+    def wants(meta):
+        return meta.get('doc_type') == 'system_info'
+
+    def _set(self, vectors, metas):
+        by_doc = {}
+        for meta in metas:
+            by_doc.setdefault(meta.get('doc_id') or meta.get('document_id'), []).append(meta)
+        top = []
+        for doc_metas in by_doc.values():
+            doc_metas.sort(key=lambda m: m.get('chunk_id') or 0)
+            top.extend(doc_metas[:self.TOP_PER_DOC])
+        self._state = (vectors if metas else None, metas, top)
+
+    def add(self, vectors, chunks_metadata):
+        """vectors: float32 array aligned with chunks_metadata; only system_info rows are kept."""
+        rows = [i for i, m in enumerate(chunks_metadata) if self.wants(m)]
+        if not rows:
+            return
+        current, metas, _ = self._state
+        new = vectors[rows]
+        if current is None or current.shape[1] != new.shape[1]:
+            current, metas = None, []  # Empty, or the main index was just re-initialized at a new dimension
+        merged = new if current is None else np.vstack([current, new])
+        self._set(merged, metas + [chunks_metadata[i] for i in rows])
+
+    def remove_where(self, predicate):
+        vectors, metas, _ = self._state
+        keep = [i for i, m in enumerate(metas) if not predicate(m)]
+        if len(keep) != len(metas):
+            self._set(vectors[keep] if keep else None, [metas[i] for i in keep])
+
+    def rebuild(self, index, chunks):
+        """Re-derive from a whole index (after a wholesale load)."""
+        rows = [i for i, m in enumerate(chunks) if self.wants(m)]
+        vectors = np.array([index.reconstruct(i) for i in rows], dtype='float32') if rows else None
+        self._set(vectors, [chunks[i] for i in rows])
+
+    def clear(self):
+        self._state = (None, [], [])
+
+    def search(self, query_vector, k=8):
+        vectors, metas, _ = self._state
+        if vectors is None or not metas:
+            return []
+        q = np.asarray(query_vector, dtype='float32')
+        distances = ((vectors - q) ** 2).sum(axis=1)  # Squared L2, same scale as IndexFlatL2
+        results = []
+        for i in np.argsort(distances)[:k]:
+            result = metas[i].copy()
+            result['distance'] = float(distances[i])
+            results.append(result)
+        return results
+
+    def top_chunks(self):
+        """Leading chunks of every system_info document (copies)."""
+        return [dict(m, distance=0.0) for m in self._state[2]]
+
+
+class SearchDepthStats:
+    """How deep search_until() had to go: final k, rounds, and how often it hit the ceiling."""
+    _lock = threading.Lock()
+    _final_k = Counter()
+    _rounds = Counter()
+    _searches = 0
+    _satisfied = 0
+
+    @classmethod
+    def observe(cls, final_k, rounds, satisfied):
+        with cls._lock:
+            cls._final_k[final_k] += 1
+            cls._rounds[rounds] += 1
+            cls._searches += 1
+            cls._satisfied += int(satisfied)
+
+    @classmethod
+    def report(cls):
+        with cls._lock:
+            n = cls._searches
+            return {
+                'searches': n,
+                'satisfied_ratio': round(cls._satisfied / n, 3) if n else None,
+                'mean_final_k': round(sum(k * c for k, c in cls._final_k.items()) / n, 1) if n else None,
+                'final_k': {str(k): c for k, c in sorted(cls._final_k.items())},
+                'rounds': {str(r): c for r, c in sorted(cls._rounds.items())}
+            }
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._final_k, cls._rounds = Counter(), Counter()
+            cls._searches = cls._satisfied = 0
 
 class VectorStore:
     _instance = None
@@ -13,16 +158,136 @@ class VectorStore:
             cls._instance.index = None
             cls._instance.chunks = [] # Store metadata/text mapping
             cls._instance.dimension = 384 # Default for all-MiniLM-L6-v2
+            cls._instance._write_lock = threading.RLock()  # Serializes index mutations across threads
+            cls._instance.generation = 1
+            cls._instance.generation_built_at = time.time()
+            cls._instance._previous = None  # (index, chunks, dimension, generation, lexical, system, citations) kept for rollback
+            cls._instance.lexical = LexicalIndex()  # BM25 over the same entries as the FAISS index
+            cls._instance.system = SystemInfoIndex()  # system_info entries, also searched on their own
+            cls._instance.citations = {}  # doc_id -> Citation
             # Ensure index is initialized
             cls._instance.initialize_index(cls._instance.dimension)
         return cls._instance
 
+    @classmethod
+    def create_shadow(cls, dimension=None):
+        """
+        A standalone (non-singleton) store for building a new index generation
+        alongside the live one; hand it to swap_in() once it is complete.
+        """
+        store = super(VectorStore, cls).__new__(cls)
+        store._write_lock = threading.RLock()
+        store.generation = 0
+        store.generation_built_at = None
+        store._previous = None
+        store.lexical = LexicalIndex()
+        store.system = SystemInfoIndex()
+        store.citations = {}
+        store.initialize_index(dimension or (cls._instance.dimension if cls._instance else 384))
+        return store
+
+    def swap_in(self, shadow, keep_previous=True, keep_for=None):
+        """
+        Atomically make shadow's index and metadata the live generation. Returns the new generation number.
+        A kept previous generation doubles index memory, so it is freed after keep_for seconds
+        (default INDEX_PREVIOUS_GENERATION_TTL_SECONDS; 0 keeps it until the next swap).
+        """
+        with self._write_lock:
+            previous = (self.index, self.chunks, self.dimension, self.generation, self.lexical, self.system, self.citations)
+            self.index, self.chunks, self.dimension = shadow.index, shadow.chunks, shadow.dimension
+            self.lexical, self.system, self.citations = shadow.lexical, shadow.system, shadow.citations
+            self.generation += 1
+            self.generation_built_at = time.time()
+            self._previous = previous if keep_previous else None
+            generation = self.generation
+        if keep_previous:
+            self._expire_previous(keep_for)
+        return generation
+
+    def _expire_previous(self, keep_for=None):
+        """Free the rollback target after keep_for seconds unless the live generation changed meanwhile."""
+        keep_for = Config.INDEX_PREVIOUS_GENERATION_TTL_SECONDS if keep_for is None else keep_for
+        if keep_for <= 0:
+            return
+        with self._write_lock:
+            generation = self.generation
+
+        def expire():
+            with self._write_lock:
+                if self.generation == generation and self._previous is not None:
+                    logging.info(f"Freeing previous index generation {self._previous[3]} after {keep_for}s")
+                    self._previous = None
+
+        timer = threading.Timer(keep_for, expire)
+        timer.daemon = True
+        timer.start()
+
+    def rollback(self):
+        """Swap the previous generation back in (the current one becomes the rollback target). False if none kept."""
+        with self._write_lock:
+            if self._previous is None:
+                return False
+            current = (self.index, self.chunks, self.dimension, self.generation, self.lexical, self.system, self.citations)
+            (self.index, self.chunks, self.dimension, self.generation,
+             self.lexical, self.system, self.citations) = self._previous
+            self._previous = current
+            self.generation_built_at = time.time()
+        self._expire_previous()
+        return True
+
+    def discard_previous(self):
+        with self._write_lock:
+            self._previous = None
+
+    def generation_info(self):
+        with self._write_lock:
+            prev = self._previous
+            return {
+                'generation': self.generation,
+                'built_at': self.generation_built_at,
+                'vectors': self.index.ntotal if self.index is not None else 0,
+                'previous_generation': prev[3] if prev else None,
+                'previous_vectors': prev[0].ntotal if prev and prev[0] is not None else None
+            }
+
+    def _snapshot(self):
+        """Consistent (index, chunks) pair for readers; never half of one generation and half of another."""
+        with self._write_lock:
+            if self.index is None:
+                self.initialize_index(self.dimension)
+            return self.index, self.chunks
+
+    def lexical_search(self, query, k=10, min_ratio=0.0):
+        """BM25 search over the live generation's chunk text (no embedding call)."""
+        with self._write_lock:
+            lexical = self.lexical
+        return lexical.search(query, k=k, min_ratio=min_ratio)
+
+    def search_system(self, query_vector, k=8):
+        """Nearest system_info entries of the live generation (always resident, no FAISS scan)."""
+        with self._write_lock:
+            system = self.system
+        return system.search(query_vector, k=k)
+
+    def citation(self, doc_id):
+        """Filename / public URL / doc_type for a document in the live generation (None if unknown)."""
+        return self.citations.get(doc_id)
+
+    def system_top_chunks(self):
+        """Precomputed identity context: the leading chunks of each system_info document."""
+        with self._write_lock:
+            system = self.system
+        return system.top_chunks()
+
     def initialize_index(self, dimension=384):
         self.dimension = dimension
         # IndexFlatIP is good for cosine similarity if vectors are normalized
         # IndexFlatL2 is standard Euclidean
-        self.index = faiss.IndexFlatL2(dimension)
+        self.index = lazy_import('faiss').IndexFlatL2(dimension)
         self.chunks = []
+        self.citations = {}
+        self.lexical.clear()
+        self.system.clear()
 
     def add_documents(self, embeddings, chunks_metadata):
         """
@@ -71,9 +336,17 @@ class VectorStore:
             vectors = vectors.reshape(1, -1)
         elif vectors.ndim != 2:
             raise ValueError(f"Invalid vector shape: {vectors.shape}, must be 2D")
+        # FAISS rows map to self.chunks by position; one missing vector would shift every later chunk
+        if vectors.shape[0] != len(chunks_metadata):
+            raise ValueError(f"Got {vectors.shape[0]} embeddings for {len(chunks_metadata)} metadata entries")
         
-        self.index.add(vectors)
-        self.chunks.extend(chunks_metadata)
+        slim, citations = split_citations(chunks_metadata, known=self.citations)
+        with self._write_lock:
+            self.index.add(vectors)
+            self.chunks.extend(slim)
+            self.citations.update(citations)
+            self.lexical.add(slim)
+            self.system.add(vectors, slim)
 
     def add_texts(self, texts, metadata_list=None):
         """
@@ -89,8 +362,10 @@ class VectorStore:
         embeddings = AIService.get_embeddings(texts)
         
         if not embeddings or len(embeddings) == 0:
-            logging.error("Failed to generate embeddings for texts")
-            return
+            raise ValueError("Failed to generate embeddings for texts")
+        if len(embeddings) != len(texts):
+            # get_embeddings returns what it got when a later batch fails; nothing is added so the reconciler retries all of it
+            raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
             
         # Prepare metadata
         if metadata_list is None:
@@ -105,27 +380,47 @@ class VectorStore:
         self.add_documents(embeddings, metadata_list)
 
     def remove_document(self, doc_id):
+        # We assume chunk metadata has 'doc_id' or 'document_id'
+        return self._remove_where(lambda chunk: (chunk.get('doc_id') or chunk.get('document_id')) == doc_id)
+
+    def remove_chunks(self, chunk_ids, include_unkeyed=False):
+        """Remove entries whose chunk_id is in chunk_ids (and, optionally, entries with no chunk_id)."""
+        ids = set(chunk_ids or ())
+        return self._remove_where(
+            lambda chunk: chunk.get('chunk_id') in ids or (include_unkeyed and chunk.get('chunk_id') is None)
+        )
+
+    def indexed_chunk_ids(self):
+        """Return (chunk_id list incl. duplicates, count of entries without a chunk_id)."""
+        with self._write_lock:
+            ids = [c.get('chunk_id') for c in self.chunks]
+        return [i for i in ids if i is not None], sum(1 for i in ids if i is None)
+
+    def _remove_where(self, predicate):
+        """Drop every entry whose metadata matches predicate. Returns the number removed."""
+        with self._write_lock:
+            return self._remove_where_locked(predicate)
+
+    def _remove_where_locked(self, predicate):
         if self.index is None or not self.chunks:
-            return
+            return 0
 
         # Identify indices to keep
         keep_indices = []
         new_chunks = []
         
         for i, chunk in enumerate(self.chunks):
-            # Check if chunk belongs to doc_id
-            # We assume chunk metadata has 'doc_id' or 'document_id'
-            c_doc_id = chunk.get('doc_id') or chunk.get('document_id')
-            if c_doc_id != doc_id:
+            if not predicate(chunk):
                 keep_indices.append(i)
                 new_chunks.append(chunk)
 
         # If nothing to remove, return
-        if len(keep_indices) == len(self.chunks):
-            return
+        removed = len(self.chunks) - len(keep_indices)
+        if removed == 0:
+            return 0
 
         # Create new index
-        new_index = faiss.IndexFlatL2(self.dimension)
+        new_index = lazy_import('faiss').IndexFlatL2(self.dimension)
         
         # Transfer vectors for kept chunks
         # We can't batch add easily without collecting all vectors first
@@ -146,30 +441,66 @@ class VectorStore:
 
         self.index = new_index
         self.chunks = new_chunks
+        live_docs = {c.get('doc_id') for c in new_chunks}
+        self.citations = {d: c for d, c in self.citations.items() if d in live_docs}
+        self.lexical.remove_where(predicate)
+        self.system.remove_where(predicate)
+        return removed
 
+    @traced('vector_search')
     def search(self, query_vector, k=5):
-        # Ensure index is initialized
-        if self.index is None:
-            self.initialize_index(self.dimension)
+        # Ensure index is initialized; take both halves of the same generation
+        index, chunks = self._snapshot()
         
-        if self.index.ntotal == 0:
+        if index.ntotal == 0:
             return []
             
         vector = np.array([query_vector]).astype('float32')
-        distances, indices = self.index.search(vector, k)
+        return self._search_in(index, chunks, vector, k)
+
+    @traced('vector_search')
+    def search_until(self, query_vector, accept, need, k_start=8, k_max=200, growth=4):
+        """
+        Iterative deepening: search k_start neighbours, and grow k geometrically
+        only while fewer than `need` results satisfy accept(result), up to k_max
+        (or the index size). Returns (all results in distance order, accepted ones).
+        All rounds read the same generation.
+        """
+        index, chunks = self._snapshot()
+        if index.ntotal == 0:
+            return [], []
+
+        vector = np.array([query_vector]).astype('float32')
+        k_max = min(k_max, index.ntotal)
+        k = min(max(k_start, 1), k_max)
+        results, accepted, rounds = [], [], 0
+        while True:
+            rounds += 1
+            results = self._search_in(index, chunks, vector, k)
+            accepted = [r for r in results if accept(r)]
+            if len(accepted) >= need or k >= k_max:
+                break
+            k = min(k * growth, k_max)
+        SearchDepthStats.observe(k, rounds, len(accepted) >= need)
+        return results, accepted
+
+    @staticmethod
+    def _search_in(index, chunks, vector, k):
+        distances, indices = index.search(vector, k)
         
         results = []
         for i, idx in enumerate(indices[0]):
-            if idx != -1 and idx < len(self.chunks):
-                result = self.chunks[idx].copy()
+            if idx != -1 and idx < len(chunks):
+                result = chunks[idx].copy()
                 result['distance'] = float(distances[0][i])
                 results.append(result)
                 
         return results
 
     def clear(self):
-        self.chunks = []
-        self.initialize_index(self.dimension)
+        with self._write_lock:
+            self.chunks = []
+            self.initialize_index(self.dimension)
 
     def get_stats(self):
         total_vectors = 0
@@ -196,7 +527,7 @@ class VectorStore:
                 
                 try:
                     # Write index to temporary file
-                    faiss.write_index(self.index, tmp_path)
+                    lazy_import('faiss').write_index(self.index, tmp_path)
                     
                     # Read the file content
                     with open(tmp_path, 'rb') as f:
@@ -209,6 +540,7 @@ class VectorStore:
                 # Save metadata
                 meta_data = {
                     'chunks': self.chunks,
+                    'citations': {d: tuple(c) for d, c in self.citations.items()},
                     'dimension': self.dimension
                 }
                 meta_bytes = pickle.dumps(meta_data)
@@ -253,7 +585,7 @@ class VectorStore:
                 
                 # Load index from temporary file
                 try:
-                    self.index = faiss.read_index(tmp_path)
+                    self.index = lazy_import('faiss').read_index(tmp_path)
                 except Exception as read_error:
                     # Clean up and re-raise
                     if os.path.exists(tmp_path):
@@ -263,8 +595,13 @@ class VectorStore:
                 # Load metadata
                 meta_bytes = supa.download_file(f"indexes/{index_name}.meta")
                 meta_data = pickle.loads(meta_bytes)
-                self.chunks = meta_data.get('chunks', [])
+                citations = {d: Citation(*c) for d, c in meta_data.get('citations', {}).items()}
+                self.chunks, found = split_citations(meta_data.get('chunks', []), known=citations)
+                citations.update(found)
+                self.citations = citations
                 self.dimension = meta_data.get('dimension', 384)
+                self.lexical.rebuild(self.chunks)
+                self.system.rebuild(self.index, self.chunks)
                 
                 # Clean up temporary file
                 if os.path.exists(tmp_path):
@@ -7,8 +7,8 @@ import functools
 from urllib.parse import urlparse, urljoin
 import xml.etree.ElementTree as ET
 from concurrent.futures import ThreadPoolExecutor
-from bs4 import BeautifulSoup
 from collections import deque
+from app.services.startup_profile import lazy_import
 
 # Configuration constants
 GENERAL_MODE_MAX_PAGES = 25
@@ -151,6 +151,7 @@ class WebScraper:
 
     @staticmethod
     def extract_text_from_html(html, base_url):
+        BeautifulSoup = lazy_import('bs4').BeautifulSoup
         soup_all = BeautifulSoup(html, 'html.parser')
         soup = BeautifulSoup(html, 'html.parser')
         for tag in soup(['script', 'style', 'header', 'footer', 'aside', 'iframe', 'nav']):
@@ -7,6 +7,10 @@ from app.models import Document, DocumentChunk, AppSetting
 from app.services.web_scraper import WebScraper
 from app.services.document_processor import DocumentProcessor
 from app.services.vector_store import VectorStore
+from app.services.chunk_writer import bulk_insert_chunks
+from app.services.near_duplicate import suppress_near_duplicates
+from app.services.index_sync import IndexChangeFeed
+from config import Config
 
 class WebSourceRefresher:
     @staticmethod
@@ -71,28 +75,37 @@ class WebSourceRefresher:
                         all_chunk_texts = []
                         all_chunk_metas = []
                         
+                        page_chunks = []
                         for page_url, raw_text in pages:
                             text = DocumentProcessor._sanitize_text(raw_text)
-                            chunks = DocumentProcessor.chunk_text(text)
+                            for chunk_text in DocumentProcessor.chunk_text(text):
+                                page_chunks.append((page_url, chunk_text))
+
+                        # Skip boilerplate repeated across crawled pages
+                        page_chunks, dedup_stats = suppress_near_duplicates(
+                            page_chunks, text_of=lambda pc: pc[1], max_distance=Config.NEAR_DUP_MAX_HAMMING
+                        )
+                        logging.info(f"Near-duplicate suppression for {url}: {dedup_stats}")
+
+                        for page_url, chunk_text in page_chunks:
+                            final_text = f"[Source: {page_url}]\n{chunk_text}"
                             
-                            for chunk_text in chunks:
-                                final_text = f"[Source: {page_url}]\n{chunk_text}"
-                                
-                                chunk_obj = DocumentChunk(
-                                    document_id=doc.id,
-                                    chunk_text=final_text,
-                                    chunk_index=total_chunks
-                                )
-                                db.session.add(chunk_obj)
-                                
-                                all_chunk_texts.append(final_text)
-                                all_chunk_metas.append({
-                                    'text': final_text,
-                                    'doc_id': doc.id,
-                                    'chunk_id': None, # Will be updated after commit if needed
-                                    'url': page_url
-                                })
-                                total_chunks += 1
+                            all_chunk_texts.append(final_text)
+                            all_chunk_metas.append({
+                                'text': final_text,
+                                'doc_id': doc.id,
+                                'url': page_url
+                            })
+                            total_chunks += 1
+
+                        # Set-based insert hands back the new IDs directly
+                        chunk_ids = bulk_insert_chunks(doc.id, all_chunk_texts)
+                        for meta, cid in zip(all_chunk_metas, chunk_ids):
+                            meta['chunk_id'] = cid
+
+                        # Other workers drop the old vectors and index the new chunks
+                        IndexChangeFeed.record('remove_doc', doc.id)
+                        IndexChangeFeed.record('add', doc.id, chunk_ids)
 
                         # Update doc metadata
                         doc.upload_date = datetime.utcnow()
@@ -100,16 +113,10 @@ class WebSourceRefresher:
                         db.session.commit()
 
                         # 7. Update Vector Store index
-                        # Since we committed, we can get the new IDs
-                        new_chunks = DocumentChunk.query.filter_by(document_id=doc.id).order_by(DocumentChunk.chunk_index).all()
-                        for i, c in enumerate(new_chunks):
-                            if i < len(all_chunk_metas):
-                                all_chunk_metas[i]['chunk_id'] = c.id
-                        
                         if all_chunk_texts:
                             vector_store.add_texts(all_chunk_texts, all_chunk_metas)
 
-                        logging.info(f"✅ Successfully auto-refreshed {url} ({total_chunks} chunks)")
+                        logging.info(f"✅ Successfully auto-refreshed {url} ({total_chunks} chunks, {dedup_stats['dropped']} near-duplicates skipped)")
 
                     except Exception as e:
                         db.session.rollback()
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -29,7 +30,8 @@ class Config:
     
     # Uploads (using Supabase storage only, no local storage)
     UPLOAD_FOLDER = '/tmp/uploads'  # Temporary folder that gets cleaned up
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB max per file
+    MAX_CONTENT_LENGTH = int(os.getenv('MAX_UPLOAD_REQUEST_MB', '256')) * 1024 * 1024  # Whole request (batch uploads)
     ALLOWED_EXTENSIONS = {'pdf', 'docx', 'pptx'}
 
     # Admin
@@ -40,8 +42,53 @@ class Config:
     AUTO_REBUILD_INDEX = os.getenv('AUTO_REBUILD_INDEX', 'true').lower() == 'true'
     AUTO_SYNC_STORAGE = os.getenv('AUTO_SYNC_STORAGE', 'true').lower() == 'true'
     SYNC_STORAGE_INTERVAL = int(os.getenv('SYNC_STORAGE_INTERVAL', '120'))
+    RECONCILE_INTERVAL_MINUTES = int(os.getenv('RECONCILE_INTERVAL_MINUTES', '30'))  # 0 disables the periodic index/DB drift check
+    RECONCILE_GRACE_SECONDS = int(os.getenv('RECONCILE_GRACE_SECONDS', '120'))  # Missing chunks are only re-embedded once they have been missing this long
+    INDEX_SYNC_ENABLED = os.getenv('INDEX_SYNC_ENABLED', 'true').lower() == 'true'  # Apply other workers' index changes
+    INDEX_SYNC_POLL_SECONDS = float(os.getenv('INDEX_SYNC_POLL_SECONDS', '5'))  # Poll interval (fallback when LISTEN/NOTIFY is unavailable)
+    INDEX_CHANGELOG_RETENTION_HOURS = int(os.getenv('INDEX_CHANGELOG_RETENTION_HOURS', '72'))
+    REBUILD_EMBED_WORKERS = int(os.getenv('REBUILD_EMBED_WORKERS', '4'))  # Concurrent embedding calls during rebuilds
+    REBUILD_QUEUE_DEPTH = int(os.getenv('REBUILD_QUEUE_DEPTH', '4'))  # Batches buffered between pipeline stages
+    REBUILD_CHECKPOINT_DIR = os.getenv('REBUILD_CHECKPOINT_DIR', os.path.join(tempfile.gettempdir(), 'rebuild_checkpoint'))
+    REBUILD_CHECKPOINT_MAX_AGE_HOURS = float(os.getenv('REBUILD_CHECKPOINT_MAX_AGE_HOURS', '24'))  # Older checkpoints are discarded
+    INDEX_CUTOVER_MIN_RATIO = float(os.getenv('INDEX_CUTOVER_MIN_RATIO', '0.95'))  # Share of DB chunks a rebuild must index to go live
+    INDEX_VALIDATION_SAMPLES = int(os.getenv('INDEX_VALIDATION_SAMPLES', '5'))  # Self-retrieval probes before cutover
+    INDEX_KEEP_PREVIOUS_GENERATION = os.getenv('INDEX_KEEP_PREVIOUS_GENERATION', 'false').lower() == 'true'  # Enables rollback (costs a second index in memory)
+    INDEX_PREVIOUS_GENERATION_TTL_SECONDS = int(os.getenv('INDEX_PREVIOUS_GENERATION_TTL_SECONDS', '900'))  # Kept generation is freed after this; 0 keeps it until the next swap
+    CHAT_WRITE_BEHIND = os.getenv('CHAT_WRITE_BEHIND', 'true').lower() == 'true'  # Persist chat turns off the request thread
+    CHAT_WRITE_QUEUE_MAX = int(os.getenv('CHAT_WRITE_QUEUE_MAX', '10000'))  # Pending writes before producers block, then write inline
+    CHAT_WRITE_BATCH_MAX = int(os.getenv('CHAT_WRITE_BATCH_MAX', '100'))  # Writes per transaction
+    CHAT_WRITE_FLUSH_MS = int(os.getenv('CHAT_WRITE_FLUSH_MS', '200'))  # How long the writer waits to fill a batch
+    PRELOAD_APP = os.getenv('PRELOAD_APP', 'false').lower() == 'true'  # Set by gunicorn.conf.py (build index in master, fork workers)
+    STARTUP_PROFILE = os.getenv('STARTUP_PROFILE', 'true').lower() == 'true'  # Print per-phase/import timings at boot
     
     # Retrieval tuning
     VECTOR_MAX_DISTANCE = float(os.getenv('VECTOR_MAX_DISTANCE', '3.0'))  # Permissive threshold for better recall
+    SEARCH_K_START = int(os.getenv('SEARCH_K_START', '8'))  # First-round neighbours for adaptive-depth search
+    SEARCH_K_MAX = int(os.getenv('SEARCH_K_MAX', '200'))  # Deepest the search widens before giving up
+    SEARCH_K_GROWTH = int(os.getenv('SEARCH_K_GROWTH', '4'))  # k multiplier per round (each round is a full scan of the flat index)
+    HYBRID_SEARCH = os.getenv('HYBRID_SEARCH', 'true').lower() == 'true'  # Fuse BM25 hits with vector hits (and fall back to BM25 alone)
+    LEXICAL_K = int(os.getenv('LEXICAL_K', '10'))  # BM25 hits merged into each query
+    LEXICAL_MIN_RATIO = float(os.getenv('LEXICAL_MIN_RATIO', '0.3'))  # Drop BM25 hits scoring below this share of the best hit
+    QUERY_FANOUT = os.getenv('QUERY_FANOUT', 'true').lower() == 'true'  # Overlap prefs/session lookups with the question embedding
+    QUERY_FANOUT_WORKERS = int(os.getenv('QUERY_FANOUT_WORKERS', '8'))  # Per-process pool shared by all request threads
+    # Admission control for /api/query: by default leave at least one gunicorn thread free for other pages
+    ADMISSION_CONTROL = os.getenv('ADMISSION_CONTROL', 'true').lower() == 'true'
+    ADMISSION_MAX_CONCURRENT = int(os.getenv('ADMISSION_MAX_CONCURRENT', str(max(1, int(os.getenv('GUNICORN_THREADS', '4')) // 2))))
+    ADMISSION_QUEUE_MAX = int(os.getenv('ADMISSION_QUEUE_MAX', str(max(0, int(os.getenv('GUNICORN_THREADS', '4')) - ADMISSION_MAX_CONCURRENT - 1))))
+    ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv('ADMISSION_QUEUE_TIMEOUT_SECONDS', '10'))  # Longest a queued query waits for a slot
+    ADMISSION_PER_USER_MAX = int(os.getenv('ADMISSION_PER_USER_MAX', '2'))  # Running + queued queries per user
+    QUERY_COALESCING = os.getenv('QUERY_COALESCING', 'true').lower() == 'true'  # Share in-flight work between identical questions
+    QUERY_COALESCE_WAIT_SECONDS = float(os.getenv('QUERY_COALESCE_WAIT_SECONDS', '60'))  # Followers give up waiting and compute themselves
+    QUERY_EMBED_TIMEOUT_SECONDS = float(os.getenv('QUERY_EMBED_TIMEOUT_SECONDS', '10'))  # Question embedding budget before lexical fallback
+
+    # PDF image captioning budget (see CaptionPolicy)
+    CAPTION_SPARSE_PAGE_CHARS = int(os.getenv('CAPTION_SPARSE_PAGE_CHARS', '300'))  # Pages with less text get inline captions
+    CAPTION_MIN_IMAGE_SIDE = int(os.getenv('CAPTION_MIN_IMAGE_SIDE', '120'))  # Skip icons/thumbnails (px)
+    CAPTION_MIN_ENTROPY = float(os.getenv('CAPTION_MIN_ENTROPY', '3.0'))  # Skip flat graphics (bits)
+    CAPTION_MAX_PER_DOC = int(os.getenv('CAPTION_MAX_PER_DOC', '20'))
+
+    # Web ingestion: SimHash bit distance at or below which crawled chunks count as near-duplicates
+    NEAR_DUP_MAX_HAMMING = int(os.getenv('NEAR_DUP_MAX_HAMMING', '3'))
 
 # No local upload directory needed - using Supabase storage only
@@ -0,0 +1,45 @@
+"""
+Gunicorn config for preload-and-fork deployments:
+
+    gunicorn -c gunicorn.conf.py run:app
+
+The app (and the full vector index) is built once in the master. Workers are
+forked afterwards and share the index pages copy-on-write instead of each
+re-embedding the corpus. Per-process state (DB pool, background threads) is
+re-created in post_fork.
+"""
+import logging
+import os
+
+# Must be set before the app module is imported so Config picks it up
+os.environ.setdefault('PRELOAD_APP', 'true')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+preload_app = True
+
+
+def _app(server):
+    return server.app.wsgi()
+
+
+def post_fork(server, worker):
+    from app import after_fork
+    after_fork(_app(server))
+    from app.services.startup_profile import memory_breakdown
+    server.log.info(f"Worker {worker.pid} forked: {memory_breakdown()}")
+
+
+def worker_exit(server, worker):
+    try:
+        from app.services.chat_persistence import ChatWriteBehind
+        ChatWriteBehind.shutdown()
+    except Exception as e:
+        logging.warning(f"Could not flush chat writes on exit: {e}")
+    try:
+        from app.services.startup_profile import memory_breakdown
+        server.log.info(f"Worker {worker.pid} exiting: {memory_breakdown()}")
+    except Exception as e:
+        logging.warning(f"Could not read worker memory on exit: {e}")